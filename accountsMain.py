@@ -0,0 +1,17 @@
+import argparse
+from strategies.accountsRunner import AccountsSupervisor
+from configs.config import currency, interval
+from bots.settings import ACCOUNTS_WORKERS, ACCOUNTS_REFRESH_INTERVAL
+from time import sleep
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run the levels strategy for every account of the users table')
+    parser.add_argument('--workers', type=int, default=ACCOUNTS_WORKERS, help='worker processes (cpu count if omitted)')
+    parser.add_argument('--refresh', type=float, default=ACCOUNTS_REFRESH_INTERVAL,
+                        help='seconds between reloads of the users table')
+    parser.add_argument('--delay', type=float, default=30, help='seconds to wait for the market data daemon')
+    args = parser.parse_args()
+
+    sleep(args.delay)
+    AccountsSupervisor(currency, interval, args.workers, args.refresh).run()
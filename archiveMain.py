@@ -0,0 +1,43 @@
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from bots.httpClient import HttpClient
+from bots.indicators import interval_seconds
+from bots.marketArchive import MarketArchive, request_klines
+from bots.settings import ARCHIVE_DIR
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Fill the local market archive')
+    parser.add_argument('--dir', default=ARCHIVE_DIR, help='archive directory')
+    commands = parser.add_subparsers(dest='command', required=True)
+    klines = commands.add_parser('klines', help='request the candles after the last stored one')
+    klines.add_argument('symbol')
+    klines.add_argument('interval')
+    klines.add_argument('--since', type=int, default=None, help='open time (seconds) of the first candle '
+                                                                 'of an empty archive (a day ago if omitted)')
+    klines.add_argument('--base-url', default='https://api.bybit.com')
+    trades = commands.add_parser('trades', help='import csv files of the bybit public trading archive')
+    trades.add_argument('symbol')
+    trades.add_argument('files', nargs='+', help='csv / csv.gz files, oldest first')
+    args = parser.parse_args()
+
+    archive = MarketArchive(args.dir)
+    if args.command == 'klines':
+        series = archive.klines(args.symbol, args.interval)
+        last = series.last_time()
+        since = last if last is not None else args.since if args.since is not None else int(time.time()) - 86400
+        http = HttpClient()
+        written = series.update(lambda start, count: request_klines(http, args.base_url, args.symbol, args.interval,
+                                                                    start, count),
+                                since, interval_seconds(args.interval))
+        print(f"{written} candles written, {len(series)} stored")
+    else:
+        series = archive.trades(args.symbol)
+        for path in args.files:
+            frame = pd.read_csv(path)
+            written = series.append_trades(frame['timestamp'].to_numpy(dtype=np.float64), frame['price'].to_numpy(),
+                                           frame['size'].to_numpy(), np.where(frame['side'].to_numpy() == 'Buy', 1, -1),
+                                           after_last=True)
+            print(f"{path}: {written} trades written, {len(series)} stored")
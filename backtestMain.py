@@ -0,0 +1,34 @@
+import argparse
+import json
+from backtesting.events import MarketEvents
+from backtesting.exchange import SimExchange
+from backtesting.runner import run_levels_strategy, run_flat_strategy
+from bots.settings import BACKTEST_BALANCE, BACKTEST_QUEUE_VOLUME
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Replay trades or klines through the simulated exchange')
+    parser.add_argument('path', help='trades csv (bybit public trading archive), klines csv or market archive '
+                                         'directory')
+    parser.add_argument('--strategy', choices=['levels', 'flat'], default='levels')
+    parser.add_argument('--symbol', default='BTCUSDT')
+    parser.add_argument('--klines', type=float, default=None, help='candle length (seconds) of a klines csv')
+    parser.add_argument('--interval', default=None, help='kline interval of a market archive (trades if omitted)')
+    parser.add_argument('--start', type=float, default=None, help='first time (seconds) of a market archive')
+    parser.add_argument('--end', type=float, default=None, help='last time (seconds, excluded) of a market archive')
+    parser.add_argument('--levels', default='', help='comma separated level prices (levels strategy)')
+    parser.add_argument('--balance', type=float, default=BACKTEST_BALANCE)
+    parser.add_argument('--queue', type=float, default=BACKTEST_QUEUE_VOLUME, help='contracts ahead of a new order')
+    parser.add_argument('--out', default=None, help='directory for fills.csv, equity.csv and summary.json')
+    args = parser.parse_args()
+
+    events = MarketEvents.load(args.path, args.klines, args.symbol, args.interval, args.start, args.end)
+    exchange = SimExchange(events, args.symbol, balance=args.balance, queue_volume=args.queue)
+    if args.strategy == 'levels':
+        levels = [float(price) for price in args.levels.split(',') if price]
+        result = run_levels_strategy(exchange, levels)
+    else:
+        result = run_flat_strategy(exchange, [(2, 100), (4, 300)])
+    if args.out is not None:
+        result.save(args.out)
+    print(json.dumps(result.summary(), indent=2))
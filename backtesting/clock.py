@@ -0,0 +1,206 @@
+import heapq
+import itertools
+import logging
+import threading
+import time as real_time
+
+log_error = logging.getLogger('bots_error')
+
+
+class BacktestFinished(BaseException):
+    # a BaseException, so the `except Exception` retry loops of the strategies do not swallow the end of the data
+    pass
+
+
+class _Sleeper:
+
+    __slots__ = ('event', 'on_update', 'earliest', 'updated', 'finished')
+
+    def __init__(self, on_update: bool, earliest: float):
+        self.event = threading.Event()
+        self.earliest = earliest  # an update cannot wake the actor before its charged time is over
+        self.on_update = on_update
+        self.updated = False
+        self.finished = False
+
+
+class SimClock:
+
+    def __init__(self, exchange):
+        """
+        Simulated time of a backtest: strategy threads (actors) run one at a time and the market is replayed
+        while all of them sleep, so a sleep costs no wall time
+        :param exchange: simulated exchange
+        :type exchange: SimExchange
+        :return: None
+        """
+        self.exchange = exchange
+        self.now = exchange.now
+        self.finished = False
+        self.errors = []
+        self._running = 0
+        self._sleepers = []
+        self._counter = itertools.count()
+        self._threads = []
+        self._actors = set()
+        self._local = threading.local()
+        self._pending_update = False
+        self._lock = threading.Lock()
+        exchange.listeners.append(self._on_exchange_update)
+
+    def _on_exchange_update(self):
+        # called by the exchange under its lock, the sleepers are woken at the next schedule
+        self._pending_update = True
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+    def spawn(self, target, *args, name: str = None):
+        """
+        Function starting an actor, it waits for its turn before running
+        :param target: strategy function
+        :type target: callable
+        :return: thread
+        :rtype: threading.Thread
+        """
+        with self._lock:
+            self._running += 1
+        thread = threading.Thread(target=self._run_actor, args=(target, args), name=name, daemon=True)
+        self._threads.append(thread)
+        thread.start()
+        return thread
+
+    def charge(self, seconds: float):
+        """
+        Function adding time an actor spent (e.g. request latency), it is slept at its next sleep: sleeping
+        right away could park an actor while another one waits for it on a shared snapshot fetch
+        :param seconds: seconds
+        :type seconds: float
+        :return: None
+        """
+        if threading.get_ident() in self._actors:
+            self._local.debt = getattr(self._local, 'debt', 0.0) + seconds
+
+    def _run_actor(self, target, args: tuple):
+        self._actors.add(threading.get_ident())
+        try:
+            self.sleep(0)
+            target(*args)
+        except BacktestFinished:
+            pass
+        except Exception as exc:
+            log_error.error(exc)
+            self.errors.append(exc)
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._schedule()
+
+    def join(self):
+        """
+        Function waiting for the end of every actor
+        :return: None
+        """
+        for thread in self._threads:
+            thread.join()
+
+    def sleep(self, seconds: float, on_update: bool = False):
+        """
+        Function sleeping in simulated time
+        :param seconds: seconds
+        :type seconds: float
+        :param on_update: wake up early on a fill, like wait_for_update on the private stream
+        :type on_update: bool
+        :return: True if woken by an update
+        :rtype: bool
+        """
+        debt = getattr(self._local, 'debt', 0.0)
+        self._local.debt = 0.0
+        with self._lock:
+            if self.finished:
+                raise BacktestFinished()
+            sleeper = _Sleeper(on_update, self.now + debt)
+            heapq.heappush(self._sleepers, (self.now + debt + max(seconds, 0), next(self._counter), sleeper))
+            self._running -= 1
+            self._schedule()
+        sleeper.event.wait()
+        if sleeper.finished:
+            raise BacktestFinished()
+        return sleeper.updated
+
+    def _schedule(self):
+        """
+        Function replaying the market up to the next wake up and releasing one actor (called under the lock)
+        :return: None
+        """
+        if self._running > 0 or not self._sleepers:
+            return
+        if self._pending_update:
+            self._pending_update = False
+            self._wake_updated()
+        wake = self._sleepers[0][0]
+        if wake > self.now:
+            watched = any(sleeper.on_update for _, _, sleeper in self._sleepers)
+            try:
+                filled_at = self.exchange.run_until(wake, stop_on_fill=watched)
+            except Exception as exc:
+                log_error.error(exc)
+                self.errors.append(exc)
+                self._finish()
+                return
+            self._pending_update = False
+            if filled_at is not None:
+                self.now = max(self.now, filled_at)
+                self._wake_updated()
+            else:
+                self.now = wake
+            if self.exchange.finished:
+                self._finish()
+                return
+        _, _, sleeper = heapq.heappop(self._sleepers)
+        self._running += 1
+        sleeper.event.set()
+
+    def _wake_updated(self):
+        sleepers = []
+        for wake, seq, sleeper in self._sleepers:
+            if sleeper.on_update:
+                sleeper.updated = True
+                wake = min(wake, max(self.now, sleeper.earliest))
+            sleepers.append((wake, seq, sleeper))
+        heapq.heapify(sleepers)
+        self._sleepers = sleepers
+
+    def _finish(self):
+        self.finished = True
+        for _, _, sleeper in self._sleepers:
+            sleeper.finished = True
+            sleeper.event.set()
+        self._sleepers = []
+
+
+class SimTime:
+
+    def __init__(self, clock: SimClock):
+        """
+        Stand-in of the time module for the strategy and bot modules during a backtest
+        :param clock: simulated clock
+        :type clock: SimClock
+        :return: None
+        """
+        self.clock = clock
+
+    def sleep(self, seconds: float):
+        self.clock.sleep(seconds)
+
+    def time(self):
+        return self.clock.now
+
+    def monotonic(self):
+        return self.clock.now
+
+    def perf_counter(self):
+        return real_time.perf_counter()
@@ -0,0 +1,130 @@
+import os
+import numpy as np
+import pandas as pd
+from bots.indicators import interval_seconds
+from bots.marketArchive import MarketArchive
+
+
+class MarketEvents:
+
+    def __init__(self, timestamps, prices, sizes, sides=None):
+        """
+        Trade prints replayed by the simulated exchange, sorted by time
+        :param timestamps: times (seconds)
+        :param prices: trade prices
+        :param sizes: trade sizes (contracts)
+        :param sides: taker sides (1 buy, -1 sell), optional
+        :return: None
+        """
+        self.ts = np.ascontiguousarray(timestamps, dtype=np.float64)
+        self.price = np.ascontiguousarray(prices, dtype=np.float64)
+        self.qty = np.ascontiguousarray(sizes, dtype=np.float64)
+        self.side = np.ascontiguousarray(sides if sides is not None else np.zeros(len(self.ts)), dtype=np.int8)
+        order = np.argsort(self.ts, kind='stable')
+        if np.any(order != np.arange(len(order))):
+            self.ts, self.price, self.qty, self.side = (self.ts[order], self.price[order], self.qty[order],
+                                                        self.side[order])
+
+    def __len__(self):
+        return len(self.ts)
+
+    @classmethod
+    def from_trades(cls, trades: pd.DataFrame):
+        """
+        Function creating events from a trade history (columns of the bybit public trading archive:
+        timestamp, side, size, price)
+        :param trades: trades
+        :type trades: pd.DataFrame
+        :return: events
+        :rtype: MarketEvents
+        """
+        sides = np.where(trades['side'].to_numpy() == 'Buy', 1, -1) if 'side' in trades else None
+        return cls(trades['timestamp'].to_numpy(dtype=np.float64), trades['price'].to_numpy(),
+                   trades['size'].to_numpy(), sides)
+
+    @classmethod
+    def from_klines(cls, klines: pd.DataFrame, interval_seconds: float):
+        """
+        Function creating events from klines, every candle is walked open - low - high - close
+        (open - high - low - close for a falling one) with a quarter of its volume per print
+        :param klines: klines (columns open_time, open, high, low, close, volume), a frame or a dict of arrays
+        :param interval_seconds: candle length
+        :type interval_seconds: float
+        :return: events
+        :rtype: MarketEvents
+        """
+        start = np.asarray(klines['open_time'], dtype=np.float64)
+        open_ = np.asarray(klines['open'], dtype=np.float64)
+        high = np.asarray(klines['high'], dtype=np.float64)
+        low = np.asarray(klines['low'], dtype=np.float64)
+        close = np.asarray(klines['close'], dtype=np.float64)
+        volume = np.asarray(klines['volume'], dtype=np.float64) / 4
+        rising = close >= open_
+        second = np.where(rising, low, high)
+        third = np.where(rising, high, low)
+        step = interval_seconds / 4
+        ts = np.stack([start, start + step, start + 2 * step, start + interval_seconds - 1e-3], axis=1).ravel()
+        prices = np.stack([open_, second, third, close], axis=1).ravel()
+        sizes = np.repeat(volume, 4)
+        return cls(ts, prices, sizes)
+
+    @classmethod
+    def read_csv(cls, path: str, interval_seconds: float = None):
+        """
+        Function loading trades (or klines if interval_seconds is given) from a csv / csv.gz file
+        :param path: file path
+        :type path: str
+        :param interval_seconds: candle length of a kline file
+        :type interval_seconds: float
+        :return: events
+        :rtype: MarketEvents
+        """
+        frame = pd.read_csv(path)
+        if interval_seconds is not None:
+            return cls.from_klines(frame, interval_seconds)
+        return cls.from_trades(frame)
+
+    @classmethod
+    def read_archive(cls, directory: str, symbol: str, interval=None, start: float = None, end: float = None):
+        """
+        Function loading a time range of the market archive, the trades are used without a copy
+        :param directory: archive directory
+        :type directory: str
+        :param symbol: symbol instrument
+        :type symbol: str
+        :param interval: kline interval (trades if None)
+        :param start: first time (included)
+        :type start: float
+        :param end: last time (excluded)
+        :type end: float
+        :return: events
+        :rtype: MarketEvents
+        """
+        archive = MarketArchive(directory)
+        if interval is not None:
+            return cls.from_klines(archive.klines(symbol, interval).range(start, end), interval_seconds(interval))
+        trades = archive.trades(symbol).range(start, end)
+        return cls(trades['ts'], trades['price'], trades['size'], trades['side'])
+
+    @classmethod
+    def load(cls, path: str, interval_seconds: float = None, symbol: str = None, interval=None, start: float = None,
+             end: float = None):
+        """
+        Function loading a csv file or, for a directory, the market archive
+        :param path: csv file or archive directory
+        :type path: str
+        :param interval_seconds: candle length of a kline csv
+        :type interval_seconds: float
+        :param symbol: symbol instrument (archive)
+        :type symbol: str
+        :param interval: kline interval (archive, trades if None)
+        :param start: first time (archive)
+        :type start: float
+        :param end: last time (archive)
+        :type end: float
+        :return: events
+        :rtype: MarketEvents
+        """
+        if os.path.isdir(path):
+            return cls.read_archive(path, symbol, interval, start, end)
+        return cls.read_csv(path, interval_seconds)
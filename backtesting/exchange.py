@@ -0,0 +1,483 @@
+import itertools
+import threading
+from collections import Counter
+import numpy as np
+from backtesting.events import MarketEvents
+from bots.indicators import interval_seconds
+from bots.settings import QTY_STEPS, DEFAULT_QTY_STEP, BACKTEST_BALANCE, BACKTEST_LEVERAGE, BACKTEST_MAKER_FEE, BACKTEST_TAKER_FEE, \
+    BACKTEST_QUEUE_VOLUME, BACKTEST_SCAN_CHUNK
+
+OPPOSITE = {'Buy': 'Sell', 'Sell': 'Buy'}
+
+
+def _flag(value):
+    # query string params arrive as "true" / "false"
+    if isinstance(value, str):
+        return value.lower() == 'true'
+    return bool(value)
+
+
+def _error(ret_code: int, ret_msg: str):
+    return {'ret_code': ret_code, 'ret_msg': ret_msg, 'ext_code': '', 'result': None}
+
+
+def _ok(result):
+    return {'ret_code': 0, 'ret_msg': 'OK', 'ext_code': '', 'result': result}
+
+
+class SimOrder:
+
+    __slots__ = ('order_id', 'side', 'order_type', 'price', 'qty', 'filled', 'reduce_only', 'close_on_trigger',
+                 'order_link_id', 'queue_ahead', 'status', 'created', 'updated', 'exec_value', 'exec_fee')
+
+    def __init__(self, order_id: str, side: str, order_type: str, price: float, qty: float, reduce_only: bool,
+                 close_on_trigger: bool, order_link_id: str, queue_ahead: float, created: float):
+        self.order_id = order_id
+        self.side = side
+        self.order_type = order_type
+        self.price = price
+        self.qty = qty
+        self.filled = 0.0
+        self.reduce_only = reduce_only
+        self.close_on_trigger = close_on_trigger
+        self.order_link_id = order_link_id
+        self.queue_ahead = queue_ahead
+        self.status = 'New'
+        self.created = created
+        self.updated = created
+        self.exec_value = 0.0
+        self.exec_fee = 0.0
+
+    @property
+    def remaining(self):
+        return self.qty - self.filled
+
+    def to_dict(self, symbol: str):
+        return {'order_id': self.order_id, 'user_id': 0, 'symbol': symbol, 'side': self.side,
+                'order_type': self.order_type, 'price': self.price, 'qty': self.qty,
+                'time_in_force': 'GoodTillCancel', 'order_status': self.status,
+                'last_exec_price': self.exec_value / self.filled if self.filled else 0, 'cum_exec_qty': self.filled,
+                'cum_exec_value': self.exec_value, 'cum_exec_fee': self.exec_fee, 'reduce_only': self.reduce_only,
+                'close_on_trigger': self.close_on_trigger, 'order_link_id': self.order_link_id,
+                'created_time': self.created, 'updated_time': self.updated, 'take_profit': 0, 'stop_loss': 0}
+
+
+class SimPosition:
+
+    __slots__ = ('side', 'size', 'entry_price', 'stop_loss', 'realised_pnl')
+
+    def __init__(self, side: str):
+        self.side = side
+        self.size = 0.0
+        self.entry_price = 0.0
+        self.stop_loss = 0.0
+        self.realised_pnl = 0.0
+
+    def unrealised(self, price: float):
+        sign = 1 if self.side == 'Buy' else -1
+        return sign * self.size * (price - self.entry_price)
+
+
+class SimExchange:
+
+    def __init__(self, events: MarketEvents, symbol: str = 'BTCUSDT', balance: float = BACKTEST_BALANCE,
+                 leverage: float = BACKTEST_LEVERAGE, maker_fee: float = BACKTEST_MAKER_FEE,
+                 taker_fee: float = BACKTEST_TAKER_FEE, queue_volume: float = BACKTEST_QUEUE_VOLUME):
+        """
+        Matching engine of one linear symbol (hedge mode) answering requests in the bybit REST format
+        :param events: trade prints to replay
+        :type events: MarketEvents
+        :param symbol: symbol instrument
+        :type symbol: str
+        :param balance: starting wallet balance (USDT)
+        :type balance: float
+        :param leverage: leverage of both positions
+        :type leverage: float
+        :param maker_fee: fee of resting fills (negative for a rebate)
+        :type maker_fee: float
+        :param taker_fee: fee of market / crossing fills and stop losses
+        :type taker_fee: float
+        :param queue_volume: contracts resting ahead of a new limit order at its price
+        :type queue_volume: float
+        :return: None
+        """
+        self.events = events
+        self.symbol = symbol
+        self.initial_balance = float(balance)
+        self.wallet_balance = float(balance)
+        self.leverage = leverage
+        self.maker_fee = maker_fee
+        self.taker_fee = taker_fee
+        self.queue_volume = queue_volume
+        self.qty_step = QTY_STEPS.get(symbol, DEFAULT_QTY_STEP)
+        self.cursor = 0
+        self.now = float(events.ts[0]) if len(events) else 0.0
+        self.last_price = float(events.price[0]) if len(events) else 0.0
+        self.finished = len(events) == 0
+        self.positions = {'Buy': SimPosition('Buy'), 'Sell': SimPosition('Sell')}
+        self.orders = {}
+        self.fills = []
+        self.executions = []
+        self.states = [(-np.inf, self.wallet_balance, 0.0, 0.0, 0.0, 0.0)]
+        self.requests = Counter()
+        self.listeners = []
+        self._ids = itertools.count(1)
+        self._lock = threading.RLock()
+        self._routes = {
+            ('GET', '/v2/public/time'): self._server_time,
+            ('GET', '/v2/public/tickers'): self._tickers,
+            ('GET', '/public/linear/kline'): self._klines,
+            ('GET', '/v2/private/wallet/balance'): self._wallet_balance,
+            ('POST', '/private/linear/order/create'): self._create_order,
+            ('POST', '/private/linear/order/cancel'): self._cancel_order,
+            ('POST', '/private/linear/order/cancel-all'): self._cancel_all_orders,
+            ('GET', '/private/linear/order/search'): self._search_orders,
+            ('GET', '/private/linear/position/list'): self._position_list,
+            ('POST', '/private/linear/position/trading-stop'): self._trading_stop,
+            ('GET', '/private/linear/trade/execution/list'): self._execution_list
+        }
+
+    # requests
+
+    def handle(self, method: str, path: str, params: dict):
+        """
+        Function answering a REST request
+        :param method: GET or POST
+        :type method: str
+        :param path: endpoint path
+        :type path: str
+        :param params: request params
+        :type params: dict
+        :return: dict with data
+        :rtype: dict
+        """
+        route = self._routes.get((method, path))
+        if route is None:
+            return _error(10001, f'{method} {path} is not simulated')
+        with self._lock:
+            self.requests[path] += 1
+            try:
+                return route(params)
+            except (KeyError, ValueError, TypeError) as exc:
+                return _error(10001, f'params error: {exc!r}')
+
+    def _round_qty(self, qty: float):
+        # like the exchange, sizes are whole multiples of the qty step
+        return round(int(qty / self.qty_step + 1e-9) * self.qty_step, 10)
+
+    def _server_time(self, params: dict):
+        return dict(_ok({}), time_now=f'{self.now:.6f}')
+
+    def _tickers(self, params: dict):
+        return _ok([{'symbol': self.symbol, 'last_price': str(self.last_price)}])
+
+    def _klines(self, params: dict):
+        """
+        Function building candles of the replayed prints (vectorized)
+        :return: dict with data
+        """
+        interval = params['interval']
+        seconds = interval_seconds(interval)
+        limit = min(int(params.get('limit', 200)), 200)
+        since = int(params['from']) // seconds * seconds
+        events = self.events
+        first = int(np.searchsorted(events.ts, since, side='left'))
+        if first >= self.cursor:
+            return _ok([])
+        starts = (events.ts[first:self.cursor] // seconds * seconds).astype(np.int64)
+        prices = events.price[first:self.cursor]
+        sizes = events.qty[first:self.cursor]
+        bounds = np.flatnonzero(np.diff(starts)) + 1
+        heads = np.concatenate([[0], bounds])[:limit]
+        tails = np.concatenate([bounds, [len(starts)]])[:limit]
+        prices, sizes = prices[:tails[-1]], sizes[:tails[-1]]
+        highs = np.maximum.reduceat(prices, heads)
+        lows = np.minimum.reduceat(prices, heads)
+        volumes = np.add.reduceat(sizes, heads)
+        turnovers = np.add.reduceat(sizes * prices, heads)
+        result = []
+        for index, (head, tail) in enumerate(zip(heads, tails)):
+            result.append({'id': index, 'symbol': self.symbol, 'period': str(interval), 'interval': str(interval),
+                           'start_at': int(starts[head]), 'open_time': int(starts[head]),
+                           'open': float(prices[head]), 'high': float(highs[index]), 'low': float(lows[index]),
+                           'close': float(prices[tail - 1]), 'volume': float(volumes[index]),
+                           'turnover': float(turnovers[index])})
+        return _ok(result)
+
+    def available_balance(self):
+        """
+        Function getting the balance free of position and order margin
+        :return: balance (USDT)
+        :rtype: float
+        """
+        margin = sum(position.size * position.entry_price for position in self.positions.values())
+        margin += sum(order.remaining * order.price for order in self.orders.values() if not order.reduce_only)
+        return self.wallet_balance - margin / self.leverage
+
+    def _wallet_balance(self, params: dict):
+        unrealised = sum(position.unrealised(self.last_price) for position in self.positions.values())
+        realised = sum(position.realised_pnl for position in self.positions.values())
+        return _ok({'USDT': {'equity': self.wallet_balance + unrealised, 'available_balance': self.available_balance(),
+                             'wallet_balance': self.wallet_balance, 'realised_pnl': realised,
+                             'unrealised_pnl': unrealised, 'cum_realised_pnl': realised}})
+
+    def _create_order(self, params: dict):
+        side = params['side']
+        order_type = params['order_type']
+        qty = self._round_qty(float(params['qty']))
+        reduce_only = _flag(params.get('reduce_only', False))
+        if side not in OPPOSITE or order_type not in ('Limit', 'Market'):
+            return _error(10001, 'params error: side or order_type')
+        if qty <= 0:
+            return _error(10001, 'params error: qty must be greater than zero')
+        price = float(params['price']) if order_type == 'Limit' else self.last_price
+        position = self.positions[OPPOSITE[side] if reduce_only else side]
+        if reduce_only and position.size == 0:
+            return _error(130125, 'current position is zero, cannot fix reduce-only order qty')
+        if not reduce_only and qty * price / self.leverage > self.available_balance():
+            return _error(130021, 'order cost not available')
+        order = SimOrder(f'sim-{next(self._ids):08d}', side, order_type, price, qty, reduce_only,
+                         _flag(params.get('close_on_trigger', False)), params.get('order_link_id', ''),
+                         self.queue_volume, self.now)
+        self.orders[order.order_id] = order
+        crossing = order_type == 'Market' or (side == 'Buy' and price >= self.last_price) or \
+            (side == 'Sell' and price <= self.last_price)
+        if crossing:
+            self._fill(order, order.remaining, self.last_price, False)
+        result = order.to_dict(self.symbol)
+        self._notify()
+        return _ok(result)
+
+    def _cancel(self, order: SimOrder):
+        order.status = 'Cancelled'
+        order.updated = self.now
+        del self.orders[order.order_id]
+
+    def _cancel_order(self, params: dict):
+        order = self.orders.get(params.get('order_id'))
+        if order is None:
+            return _error(130010, 'order not exists or too late to cancel')
+        self._cancel(order)
+        self._notify()
+        return _ok({'order_id': order.order_id})
+
+    def _cancel_all_orders(self, params: dict):
+        cancelled = list(self.orders)
+        for order_id in cancelled:
+            self._cancel(self.orders[order_id])
+        self._notify()
+        return _ok(cancelled)
+
+    def _search_orders(self, params: dict):
+        if params.get('order_id'):
+            order = self.orders.get(params['order_id'])
+            return _ok(order.to_dict(self.symbol) if order is not None else None)
+        return _ok([order.to_dict(self.symbol) for order in self.orders.values()])
+
+    def _position_list(self, params: dict):
+        result = []
+        for position in self.positions.values():
+            result.append({'user_id': 0, 'symbol': self.symbol, 'side': position.side, 'size': position.size,
+                           'position_value': position.size * position.entry_price,
+                           'entry_price': position.entry_price, 'leverage': self.leverage,
+                           'position_margin': position.size * position.entry_price / self.leverage,
+                           'stop_loss': position.stop_loss, 'take_profit': 0,
+                           'unrealised_pnl': position.unrealised(self.last_price),
+                           'realised_pnl': position.realised_pnl, 'mode': 'BothSide'})
+        return _ok(result)
+
+    def _trading_stop(self, params: dict):
+        position = self.positions[params['side']]
+        if position.size == 0:
+            return _error(130024, 'cannot set tp/sl/ts for zero position')
+        position.stop_loss = float(params.get('stop_loss', position.stop_loss) or 0)
+        return _ok(None)
+
+    def _execution_list(self, params: dict):
+        limit = int(params.get('limit', 50))
+        return _ok({'current_page': 1, 'data': self.executions[::-1][:limit]})
+
+    # matching
+
+    def _notify(self):
+        for listener in self.listeners:
+            listener()
+
+    def _record_state(self):
+        buy, sell = self.positions['Buy'], self.positions['Sell']
+        self.states.append((self.now, self.wallet_balance, buy.size, buy.entry_price, sell.size, sell.entry_price))
+
+    def _fill(self, order: SimOrder, qty: float, price: float, maker: bool):
+        """
+        Function executing (a part of) an order
+        :param order: order
+        :type order: SimOrder
+        :param qty: contracts
+        :type qty: float
+        :param price: execution price
+        :type price: float
+        :param maker: True for a resting fill
+        :type maker: bool
+        :return: None
+        """
+        position = self.positions[OPPOSITE[order.side] if order.reduce_only else order.side]
+        closed = 0.0
+        pnl = 0.0
+        if order.reduce_only:
+            qty = min(qty, position.size)
+            closed = qty
+            pnl = (price - position.entry_price) * qty * (1 if position.side == 'Buy' else -1)
+            position.size -= qty
+        else:
+            position.entry_price = (position.size * position.entry_price + qty * price) / (position.size + qty)
+            position.size += qty
+        fee = qty * price * (self.maker_fee if maker else self.taker_fee)
+        position.realised_pnl += pnl - fee
+        self.wallet_balance += pnl - fee
+        order.filled += qty
+        order.exec_value += qty * price
+        order.exec_fee += fee
+        order.updated = self.now
+        if order.remaining < self.qty_step / 2 or order.reduce_only and position.size == 0:
+            order.status = 'Filled'
+            self.orders.pop(order.order_id, None)
+        else:
+            order.status = 'PartiallyFilled'
+        self.fills.append((self.now, order.order_id, order.side, price, qty, fee, 'Maker' if maker else 'Taker',
+                           order.reduce_only, pnl))
+        self.executions.append({'order_id': order.order_id, 'order_link_id': order.order_link_id,
+                                'symbol': self.symbol, 'side': order.side, 'exec_id': f'{order.order_id}-{len(self.fills)}',
+                                'exec_price': price, 'exec_qty': qty, 'exec_fee': fee, 'exec_type': 'Trade',
+                                'closed_size': closed, 'order_price': order.price, 'order_qty': order.qty,
+                                'order_type': order.order_type, 'fee_rate': self.maker_fee if maker else self.taker_fee,
+                                'trade_time_ms': int(self.now * 1000)})
+        if position.size <= 1e-12:
+            position.size = 0.0
+            position.entry_price = 0.0
+            position.stop_loss = 0.0
+            for other in list(self.orders.values()):
+                if other.reduce_only and OPPOSITE[other.side] == position.side:
+                    self._cancel(other)
+        self._record_state()
+
+    def _next_trigger(self, start: int, end: int):
+        """
+        Function finding (vectorized) the first event that fills an order or triggers a stop
+        :param start: first event
+        :type start: int
+        :param end: event after the last one
+        :type end: int
+        :return: event index or None
+        """
+        prices = self.events.price[start:end]
+        sizes = self.events.qty[start:end]
+        first = len(prices)
+        for order in self.orders.values():
+            if first == 0:
+                break
+            window = prices[:first]
+            hits = window < order.price if order.side == 'Buy' else window > order.price
+            at_price = window == order.price
+            if order.queue_ahead > 0:
+                queue = np.cumsum(np.where(at_price, sizes[:first], 0.0))
+                hits |= at_price & (queue > order.queue_ahead)
+            else:
+                hits |= at_price
+            index = int(hits.argmax())
+            if hits[index]:
+                first = index
+        for position in self.positions.values():
+            if first > 0 and position.size > 0 and position.stop_loss > 0:
+                window = prices[:first]
+                hits = window <= position.stop_loss if position.side == 'Buy' else window >= position.stop_loss
+                index = int(hits.argmax())
+                if hits[index]:
+                    first = index
+        return start + first if first < len(prices) else None
+
+    def _consume_queues(self, start: int, end: int):
+        if end <= start:
+            return
+        prices = self.events.price[start:end]
+        for order in self.orders.values():
+            if order.queue_ahead > 0:
+                traded = self.events.qty[start:end][prices == order.price].sum()
+                order.queue_ahead = max(order.queue_ahead - traded, 0.0)
+
+    def _match(self, index: int):
+        """
+        Function executing the orders and stops triggered by one event
+        :param index: event index
+        :type index: int
+        :return: True if anything was filled
+        :rtype: bool
+        """
+        price = float(self.events.price[index])
+        size = float(self.events.qty[index])
+        filled = False
+        for order in list(self.orders.values()):
+            through = price < order.price if order.side == 'Buy' else price > order.price
+            if through:
+                self._fill(order, order.remaining, order.price, True)
+                filled = True
+            elif price == order.price:
+                available = self._round_qty(min(order.remaining, size - order.queue_ahead))
+                order.queue_ahead = max(order.queue_ahead - size, 0.0)
+                if available > 0:
+                    self._fill(order, available, order.price, True)
+                    filled = True
+        for position in self.positions.values():
+            if position.size > 0 and position.stop_loss > 0:
+                triggered = price <= position.stop_loss if position.side == 'Buy' else price >= position.stop_loss
+                if triggered:
+                    stop = SimOrder(f'sim-{next(self._ids):08d}', OPPOSITE[position.side], 'Market', price,
+                                    position.size, True, True, 'stop_loss', 0.0, self.now)
+                    self._fill(stop, position.size, price, False)
+                    filled = True
+        return filled
+
+    def run_until(self, until: float, stop_on_fill: bool = False):
+        """
+        Function replaying the market up to a time
+        :param until: time (seconds)
+        :type until: float
+        :param stop_on_fill: return at the first fill (the bot would be woken by the stream there)
+        :type stop_on_fill: bool
+        :return: time of the fill that stopped the replay or None
+        """
+        with self._lock:
+            events = self.events
+            end = int(np.searchsorted(events.ts, until, side='right'))
+            while self.cursor < end:
+                chunk_end = min(end, self.cursor + BACKTEST_SCAN_CHUNK)
+                index = self._next_trigger(self.cursor, chunk_end) if self.orders or self._has_stops() else None
+                if index is None:
+                    self._consume_queues(self.cursor, chunk_end)
+                    self.cursor = chunk_end
+                    self.last_price = float(events.price[chunk_end - 1])
+                    continue
+                self._consume_queues(self.cursor, index)
+                self.now = float(events.ts[index])
+                self.last_price = float(events.price[index])
+                filled = self._match(index)
+                self.cursor = index + 1
+                if filled:
+                    self._notify()
+                    if stop_on_fill:
+                        return self.now
+            self.now = max(self.now, until)
+            if self.cursor >= len(events):
+                self.finished = True
+            return None
+
+    def _has_stops(self):
+        return any(position.size > 0 and position.stop_loss > 0 for position in self.positions.values())
+
+    def state_arrays(self):
+        """
+        Function getting the account state after every fill
+        :return: times, wallet balances, buy sizes, buy entries, sell sizes, sell entries
+        :rtype: tuple
+        """
+        with self._lock:
+            return tuple(np.array(column, dtype=np.float64) for column in zip(*self.states))
@@ -0,0 +1,249 @@
+import hashlib
+import hmac
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from json import loads, dumps
+from urllib.parse import urlsplit, parse_qsl
+from backtesting.events import MarketEvents
+from backtesting.exchange import SimExchange
+from bots.rateLimiter import endpoint_group
+from bots.settings import RATE_LIMITS, FAKE_EXCHANGE_PRICE, FAKE_EXCHANGE_RECV_WINDOW, FAKE_EXCHANGE_ERROR_CODES
+
+log_error = logging.getLogger('bots_error')
+
+PUBLIC_PATHS = ['/v2/public/time', '/v2/public/tickers', '/public/linear/kline']
+
+
+def sign_params(params: dict, secret_key: str):
+    """
+    Function signing params the way the bot does (sorted key=value pairs, booleans as true / false)
+    :param params: request params without sign
+    :type params: dict
+    :param secret_key: api secret
+    :type secret_key: str
+    :return: signature
+    :rtype: str
+    """
+    param_str = '&'.join(f"{key}={str(params[key]).lower() if isinstance(params[key], bool) else params[key]}"
+                         for key in sorted(params))
+    return hmac.new(bytes(secret_key, "utf-8"), param_str.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+class FakeBybitServer:
+
+    def __init__(self, exchange: SimExchange = None, api_keys: dict = None, host: str = '127.0.0.1',
+                 port: int = 0, latency=0.0, error_rate: float = 0.0, http_error_rate: float = 0.0,
+                 speed: float = 1.0, rate_limits: bool = False, seed: int = None, limits: dict = None):
+        """
+        Local stand-in of the bybit linear REST api backed by the simulated exchange
+        :param exchange: simulated exchange (a flat market at FAKE_EXCHANGE_PRICE if None)
+        :type exchange: SimExchange
+        :param api_keys: dict api key - secret accepted by the private endpoints ({'test': 'test'} if None)
+        :type api_keys: dict
+        :param host: host
+        :type host: str
+        :param port: port (a free one if 0)
+        :type port: int
+        :param latency: seconds added to every response, or (min, max) for a uniform draw
+        :param error_rate: share of requests answered with one of FAKE_EXCHANGE_ERROR_CODES
+        :type error_rate: float
+        :param http_error_rate: share of requests answered with HTTP 503
+        :type http_error_rate: float
+        :param speed: replayed seconds of history per wall second
+        :type speed: float
+        :param rate_limits: reject requests over RATE_LIMITS per minute and endpoint group with 10006
+        :type rate_limits: bool
+        :param seed: seed of the latency / error draws
+        :type seed: int
+        :param limits: requests per minute of every endpoint group reported in the headers (RATE_LIMITS if None)
+        :type limits: dict
+        :return: None
+        """
+        if exchange is None:
+            exchange = SimExchange(MarketEvents([time.time()], [FAKE_EXCHANGE_PRICE], [0.0]))
+        self.exchange = exchange
+        self.api_keys = api_keys if api_keys is not None else {'test': 'test'}
+        self.latency = latency
+        self.error_rate = error_rate
+        self.http_error_rate = http_error_rate
+        self.speed = speed
+        self.rate_limits = rate_limits
+        self.limits = limits if limits is not None else RATE_LIMITS
+        self.requests = Counter()
+        self.errors = Counter()
+        self._random = random.Random(seed)
+        self._windows = {}
+        self._lock = threading.Lock()
+        self._sim_start = exchange.now
+        self._wall_start = time.monotonic()
+        self._thread = None
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        """
+        Function serving in a background thread
+        :return: base url for the bots
+        :rtype: str
+        """
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='fake-bybit', daemon=True)
+        self._thread.start()
+        return self.url
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def stop(self):
+        """
+        Function stopping the server
+        :return: None
+        """
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive, like the real api
+            disable_nagle_algorithm = True  # headers and body are separate writes, no delayed ack stall
+
+            def do_GET(self):
+                split = urlsplit(self.path)
+                self._reply(*server.handle('GET', split.path, dict(parse_qsl(split.query))))
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                raw = self.rfile.read(length) if length else b''
+                try:
+                    params = loads(raw) if raw else {}
+                except ValueError:
+                    params = None
+                if not isinstance(params, dict):
+                    self._reply(200, {'ret_code': 10001, 'ret_msg': 'params error: body is not json'}, {})
+                    return
+                self._reply(*server.handle('POST', urlsplit(self.path).path, params))
+
+            def _reply(self, status: int, body, headers: dict):
+                data = body.encode() if isinstance(body, str) else dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, str(value))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                return None
+
+        return Handler
+
+    def _advance(self):
+        # the market replays at `speed` while the server runs
+        if self.speed:
+            target = self._sim_start + (time.monotonic() - self._wall_start) * self.speed
+            self.exchange.run_until(target)
+
+    def _check_auth(self, params: dict):
+        """
+        Function validating api key, timestamp and signature of a private request
+        :param params: request params
+        :type params: dict
+        :return: error dict or None
+        """
+        secret = self.api_keys.get(params.get('api_key'))
+        if secret is None:
+            return {'ret_code': 10003, 'ret_msg': 'Invalid api_key.', 'result': None}
+        try:
+            timestamp = int(params['timestamp'])
+        except (KeyError, ValueError):
+            return {'ret_code': 10001, 'ret_msg': 'params error: timestamp', 'result': None}
+        recv_window = int(params.get('recv_window', FAKE_EXCHANGE_RECV_WINDOW))
+        server_time = int(self.exchange.now * 1000)
+        if timestamp > server_time + 1000 or server_time - timestamp > recv_window:
+            return {'ret_code': 10002, 'ret_msg': f'invalid request, please check your timestamp and recv_window '
+                                                  f'param. req_timestamp: {timestamp} server_timestamp: {server_time}',
+                    'result': None}
+        signature = params.get('sign', '')
+        expected = sign_params({key: value for key, value in params.items() if key != 'sign'}, secret)
+        if not hmac.compare_digest(signature, expected):
+            return {'ret_code': 10004, 'ret_msg': 'error sign! origin_string[...]', 'result': None}
+        return None
+
+    def _rate_limit(self, api_key: str, group: str):
+        """
+        Function counting a request in its fixed one minute window
+        :return: (limit, remaining, reset time ms)
+        :rtype: tuple
+        """
+        limit = self.limits.get(group, self.limits['other'])
+        window = int(self.exchange.now // 60)
+        key = (api_key, group)
+        start, used = self._windows.get(key, (window, 0))
+        if start != window:
+            start, used = window, 0
+        used += 1
+        self._windows[key] = (start, used)
+        return limit, limit - used, (start + 1) * 60 * 1000
+
+    def handle(self, method: str, path: str, params: dict):
+        """
+        Function answering a request
+        :param method: GET or POST
+        :type method: str
+        :param path: endpoint path
+        :type path: str
+        :param params: request params
+        :type params: dict
+        :return: (http status, body, headers)
+        :rtype: tuple
+        """
+        latency = self._random.uniform(*self.latency) if isinstance(self.latency, (tuple, list)) else self.latency
+        if latency:
+            time.sleep(latency)
+        with self._lock:
+            self.requests[path] += 1
+            self._advance()
+            if self.http_error_rate and self._random.random() < self.http_error_rate:
+                self.errors['http'] += 1
+                return 503, '<html>503 Service Temporarily Unavailable</html>', {}
+            headers = {}
+            if path not in PUBLIC_PATHS:
+                error = self._check_auth(params)
+                if error is not None:
+                    self.errors[error['ret_code']] += 1
+                    return 200, error, {}
+                limit, remaining, reset_ms = self._rate_limit(params['api_key'], endpoint_group(path))
+                headers = {'X-Bapi-Limit': limit, 'X-Bapi-Limit-Status': max(remaining, 0),
+                           'X-Bapi-Limit-Reset-Timestamp': reset_ms}
+                if self.rate_limits and remaining < 0:
+                    self.errors[10006] += 1
+                    return 200, {'ret_code': 10006, 'ret_msg': 'Too many visits!', 'result': None,
+                                 'rate_limit_status': 0, 'rate_limit_reset_ms': reset_ms}, headers
+            if self.error_rate and self._random.random() < self.error_rate:
+                code = self._random.choice(FAKE_EXCHANGE_ERROR_CODES)
+                self.errors[code] += 1
+                return 200, {'ret_code': code, 'ret_msg': 'injected error', 'result': None}, headers
+            params = {key: value for key, value in params.items() if key not in ('api_key', 'sign', 'timestamp')}
+            response = self.exchange.handle(method, path, params)
+            if 'X-Bapi-Limit' in headers:
+                response.update(rate_limit=headers['X-Bapi-Limit'], rate_limit_status=headers['X-Bapi-Limit-Status'],
+                                rate_limit_reset_ms=headers['X-Bapi-Limit-Reset-Timestamp'])
+            return 200, response, headers
@@ -0,0 +1,323 @@
+import base64
+import hashlib
+import hmac
+import itertools
+import logging
+import socket
+import socketserver
+import struct
+import threading
+import time
+from collections import Counter
+from json import loads, dumps
+
+log_error = logging.getLogger('bots_error')
+
+_WS_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+_OP_TEXT, _OP_CLOSE, _OP_PING, _OP_PONG = 0x1, 0x8, 0x9, 0xA
+
+
+def _read_exact(sock, size: int):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("connection closed")
+        data += chunk
+    return data
+
+
+def _read_frame(sock):
+    """
+    Function reading one client frame (clients always mask, messages of the bots are never fragmented)
+    :param sock: socket
+    :return: (opcode, payload)
+    :rtype: tuple
+    """
+    first, second = _read_exact(sock, 2)
+    length = second & 0x7F
+    if length == 126:
+        length = struct.unpack('>H', _read_exact(sock, 2))[0]
+    elif length == 127:
+        length = struct.unpack('>Q', _read_exact(sock, 8))[0]
+    mask = _read_exact(sock, 4) if second & 0x80 else None
+    payload = _read_exact(sock, length)
+    if mask is not None:
+        payload = bytes(byte ^ mask[index % 4] for index, byte in enumerate(payload))
+    return first & 0x0F, payload
+
+
+def _frame(opcode: int, payload: bytes):
+    header = bytes([0x80 | opcode])
+    if len(payload) < 126:
+        header += bytes([len(payload)])
+    elif len(payload) < 1 << 16:
+        header += bytes([126]) + struct.pack('>H', len(payload))
+    else:
+        header += bytes([127]) + struct.pack('>Q', len(payload))
+    return header + payload
+
+
+class _Client:
+
+    def __init__(self, conn_id: str, sock):
+        self.conn_id = conn_id
+        self.sock = sock
+        self.authenticated = False
+        self.topics = set()
+        self._lock = threading.Lock()
+
+    def send(self, opcode: int, payload: bytes):
+        with self._lock:
+            self.sock.sendall(_frame(opcode, payload))
+
+    def send_json(self, message: dict):
+        self.send(_OP_TEXT, dumps(message).encode('utf-8'))
+
+
+class FakeBybitStream:
+
+    def __init__(self, api_keys: dict = None, host: str = '127.0.0.1', port: int = 0, private: bool = True):
+        """
+        Local stand-in of the bybit realtime websocket (auth, subscribe and ping operations), updates are
+        pushed by the caller with publish. Connections can be dropped or muted to test recovery
+        :param api_keys: dict api key - secret accepted by auth ({'test': 'test'} if None)
+        :type api_keys: dict
+        :param host: host
+        :type host: str
+        :param port: port (a free one if 0)
+        :type port: int
+        :param private: subscriptions need an authenticated connection (realtime_private)
+        :type private: bool
+        :return: None
+        """
+        self.api_keys = api_keys if api_keys is not None else {'test': 'test'}
+        self.private = private
+        self.muted = False  # pings are not answered and nothing is sent, like a silently dead connection
+        self.ops = Counter()
+        self.connections = 0
+        self.clients = {}
+        self._ids = itertools.count(1)
+        self._condition = threading.Condition()
+        self._thread = None
+        self.server = socketserver.ThreadingTCPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'ws://{host}:{port}/realtime_private' if self.private else f'ws://{host}:{port}/realtime_public'
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        """
+        Function serving in a background thread
+        :return: websocket url for the bots
+        :rtype: str
+        """
+        self._thread = threading.Thread(target=self.server.serve_forever, name='fake-bybit-stream', daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        """
+        Function stopping the server and closing every connection
+        :return: None
+        """
+        self.server.shutdown()
+        self.server.server_close()
+        self.drop()
+
+    def subscribers(self, topic: str = None):
+        """
+        Function counting the connections ready to receive updates
+        :param topic: topic (every subscribed connection if None)
+        :type topic: str
+        :return: number of connections
+        :rtype: int
+        """
+        with self._condition:
+            return sum(1 for client in self.clients.values()
+                       if (topic in client.topics if topic is not None else len(client.topics) > 0))
+
+    def wait_for_subscribers(self, count: int = 1, topic: str = None, timeout: float = 5):
+        """
+        Function waiting until count connections subscribed
+        :return: True if they did before timeout
+        :rtype: bool
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while self.subscribers(topic) < count:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            return True
+
+    def publish(self, topic: str, data: list, message_type: str = 'snapshot'):
+        """
+        Function sending an update to the connections subscribed to its topic
+        :param topic: topic
+        :type topic: str
+        :param data: update records
+        :type data: list
+        :param message_type: snapshot or delta
+        :type message_type: str
+        :return: number of connections the update was sent to
+        :rtype: int
+        """
+        if self.muted:
+            return 0
+        with self._condition:
+            clients = [client for client in self.clients.values() if topic in client.topics]
+        message = {'topic': topic, 'action': 'update', 'type': message_type, 'data': data}
+        sent = 0
+        for client in clients:
+            try:
+                client.send_json(message)
+                sent += 1
+            except OSError:
+                pass
+        return sent
+
+    def drop(self):
+        """
+        Function closing every connection without a close frame, like a network failure
+        :return: number of connections dropped
+        :rtype: int
+        """
+        with self._condition:
+            clients = list(self.clients.values())
+            self.clients.clear()
+            self._condition.notify_all()
+        for client in clients:
+            try:
+                client.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        return len(clients)
+
+    def _check_auth(self, args: list):
+        """
+        Function validating the auth args [api_key, expires (ms), signature of GET/realtime{expires}]
+        :param args: auth args
+        :type args: list
+        :return: error message or None
+        """
+        try:
+            api_key, expires, signature = args
+        except (TypeError, ValueError):
+            return 'auth args error'
+        secret = self.api_keys.get(api_key)
+        if secret is None:
+            return 'error:api_key not found'
+        if int(expires) < time.time() * 1000:
+            return 'error:auth expired'
+        expected = hmac.new(bytes(secret, 'utf-8'), f'GET/realtime{expires}'.encode('utf-8'),
+                            hashlib.sha256).hexdigest()
+        if not hmac.compare_digest(str(signature), expected):
+            return 'error:signature verification failed'
+        return None
+
+    def _operation(self, client: _Client, request: dict):
+        """
+        Function answering an operation of a client
+        :param client: connection
+        :type client: _Client
+        :param request: {"op": ..., "args": ...}
+        :type request: dict
+        :return: None
+        """
+        op = request.get('op')
+        args = request.get('args')
+        self.ops[op] += 1
+        error = None
+        if op == 'ping':
+            if self.muted:
+                return
+            client.send_json({'success': True, 'ret_msg': 'pong', 'conn_id': client.conn_id, 'request': request})
+            return
+        if op == 'auth':
+            error = self._check_auth(args)
+            client.authenticated = error is None
+        elif op == 'subscribe':
+            if self.private and not client.authenticated:
+                error = 'error:request not authorized'
+            else:
+                with self._condition:
+                    client.topics.update(args or [])
+                    self._condition.notify_all()
+        else:
+            error = f'error:unknown op {op}'
+        if not self.muted:
+            client.send_json({'success': error is None, 'ret_msg': error or '', 'conn_id': client.conn_id,
+                              'request': request})
+
+    def _serve(self, sock):
+        """
+        Function running one connection: handshake, then operations until the client leaves or is dropped
+        :param sock: socket
+        :return: None
+        """
+        request = b''
+        while b'\r\n\r\n' not in request:
+            chunk = sock.recv(4096)
+            if not chunk:
+                return
+            request += chunk
+        headers = {}
+        for line in request.split(b'\r\n\r\n', 1)[0].decode('latin-1').split('\r\n')[1:]:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        key = headers.get('sec-websocket-key')
+        if key is None:
+            sock.sendall(b'HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n')
+            return
+        accept = base64.b64encode(hashlib.sha1((key + _WS_GUID).encode('ascii')).digest()).decode('ascii')
+        sock.sendall(f'HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                     f'Sec-WebSocket-Accept: {accept}\r\n\r\n'.encode('ascii'))
+        client = _Client(f'fake-{next(self._ids)}', sock)
+        with self._condition:
+            self.connections += 1
+            self.clients[client.conn_id] = client
+        try:
+            while True:
+                opcode, payload = _read_frame(sock)
+                if opcode == _OP_CLOSE:
+                    client.send(_OP_CLOSE, payload[:2])
+                    return
+                if opcode == _OP_PING:
+                    client.send(_OP_PONG, payload)
+                elif opcode == _OP_TEXT:
+                    try:
+                        request = loads(payload)
+                    except ValueError:
+                        continue
+                    if isinstance(request, dict):
+                        self._operation(client, request)
+        except OSError:
+            pass
+        finally:
+            with self._condition:
+                self.clients.pop(client.conn_id, None)
+                self._condition.notify_all()
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(socketserver.BaseRequestHandler):
+
+            def handle(self):
+                try:
+                    server._serve(self.request)
+                except Exception as exc:
+                    log_error.error(exc)
+
+        return Handler
@@ -0,0 +1,275 @@
+import json
+import os
+import time as real_time
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+from backtesting.clock import SimClock, SimTime
+from backtesting.exchange import SimExchange
+from backtesting.trader import SimBotTrader, SimFlatBotTrader
+
+FILL_COLUMNS = ['time', 'order_id', 'side', 'price', 'qty', 'fee', 'liquidity', 'reduce_only', 'pnl']
+# configs.config constants of the levels strategy a backtest may override
+LEVELS_PARAMS = ['TAKE_PROFIT', 'STOP_LOSS', 'MAX_COUNT_LIMIT_ORDERS', 'DANGEROUS_AREA', 'SUPERIORITY']
+
+
+@contextmanager
+def patched(module, **attrs):
+    """
+    Context replacing module globals and restoring them afterwards
+    :param module: module
+    :return: None
+    """
+    saved = {name: getattr(module, name) for name in attrs if hasattr(module, name)}
+    for name, value in attrs.items():
+        setattr(module, name, value)
+    try:
+        yield module
+    finally:
+        for name in attrs:
+            if name in saved:
+                setattr(module, name, saved[name])
+            else:
+                delattr(module, name)
+
+
+@contextmanager
+def simulated_time(sim_clock: SimClock):
+    """
+    Context making the bot modules sleep and read time on the simulated clock
+    :param sim_clock: simulated clock
+    :type sim_clock: SimClock
+    :return: None
+    """
+    import bots.bots
+    import bots.priceBalance
+    sim_time = SimTime(sim_clock)
+    with patched(bots.bots, time=sim_time, sleep=sim_time.sleep), patched(bots.priceBalance, time=sim_time):
+        yield sim_time
+
+
+class SimRedis:
+
+    def __init__(self, exchange: SimExchange, superiority=None):
+        """
+        Stand-in of the market data keys the levels strategy reads from redis
+        :param exchange: simulated exchange
+        :type exchange: SimExchange
+        :param superiority: function (time, last price) returning (superiority_buy, superiority_sell), optional
+        :type superiority: callable
+        :return: None
+        """
+        self.exchange = exchange
+        self.superiority = superiority
+
+    def get(self, key: str):
+        if key == 'last_value':
+            return str(self.exchange.last_price).encode()
+        if key in ('superiority_buy', 'superiority_sell') and self.superiority is not None:
+            buy, sell = self.superiority(self.exchange.now, self.exchange.last_price)
+            return str(buy if key == 'superiority_buy' else sell).encode()
+        return None
+
+    def mget(self, *keys):
+        return [self.get(key) for key in keys]
+
+
+class SimLevelIndex:
+
+    def __init__(self, exchange: SimExchange, levels):
+        """
+        Stand-in of the redis level index
+        :param exchange: simulated exchange
+        :type exchange: SimExchange
+        :param levels: list of level prices or function (time, last price) returning it
+        :return: None
+        """
+        self.exchange = exchange
+        self.levels = levels
+
+    def get_levels(self):
+        last_value = self.exchange.last_price
+        levels = self.levels(self.exchange.now, last_value) if callable(self.levels) else self.levels
+        support = sorted([value for value in levels if value < last_value], reverse=True)
+        resistance = sorted([value for value in levels if value > last_value])
+        return last_value, support, resistance
+
+    def get_support(self):
+        return self.get_levels()[1]
+
+    def get_resistance(self):
+        return self.get_levels()[2]
+
+
+class SimChangeListener:
+
+    def __init__(self, sim_clock: SimClock):
+        self.sim_clock = sim_clock
+
+    def __call__(self, redis_con, channel: str = None):
+        return self
+
+    def wait(self, timeout: float):
+        return self.sim_clock.sleep(timeout)
+
+    def close(self):
+        return None
+
+
+class BacktestResult:
+
+    def __init__(self, exchange: SimExchange, sim_clock: SimClock, wall_seconds: float):
+        """
+        Fills, equity curve and summary of a backtest
+        :param exchange: simulated exchange after the run
+        :type exchange: SimExchange
+        :param sim_clock: simulated clock after the run
+        :type sim_clock: SimClock
+        :param wall_seconds: duration of the run
+        :type wall_seconds: float
+        :return: None
+        """
+        self.exchange = exchange
+        self.wall_seconds = wall_seconds
+        self.errors = list(sim_clock.errors)
+        self.fills = pd.DataFrame(exchange.fills, columns=FILL_COLUMNS)
+        self.times, self.equity = self._equity_curve()
+
+    def _equity_curve(self):
+        """
+        Function marking the account to market at every replayed event (vectorized)
+        :return: (times, equity)
+        :rtype: tuple
+        """
+        events = self.exchange.events
+        times = events.ts[:self.exchange.cursor]
+        prices = events.price[:self.exchange.cursor]
+        state_times, wallet, buy_size, buy_entry, sell_size, sell_entry = self.exchange.state_arrays()
+        index = np.searchsorted(state_times, times, side='right') - 1
+        equity = wallet[index] + buy_size[index] * (prices - buy_entry[index]) + \
+            sell_size[index] * (sell_entry[index] - prices)
+        return times, equity
+
+    def summary(self):
+        """
+        Function getting the backtest summary
+        :return: dict of stats
+        :rtype: dict
+        """
+        initial = self.exchange.initial_balance
+        final = float(self.equity[-1]) if len(self.equity) else self.exchange.wallet_balance
+        peak = np.maximum.accumulate(np.concatenate([[initial], self.equity]))
+        drawdown = peak - np.concatenate([[initial], self.equity])
+        events = self.exchange.cursor
+        return {
+            'events': int(events),
+            'events_per_minute': events / self.wall_seconds * 60 if self.wall_seconds else None,
+            'wall_seconds': self.wall_seconds,
+            'fills': len(self.fills),
+            'closing_fills': int(self.fills['reduce_only'].sum()) if len(self.fills) else 0,
+            'realised_pnl': float(self.fills['pnl'].sum()) if len(self.fills) else 0.0,
+            'fees': float(self.fills['fee'].sum()) if len(self.fills) else 0.0,
+            'net_pnl': final - initial,
+            'return_pct': (final - initial) / initial * 100,
+            'max_drawdown': float(drawdown.max()),
+            'max_drawdown_pct': float((drawdown / peak).max() * 100),
+            'final_equity': final,
+            'requests': dict(self.exchange.requests),
+            'errors': [repr(exc) for exc in self.errors]
+        }
+
+    def save(self, directory: str):
+        """
+        Function writing fills.csv, equity.csv and summary.json
+        :param directory: output directory
+        :type directory: str
+        :return: None
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.fills.to_csv(os.path.join(directory, 'fills.csv'), index=False)
+        pd.DataFrame({'time': self.times, 'equity': self.equity}).to_csv(os.path.join(directory, 'equity.csv'),
+                                                                         index=False)
+        with open(os.path.join(directory, 'summary.json'), 'w') as file:
+            json.dump(self.summary(), file, indent=2)
+
+
+def _run_actors(exchange: SimExchange, sim_clock: SimClock, actors: list):
+    started = real_time.perf_counter()
+    for target, args in actors:
+        sim_clock.spawn(target, *args, name=getattr(target, '__name__', None))
+    sim_clock.join()
+    return BacktestResult(exchange, sim_clock, real_time.perf_counter() - started)
+
+
+def run_levels_strategy(exchange: SimExchange, levels, long: bool = True, short: bool = True,
+                        watchers: bool = True, superiority=None, interval: int = 1, params: dict = None):
+    """
+    Function backtesting the levels strategy (trade_long / trade_short / watch_out_danger_*)
+    :param exchange: simulated exchange with the market to replay
+    :type exchange: SimExchange
+    :param levels: list of level prices or function (time, last price) returning it
+    :param long: run trade_long
+    :type long: bool
+    :param short: run trade_short
+    :type short: bool
+    :param watchers: run the danger watchers
+    :type watchers: bool
+    :param superiority: function (time, last price) returning (superiority_buy, superiority_sell), optional
+    :type superiority: callable
+    :param interval: interval trading (minutes)
+    :type interval: int
+    :param params: values of LEVELS_PARAMS replacing the configs.config ones
+    :type params: dict
+    :return: result
+    :rtype: BacktestResult
+    """
+    import strategies.levelsSrategy as levels_strategy
+    params = params or {}
+    unknown = set(params) - set(LEVELS_PARAMS)
+    if unknown:
+        raise ValueError(f"unknown levels strategy params {sorted(unknown)}")
+    sim_clock = SimClock(exchange)
+    bot_trader = SimBotTrader(exchange, sim_clock, 'sim', 'sim', 'sim', exchange.symbol, None, interval)
+    actors = []
+    if long:
+        actors.append((levels_strategy.trade_long, (bot_trader,)))
+        if watchers:
+            actors.append((levels_strategy.watch_out_danger_long, (bot_trader,)))
+    if short:
+        actors.append((levels_strategy.trade_short, (bot_trader,)))
+        if watchers:
+            actors.append((levels_strategy.watch_out_danger_short, (bot_trader,)))
+    with simulated_time(sim_clock) as sim_time, \
+            patched(levels_strategy, time=sim_time, REDIS_CON=SimRedis(exchange, superiority),
+                    LEVEL_INDEX=SimLevelIndex(exchange, levels), ChangeListener=SimChangeListener(sim_clock),
+                    LEVEL_BOOKS={}, **params):
+        return _run_actors(exchange, sim_clock, actors)
+
+
+def run_flat_strategy(exchange: SimExchange, limits_threshold: list, long: bool = True, short: bool = True,
+                      interval: int = 60):
+    """
+    Function backtesting FlatBotTrader.work_long / work_short
+    :param exchange: simulated exchange with the market to replay
+    :type exchange: SimExchange
+    :param limits_threshold: [(percent, distance), ...] of the extra limit orders
+    :type limits_threshold: list
+    :param long: run work_long
+    :type long: bool
+    :param short: run work_short
+    :type short: bool
+    :param interval: interval trading (minutes)
+    :type interval: int
+    :return: result
+    :rtype: BacktestResult
+    """
+    sim_clock = SimClock(exchange)
+    bot_trader = SimFlatBotTrader(exchange, sim_clock, 'sim', 'sim', 'sim', exchange.symbol, None, interval,
+                                  limits_threshold)
+    actors = []
+    if long:
+        actors.append((bot_trader.work_long, ()))
+    if short:
+        actors.append((bot_trader.work_short, ()))
+    with simulated_time(sim_clock):
+        return _run_actors(exchange, sim_clock, actors)
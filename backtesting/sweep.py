@@ -0,0 +1,288 @@
+import hashlib
+import itertools
+import json
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+from backtesting.events import MarketEvents
+from backtesting.exchange import SimExchange
+from backtesting.runner import run_levels_strategy, run_flat_strategy
+from bots.settings import SWEEP_WORKERS, SWEEP_RANK, SWEEP_RESULTS_FILE, BACKTEST_BALANCE, BACKTEST_QUEUE_VOLUME
+
+# summary values kept for every run
+RESULT_KEYS = ['net_pnl', 'return_pct', 'max_drawdown', 'max_drawdown_pct', 'fills', 'closing_fills', 'fees',
+               'events', 'wall_seconds']
+EVENT_COLUMNS = ['ts', 'price', 'qty', 'side']
+
+
+def grid(space: dict):
+    """
+    Function getting every combination of the values
+    :param space: param -> list of values
+    :type space: dict
+    :return: list of params
+    :rtype: list
+    """
+    names = list(space)
+    return [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+
+
+def random_samples(space: dict, count: int, seed: int = None):
+    """
+    Function drawing params, a list is sampled by choice, {"low": x, "high": y} uniformly (ints stay ints)
+    :param space: param -> values or range
+    :type space: dict
+    :param count: number of samples
+    :type count: int
+    :param seed: random seed
+    :type seed: int
+    :return: list of params (without duplicates)
+    :rtype: list
+    """
+    rng = random.Random(seed)
+    samples = {}
+    for attempt in range(count * 20):
+        if len(samples) == count:
+            break
+        params = {}
+        for name, values in space.items():
+            if isinstance(values, dict):
+                low, high = values['low'], values['high']
+                params[name] = rng.randint(low, high) if isinstance(low, int) and isinstance(high, int) \
+                    else rng.uniform(low, high)
+            else:
+                params[name] = rng.choice(values)
+        samples.setdefault(params_key(params), params)
+    return list(samples.values())
+
+
+def params_key(params: dict):
+    return json.dumps(params, sort_keys=True)
+
+
+class SharedEvents:
+
+    def __init__(self, events: MarketEvents):
+        """
+        Market events copied once into shared memory, the workers map them read-only instead of unpickling a copy
+        :param events: events
+        :type events: MarketEvents
+        :return: None
+        """
+        self.length = len(events)
+        self.blocks = {}
+        self.spec = {'length': self.length, 'columns': {}}
+        for column in EVENT_COLUMNS:
+            array = getattr(events, column)
+            block = SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, array.dtype, buffer=block.buf)[:] = array
+            self.blocks[column] = block
+            self.spec['columns'][column] = (block.name, array.dtype.str)
+
+    def close(self):
+        for block in self.blocks.values():
+            block.close()
+            block.unlink()
+        self.blocks = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def attach_events(spec: dict):
+    """
+    Function mapping shared events in a worker
+    :param spec: SharedEvents.spec
+    :type spec: dict
+    :return: (events backed by the shared blocks, blocks to keep open)
+    :rtype: tuple
+    """
+    blocks = []
+    arrays = {}
+    for column, (name, dtype) in spec['columns'].items():
+        # pool workers share the resource tracker of the sweep process, which unlinks the block
+        block = SharedMemory(name=name)
+        array = np.ndarray((spec['length'],), np.dtype(dtype), buffer=block.buf)
+        array.flags.writeable = False
+        arrays[column] = array
+        blocks.append(block)
+    return MarketEvents(arrays['ts'], arrays['price'], arrays['qty'], arrays['side']), blocks
+
+
+_WORKER = {}
+
+
+def _init_worker(spec: dict, strategy: str, symbol: str, levels: list, balance: float, queue_volume: float):
+    events, blocks = attach_events(spec)
+    _WORKER.update(events=events, blocks=blocks, strategy=strategy, symbol=symbol, levels=levels, balance=balance,
+                   queue_volume=queue_volume)
+
+
+def run_params(params: dict):
+    """
+    Function backtesting one set of params on the events of the worker
+    :param params: params (LEVELS_PARAMS or limits_threshold)
+    :type params: dict
+    :return: dict with params and the summary values (error instead if the run failed)
+    :rtype: dict
+    """
+    row = {'params': params}
+    try:
+        exchange = SimExchange(_WORKER['events'], _WORKER['symbol'], balance=_WORKER['balance'],
+                               queue_volume=_WORKER['queue_volume'])
+        if _WORKER['strategy'] == 'levels':
+            result = run_levels_strategy(exchange, _WORKER['levels'], params=params)
+        else:
+            result = run_flat_strategy(exchange, [tuple(limit) for limit in params['limits_threshold']])
+        summary = result.summary()
+        row.update({key: summary[key] for key in RESULT_KEYS})
+        row['run_errors'] = len(summary['errors'])
+    except Exception as exc:
+        row['error'] = repr(exc)
+    return row
+
+
+def dataset_fingerprint(events: MarketEvents, strategy: str, symbol: str, levels: list, balance: float,
+                        queue_volume: float):
+    """
+    Function describing what the runs of a sweep are backtested on, results of another dataset are not reused
+    :return: json-serializable dict
+    :rtype: dict
+    """
+    digest = hashlib.sha1()
+    for column in EVENT_COLUMNS:
+        digest.update(np.ascontiguousarray(getattr(events, column)).tobytes())
+    return {'events': len(events), 'first_ts': float(events.ts[0]) if len(events) else None,
+            'last_ts': float(events.ts[-1]) if len(events) else None, 'events_sha1': digest.hexdigest(),
+            'strategy': strategy, 'symbol': symbol, 'levels': [float(price) for price in levels],
+            'balance': float(balance), 'queue_volume': float(queue_volume)}
+
+
+def load_dataset(path: str):
+    """
+    Function reading the dataset header (first line) of a results file
+    :param path: results file
+    :type path: str
+    :return: fingerprint or None if there is none
+    :rtype: dict
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path) as file:
+        try:
+            return json.loads(file.readline()).get('dataset')
+        except ValueError:
+            return None
+
+
+def load_results(path: str):
+    """
+    Function reading the finished runs of a sweep
+    :param path: results file
+    :type path: str
+    :return: params key -> row
+    :rtype: dict
+    """
+    results = {}
+    if not os.path.exists(path):
+        return results
+    with open(path) as file:
+        for line in file:
+            try:
+                row = json.loads(line)
+            except ValueError:
+                # the last line of an interrupted sweep may be cut
+                continue
+            if 'params' in row:
+                results[params_key(row['params'])] = row
+    return results
+
+
+def _ends_with_newline(path: str):
+    with open(path, 'rb') as file:
+        file.seek(-1, os.SEEK_END)
+        return file.read(1) == b'\n'
+
+
+def rank(results: list, keys: list = SWEEP_RANK):
+    """
+    Function sorting runs, failed ones are left out
+    :param results: rows
+    :type results: list
+    :param keys: summary values, '-' prefix for descending
+    :type keys: list
+    :return: rows best first
+    :rtype: list
+    """
+    def sort_key(row):
+        return tuple(-row[key[1:]] if key.startswith('-') else row[key] for key in keys)
+    return sorted([row for row in results if 'error' not in row], key=sort_key)
+
+
+def run_sweep(events: MarketEvents, params_list: list, out: str, strategy: str = 'levels', symbol: str = 'BTCUSDT',
+              levels: list = None, balance: float = BACKTEST_BALANCE, queue_volume: float = BACKTEST_QUEUE_VOLUME,
+              workers: int = SWEEP_WORKERS, fresh: bool = False):
+    """
+    Function backtesting params over a process pool, every finished run is appended to the results file so
+    an interrupted sweep resumes with the missing runs only. The file starts with the fingerprint of the dataset,
+    a sweep of another dataset into the same directory is refused
+    :param events: market to replay
+    :type events: MarketEvents
+    :param params_list: params of the runs
+    :type params_list: list
+    :param out: output directory
+    :type out: str
+    :param strategy: levels or flat
+    :type strategy: str
+    :param symbol: symbol instrument
+    :type symbol: str
+    :param levels: level prices (levels strategy)
+    :type levels: list
+    :param balance: initial balance
+    :type balance: float
+    :param queue_volume: contracts ahead of a new order
+    :type queue_volume: float
+    :param workers: processes (os.cpu_count() if None)
+    :type workers: int
+    :param fresh: results of a previous sweep in out are dropped instead of resumed
+    :type fresh: bool
+    :return: ranked rows of every run of params_list
+    :rtype: list
+    :raises ValueError: out holds the results of another dataset
+    """
+    os.makedirs(out, exist_ok=True)
+    path = os.path.join(out, SWEEP_RESULTS_FILE)
+    dataset = dataset_fingerprint(events, strategy, symbol, levels or [], balance, queue_volume)
+    if fresh or not os.path.exists(path) or os.path.getsize(path) == 0:
+        with open(path, 'w') as file:
+            file.write(json.dumps({'dataset': dataset}) + '\n')
+    elif load_dataset(path) != dataset:
+        raise ValueError(f"{path} holds the results of another dataset or strategy setup, "
+                         f"use another output directory or start it fresh (--fresh)")
+    done = load_results(path)
+    # failed runs are tried again
+    pending = [params for params in params_list if 'error' in done.get(params_key(params), {'error': None})]
+    workers = min(workers if workers is not None else os.cpu_count() or 1, max(len(pending), 1))
+    if len(pending) > 0:
+        with SharedEvents(events) as shared, open(path, 'a') as file, \
+                ProcessPoolExecutor(workers, initializer=_init_worker,
+                                    initargs=(shared.spec, strategy, symbol, levels or [], balance,
+                                              queue_volume)) as executor:
+            if file.tell() > 0 and not _ends_with_newline(path):
+                file.write('\n')
+            futures = [executor.submit(run_params, params) for params in pending]
+            try:
+                for future in as_completed(futures):
+                    row = future.result()
+                    done[params_key(row['params'])] = row
+                    file.write(json.dumps(row) + '\n')
+                    file.flush()
+            finally:
+                # interrupted: the queued runs are not started, a rerun does them
+                executor.shutdown(cancel_futures=True)
+    return rank([done[params_key(params)] for params in params_list if params_key(params) in done])
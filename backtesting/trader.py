@@ -0,0 +1,97 @@
+from urllib.parse import urlsplit
+from bots.accountSnapshot import SnapshotCache
+from bots.orderManager import OrderManager
+from bots.settings import BACKTEST_LATENCY
+from bots.bots import BotTrader, FlatBotTrader
+from backtesting.clock import SimClock
+from backtesting.exchange import SimExchange
+
+
+class SimTraderMixin:
+
+    def __init__(self, exchange: SimExchange, sim_clock: SimClock, *args, latency: float = BACKTEST_LATENCY,
+                 **kwargs):
+        """
+        Bot whose requests are answered by the simulated exchange in simulated time
+        :param exchange: simulated exchange
+        :type exchange: SimExchange
+        :param sim_clock: simulated clock
+        :type sim_clock: SimClock
+        :param latency: seconds of simulated time every request takes
+        :type latency: float
+        :return: None
+        """
+        super().__init__(*args, **kwargs)
+        self.exchange = exchange
+        self.latency = latency
+        self.sim_clock = sim_clock
+        self.snapshots = SnapshotCache(clock=sim_clock.monotonic)
+        self.orders = OrderManager(self.symbol, clock=sim_clock.monotonic)
+        self.prices.price_source = lambda: (exchange.last_price, sim_clock.now)
+        exchange.listeners.append(self._on_exchange_update)
+
+    def _on_exchange_update(self):
+        # what the private stream would deliver: fresh orders / positions / balance on the next read
+        self.snapshots.invalidate()
+        self.orders.expire()
+        self.prices.invalidate_balance()
+
+    def go_command(self, method: str, url: str, secret_key: str, params: dict, proxies: dict, priority: int = None,
+                   droppable: bool = True):
+        """
+        Function answering a request from the simulated exchange after the simulated latency
+        (no signing, no transport, no rate limits)
+        :param method: GET or POST
+        :type method: str
+        :param url: url bybit
+        :type url: str
+        :param secret_key: client's secret key
+        :type secret_key: str
+        :param params: dict with data for request
+        :type params: str
+        :param proxies: dict with proxy
+        :type proxies: dict
+        :param priority: ignored
+        :type priority: int
+        :param droppable: ignored
+        :type droppable: bool
+        :return: dict with data
+        """
+        try:
+            self.sim_clock.charge(self.latency)
+            return self.exchange.handle(method, urlsplit(url).path, params)
+        finally:
+            if method == 'POST':
+                self.snapshots.invalidate()
+
+    def get_timestamp(self, proxy):
+        return int(self.sim_clock.now * 1000)
+
+    def _fetch_last_price(self):
+        self.prices.set_last_price(self.exchange.last_price)
+        return self.exchange.last_price
+
+    def start_stream(self, url: str = None):
+        # fills reach the bot through the exchange listener
+        return None
+
+    def stop_stream(self):
+        return None
+
+    def wait_for_update(self, timeout: float):
+        """
+        Function sleeping in simulated time until a fill / order change or timeout
+        :param timeout: max seconds to wait
+        :type timeout: float
+        :return: True if woken by an update
+        :rtype: bool
+        """
+        return self.sim_clock.sleep(timeout, on_update=True)
+
+
+class SimBotTrader(SimTraderMixin, BotTrader):
+    pass
+
+
+class SimFlatBotTrader(SimTraderMixin, FlatBotTrader):
+    pass
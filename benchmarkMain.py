@@ -0,0 +1,33 @@
+import argparse
+import json
+from benchmarks.requestPath import run_suite, save_results, compare_results
+from bots.settings import BENCHMARK_REPEAT, BENCHMARK_WARMUP, BENCHMARK_LOOP_ITERATIONS
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Latency of the bot request path against the local fake exchange')
+    parser.add_argument('--only', nargs='+', default=None, help='names of the operations / loops to run')
+    parser.add_argument('--repeat', type=int, default=BENCHMARK_REPEAT)
+    parser.add_argument('--iterations', type=int, default=BENCHMARK_LOOP_ITERATIONS)
+    parser.add_argument('--warmup', type=int, default=BENCHMARK_WARMUP)
+    parser.add_argument('--latency', type=float, nargs='+', default=[0.0], help='seconds, or min max')
+    parser.add_argument('--out', default=None, help='json file for the results')
+    parser.add_argument('--baseline', default=None, help='json results to compare with')
+    args = parser.parse_args()
+
+    results = run_suite(args.latency[0] if len(args.latency) == 1 else tuple(args.latency[:2]), args.repeat,
+                        args.iterations, args.warmup, args.only)
+    if args.out is not None:
+        save_results(results, args.out)
+    for section in ('operations', 'loops'):
+        for name, result in results[section].items():
+            cpu = result['cpu'] or {}
+            print(f"{name:32} p50 {result['p50_ms']:8.3f} ms  p99 {result['p99_ms']:8.3f} ms  "
+                  f"requests {result['requests_per_op']:5.2f}  signing {cpu.get('signing_us', 0):7.1f} us  "
+                  f"encoding {cpu.get('json_encoding_us', 0):6.1f} us  decoding {cpu.get('json_decoding_us', 0):6.1f} us")
+    if args.baseline is not None:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        for section, name, metric, old, new, change in compare_results(baseline, results):
+            change = 'n/a' if change is None else f'{change:+.1f}%'
+            print(f"{section:10} {name:32} {metric:16} {old} -> {new} ({change})")
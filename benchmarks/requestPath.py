@@ -0,0 +1,382 @@
+import json
+import os
+import platform
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import numpy as np
+import bots.bots
+from backtesting.fakeBybit import FakeBybitServer
+from backtesting.runner import patched, SimRedis, SimLevelIndex
+from bots.bots import BotTrader
+from bots.settings import BENCHMARK_REPEAT, BENCHMARK_WARMUP, BENCHMARK_LOOP_ITERATIONS, BENCHMARK_LEVEL_OFFSETS, \
+    BENCHMARK_RATE_LIMIT, RATE_LIMITS, FAKE_EXCHANGE_PRICE
+
+API_KEY = 'benchmark'
+API_SECRET = 'benchmark'
+COMPARED_METRICS = ['p50_ms', 'p99_ms', 'requests_per_op']
+# trade_long waiting for its limit orders / holding a position
+LOOPS = ['trade_long_waiting', 'trade_long_in_position']
+CPU_PARTS = ['go_command', 'signing', 'json_encoding', 'json_decoding', 'http']
+
+
+class BenchmarkFinished(BaseException):
+    # BaseException, so the `except Exception` of the strategy loops lets it through
+    pass
+
+
+def latency_stats(samples: list):
+    """
+    Function summarizing latencies
+    :param samples: seconds
+    :type samples: list
+    :return: dict of p50 / p99 / mean / min / max (ms)
+    :rtype: dict
+    """
+    values = np.asarray(samples, dtype=float) * 1000
+    if len(values) == 0:
+        return {'p50_ms': None, 'p99_ms': None, 'mean_ms': None, 'min_ms': None, 'max_ms': None}
+    return {'p50_ms': float(np.percentile(values, 50)), 'p99_ms': float(np.percentile(values, 99)),
+            'mean_ms': float(values.mean()), 'min_ms': float(values.min()), 'max_ms': float(values.max())}
+
+
+class CpuSplit:
+
+    def __init__(self, bot_trader: BotTrader):
+        """
+        Thread cpu time of the request path of a bot, split between signing, json encoding / decoding and http
+        :param bot_trader: bot
+        :type bot_trader: BotTrader
+        :return: None
+        """
+        self.bot_trader = bot_trader
+        self.totals = dict.fromkeys(CPU_PARTS, 0)
+        self.sent = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _timed(self, part: str, function):
+        def wrapper(*args, **kwargs):
+            depth = getattr(self._local, 'depth', 0)
+            # json calls count only inside go_command
+            if getattr(self._local, 'paused', False) or (part != 'go_command' and depth == 0):
+                return function(*args, **kwargs)
+            self._local.depth = depth + 1
+            started = time.thread_time_ns()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = time.thread_time_ns() - started
+                self._local.depth = depth
+                with self._lock:
+                    self.totals[part] += elapsed
+                    if part == 'http':
+                        self.sent += 1
+        return wrapper
+
+    def reset(self):
+        with self._lock:
+            self.totals = dict.fromkeys(CPU_PARTS, 0)
+            self.sent = 0
+
+    @contextmanager
+    def paused(self):
+        """
+        Context not counting the calls of the current thread (untimed setup)
+        :return: None
+        """
+        self._local.paused = True
+        try:
+            yield
+        finally:
+            self._local.paused = False
+
+    @contextmanager
+    def attach(self):
+        """
+        Context timing the calls of the bot
+        :return: self
+        """
+        bot_trader = self.bot_trader
+        http = bot_trader.http
+        bot_trader.go_command = self._timed('go_command', bot_trader.go_command)
+        bot_trader._prepare_request = self._timed('signing', bot_trader._prepare_request)
+        http.request = self._timed('http', http.request)
+        try:
+            with patched(bots.bots, dumps=self._timed('json_encoding', bots.bots.dumps),
+                         loads=self._timed('json_decoding', bots.bots.loads)):
+                yield self
+        finally:
+            del bot_trader.go_command, bot_trader._prepare_request, http.request
+
+    def result(self, operations: int):
+        """
+        Function getting the cpu microseconds per operation (signing excludes the json encoding of the body)
+        :param operations: timed operations
+        :type operations: int
+        :return: dict
+        :rtype: dict
+        """
+        totals = dict(self.totals)
+        totals['signing'] -= totals['json_encoding']
+        result = {f'{part}_us': value / operations / 1000 for part, value in totals.items()}
+        result['sent_per_op'] = self.sent / operations
+        return result
+
+
+def _server_requests(server: FakeBybitServer):
+    return sum(server.requests.values())
+
+
+def _create_server(latency):
+    return FakeBybitServer(api_keys={API_KEY: API_SECRET}, latency=latency,
+                           limits=dict.fromkeys(RATE_LIMITS, BENCHMARK_RATE_LIMIT))
+
+
+def create_bot(server: FakeBybitServer, symbol: str = 'BTCUSDT'):
+    """
+    Function creating a bot talking to the fake exchange, without the private stream
+    (every read goes through go_command)
+    :param server: running fake exchange
+    :type server: FakeBybitServer
+    :param symbol: symbol instrument
+    :type symbol: str
+    :return: bot
+    :rtype: BotTrader
+    """
+    bot_trader = BotTrader(API_KEY, API_SECRET, 'api', symbol, None, 1, base_url=server.url)
+    bot_trader.start_stream = lambda url=None: None
+    return bot_trader
+
+
+def measure_operation(server: FakeBybitServer, bot_trader: BotTrader, operation, setup=None,
+                      repeat: int = BENCHMARK_REPEAT, warmup: int = BENCHMARK_WARMUP):
+    """
+    Function timing a bot call
+    :param server: running fake exchange
+    :type server: FakeBybitServer
+    :param bot_trader: bot
+    :type bot_trader: BotTrader
+    :param operation: function without arguments
+    :param setup: function run untimed before every call, optional
+    :param repeat: timed calls
+    :type repeat: int
+    :param warmup: untimed calls before the timed ones
+    :type warmup: int
+    :return: dict of latency stats, requests per operation and cpu split
+    :rtype: dict
+    """
+    latencies, requests = [], []
+    cpu = CpuSplit(bot_trader)
+    with cpu.attach():
+        for index in range(warmup + repeat):
+            if index == warmup:
+                cpu.reset()
+            if setup is not None:
+                with cpu.paused():
+                    setup()
+            before = _server_requests(server)
+            started = time.perf_counter()
+            operation()
+            elapsed = time.perf_counter() - started
+            if index >= warmup:
+                latencies.append(elapsed)
+                requests.append(_server_requests(server) - before)
+    result = latency_stats(latencies)
+    result['requests_per_op'] = float(np.mean(requests)) if requests else None
+    result['cpu'] = cpu.result(repeat) if repeat else None
+    return result
+
+
+def measure_loop(server: FakeBybitServer, bot_trader: BotTrader, target, iterations: int = BENCHMARK_LOOP_ITERATIONS,
+                 warmup: int = BENCHMARK_WARMUP):
+    """
+    Function timing the iterations of a strategy loop: an iteration is the work between two wait_for_update calls.
+    The wait returns at once and drops the account snapshots, as a real wait longer than SNAPSHOT_TTL does
+    without the stream
+    :param server: running fake exchange
+    :type server: FakeBybitServer
+    :param bot_trader: bot
+    :type bot_trader: BotTrader
+    :param target: loop function taking the bot, never returning
+    :param iterations: timed iterations
+    :type iterations: int
+    :param warmup: untimed iterations (the work before the first wait is never timed)
+    :type warmup: int
+    :return: dict of latency stats, requests per iteration and cpu split
+    :rtype: dict
+    """
+    latencies, requests = [], []
+    cpu = CpuSplit(bot_trader)
+    state = {'started': None, 'requests': 0}
+
+    def wait_for_update(timeout: float):
+        now = time.perf_counter()
+        if state['started'] is not None:
+            latencies.append(now - state['started'])
+            requests.append(_server_requests(server) - state['requests'])
+        if len(latencies) >= warmup + iterations:
+            raise BenchmarkFinished()
+        if len(latencies) == warmup:
+            cpu.reset()
+        bot_trader.snapshots.invalidate()
+        state['requests'] = _server_requests(server)
+        state['started'] = time.perf_counter()
+        return False
+
+    bot_trader.wait_for_update = wait_for_update
+    try:
+        with cpu.attach():
+            target(bot_trader)
+    except BenchmarkFinished:
+        pass
+    finally:
+        del bot_trader.wait_for_update
+    result = latency_stats(latencies[warmup:])
+    result['requests_per_op'] = float(np.mean(requests[warmup:])) if len(requests) > warmup else None
+    result['cpu'] = cpu.result(iterations) if len(latencies) > warmup else None
+    return result
+
+
+def _operations():
+    """
+    Function getting the benchmarked bot calls: name - (prepare, setup, operation), each taking the bot.
+    prepare runs once on a fresh exchange, setup before every call; reads drop the account snapshots / price first,
+    so each pays its REST request as it does after SNAPSHOT_TTL / PRICE_TTL without the stream
+    :return: dict
+    :rtype: dict
+    """
+    below, above = FAKE_EXCHANGE_PRICE - 500, FAKE_EXCHANGE_PRICE + 500
+
+    def post_two_limits(bot_trader):
+        bot_trader.post_limit_order(1, below, 'long', False)
+        bot_trader.post_limit_order(1, below - 100, 'long', False)
+
+    def open_long(bot_trader):
+        bot_trader.post_market_order('long', 5)
+
+    def drop_snapshots(bot_trader):
+        bot_trader.snapshots.invalidate()
+        bot_trader.orders.expire()
+
+    def never_reuse_price(bot_trader):
+        bot_trader.prices.price_ttl = 0
+
+    return {
+        'get_timestamp': (None, None, lambda bot_trader: bot_trader.get_timestamp(None)),
+        'find_price': (never_reuse_price, None, lambda bot_trader: bot_trader.find_price()),
+        'get_market_qty': (open_long, drop_snapshots,
+                           lambda bot_trader: bot_trader.get_market_qty('long', False)),
+        'get_info_open_limit_orders': (post_two_limits, drop_snapshots,
+                                       lambda bot_trader: bot_trader.get_info_open_limit_orders('Buy', False)),
+        'post_limit_order': (None, None, lambda bot_trader: bot_trader.post_limit_order(1, below, 'long', False)),
+        'post_limit_order_reduce_only': (open_long, drop_snapshots,
+                                         lambda bot_trader: bot_trader.post_limit_order(1, above, 'short', True)),
+        'del_limit_order': (None, post_two_limits, lambda bot_trader: bot_trader.del_limit_order('Buy', False)),
+        'post_market_order': (None, None, lambda bot_trader: bot_trader.post_market_order('long', 1)),
+        'put_stop_loss': (open_long, None, lambda bot_trader: bot_trader.put_stop_loss(below, 'Buy'))
+    }
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout.strip()
+    except Exception:
+        return None
+
+
+def run_suite(latency=0.0, repeat: int = BENCHMARK_REPEAT, iterations: int = BENCHMARK_LOOP_ITERATIONS,
+              warmup: int = BENCHMARK_WARMUP, only: list = None, symbol: str = 'BTCUSDT'):
+    """
+    Function benchmarking the bot calls and the strategy loops, each against its own fresh fake exchange
+    :param latency: seconds the fake exchange adds to every response, or (min, max)
+    :param repeat: timed calls of every operation
+    :type repeat: int
+    :param iterations: timed iterations of every strategy loop
+    :type iterations: int
+    :param warmup: untimed calls / iterations
+    :type warmup: int
+    :param only: names of the benchmarks to run (all if None)
+    :type only: list
+    :param symbol: symbol instrument
+    :type symbol: str
+    :return: results
+    :rtype: dict
+    """
+    results = {
+        'meta': {'time': datetime.now(timezone.utc).isoformat(), 'commit': _commit(),
+                 'python': platform.python_version(), 'platform': platform.platform(),
+                 'latency': latency, 'repeat': repeat, 'iterations': iterations, 'warmup': warmup},
+        'operations': {},
+        'loops': {}
+    }
+    for name, (prepare, setup, operation) in _operations().items():
+        if only is not None and name not in only:
+            continue
+        with _create_server(latency) as server:
+            bot_trader = create_bot(server, symbol)
+            if prepare is not None:
+                prepare(bot_trader)
+            results['operations'][name] = measure_operation(
+                server, bot_trader, lambda: operation(bot_trader),
+                None if setup is None else lambda: setup(bot_trader), repeat, warmup)
+    loops = [name for name in LOOPS if only is None or name in only]
+    if not loops:
+        return results
+    import strategies.levelsSrategy as levels_strategy
+    for name in loops:
+        with _create_server(latency) as server:
+            levels = [server.exchange.last_price + offset for offset in BENCHMARK_LEVEL_OFFSETS]
+            bot_trader = create_bot(server, symbol)
+            if name == 'trade_long_in_position':
+                # entered on a level, with the deeper levels still resting
+                bot_trader.post_limit_order(1, levels[1], 'long', False)
+                bot_trader.post_limit_order(2, levels[0], 'long', False)
+                bot_trader.post_market_order('long', 5)
+            with patched(levels_strategy, REDIS_CON=SimRedis(server.exchange),
+                         LEVEL_INDEX=SimLevelIndex(server.exchange, levels), LEVEL_BOOKS={}):
+                results['loops'][name] = measure_loop(server, bot_trader, levels_strategy.trade_long, iterations,
+                                                      warmup)
+    return results
+
+
+def save_results(results: dict, path: str):
+    """
+    Function writing results as json
+    :param results: results of run_suite
+    :type results: dict
+    :param path: file path
+    :type path: str
+    :return: None
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as file:
+        json.dump(results, file, indent=2)
+
+
+def compare_results(baseline: dict, results: dict):
+    """
+    Function comparing two result sets
+    :param baseline: older results
+    :type baseline: dict
+    :param results: newer results
+    :type results: dict
+    :return: rows (section, name, metric, old, new, change %)
+    :rtype: list
+    """
+    rows = []
+    for section in ('operations', 'loops'):
+        for name, result in results.get(section, {}).items():
+            old_result = baseline.get(section, {}).get(name)
+            if old_result is None:
+                continue
+            for metric in COMPARED_METRICS:
+                old, new = old_result.get(metric), result.get(metric)
+                change = (new - old) / old * 100 if old and new is not None else None
+                rows.append((section, name, metric, old, new, change))
+    return rows
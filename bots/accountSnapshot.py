@@ -0,0 +1,190 @@
+import asyncio
+import threading
+import time
+from bots.settings import SNAPSHOT_TTL
+
+
+class _Inflight:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SnapshotCache:
+
+    def __init__(self, ttl: float = SNAPSHOT_TTL, clock=time.monotonic):
+        """
+        Short-lived cache of account snapshots with coalescing of concurrent fetches
+        :param ttl: seconds a snapshot stays fresh (0 disables caching, fetches are still coalesced)
+        :type ttl: float
+        :param clock: monotonic clock function
+        :type clock: callable
+        :return: None
+        """
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = {}
+        self._inflight = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.fetches = 0
+        self.hits = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_entries'] = {}
+        state['_inflight'] = {}
+        state['_lock'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def get(self, key: str, fetch, max_age: float = None, cacheable=None):
+        """
+        Function getting a snapshot, concurrent callers share one in-flight fetch
+        :param key: snapshot name
+        :type key: str
+        :param fetch: function fetching the snapshot
+        :type fetch: callable
+        :param max_age: override of ttl (0 forces a new fetch)
+        :type max_age: float
+        :param cacheable: function telling if a fetched snapshot may be cached (e.g. not an error body)
+        :type cacheable: callable
+        :return: snapshot
+        """
+        max_age = self.ttl if max_age is None else max_age
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.clock() - entry[0] < max_age:
+                self.hits += 1
+                return entry[1]
+            inflight = self._inflight.get(key)
+            owner = inflight is None
+            if owner:
+                inflight = _Inflight()
+                self._inflight[key] = inflight
+                generation = self._generation
+                self.fetches += 1
+        if not owner:
+            inflight.done.wait()
+            if inflight.error is not None:
+                raise inflight.error
+            return inflight.value
+        try:
+            inflight.value = fetch()
+            return inflight.value
+        except Exception as exc:
+            inflight.error = exc
+            raise
+        finally:
+            with self._lock:
+                if self._inflight.get(key) is inflight:
+                    del self._inflight[key]
+                if inflight.error is None and generation == self._generation and \
+                        (cacheable is None or cacheable(inflight.value)):
+                    self._entries[key] = (self.clock(), inflight.value)
+            inflight.done.set()
+
+    def put(self, key: str, value):
+        """
+        Function storing a snapshot received from outside (e.g. a stream)
+        :param key: snapshot name
+        :type key: str
+        :param value: snapshot
+        :return: None
+        """
+        with self._lock:
+            self._entries[key] = (self.clock(), value)
+
+    def invalidate(self, key: str = None):
+        """
+        Function dropping snapshots, fetches already in flight are not cached
+        :param key: snapshot name (all snapshots if None)
+        :type key: str
+        :return: None
+        """
+        with self._lock:
+            self._generation += 1
+            if key is None:
+                self._entries.clear()
+                self._inflight.clear()
+            else:
+                self._entries.pop(key, None)
+                self._inflight.pop(key, None)
+
+    def update(self, key: str, apply):
+        """
+        Function patching a cached snapshot in place of a refetch, fetches already in flight are not cached
+        :param key: snapshot name
+        :type key: str
+        :param apply: function returning the patched snapshot (None drops it)
+        :type apply: callable
+        :return: True if a cached snapshot was patched
+        :rtype: bool
+        """
+        with self._lock:
+            self._generation += 1
+            self._inflight.pop(key, None)
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return False
+            value = apply(entry[1])
+            if value is None:
+                return False
+            self._entries[key] = (self.clock(), value)
+            return True
+
+
+class AsyncSnapshotCache(SnapshotCache):
+
+    async def get(self, key: str, fetch, max_age: float = None, cacheable=None):
+        """
+        Function getting a snapshot, concurrent tasks share one in-flight fetch
+        :param key: snapshot name
+        :type key: str
+        :param fetch: coroutine function fetching the snapshot
+        :type fetch: callable
+        :param max_age: override of ttl (0 forces a new fetch)
+        :type max_age: float
+        :param cacheable: function telling if a fetched snapshot may be cached (e.g. not an error body)
+        :type cacheable: callable
+        :return: snapshot
+        """
+        max_age = self.ttl if max_age is None else max_age
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.clock() - entry[0] < max_age:
+                self.hits += 1
+                return entry[1]
+            inflight = self._inflight.get(key)
+            owner = inflight is None
+            if owner:
+                inflight = asyncio.get_running_loop().create_future()
+                self._inflight[key] = inflight
+                generation = self._generation
+                self.fetches += 1
+        if not owner:
+            return await asyncio.shield(inflight)
+        try:
+            value = await fetch()
+        except asyncio.CancelledError:
+            inflight.cancel()
+            raise
+        except Exception as exc:
+            inflight.set_exception(exc)
+            # waiters are optional, the owner re-raises the error itself
+            inflight.exception()
+            raise
+        finally:
+            with self._lock:
+                if self._inflight.get(key) is inflight:
+                    del self._inflight[key]
+        inflight.set_result(value)
+        with self._lock:
+            if generation == self._generation and (cacheable is None or cacheable(value)):
+                self._entries[key] = (self.clock(), value)
+        return value
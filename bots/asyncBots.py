@@ -0,0 +1,592 @@
+import asyncio
+import logging
+import time
+from json import loads
+import aiohttp
+from bots.bots import BotTrader, _is_success
+from bots.rateLimiter import endpoint_group, request_priority
+from bots.accountSnapshot import AsyncSnapshotCache
+from bots.metrics import observe_request, observe_retry
+from bots.settings import TIMESTAMP_ERROR_CODE, CANCEL_ALL_MIN_ORDERS, HTTP_POOL_CONNECTIONS, HTTP_POOL_MAXSIZE, \
+    HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, PRIORITY_READ, OMS_RECONCILE_INTERVAL, OMS_POLL_INTERVAL
+
+log_info = logging.getLogger('bots_info')
+log_error = logging.getLogger('bots_error')
+
+
+class AsyncBotTrader(BotTrader):
+
+    def __init__(self, api_key: str, api_secret: str, mode: str, symbol: str, proxy: str, interval: int,
+                 base_url: str = None):
+        """
+        Asyncio variant of BotTrader, every request method is a coroutine so independent requests run concurrently
+        :param api_key: api account key
+        :type api_key: str
+        :param api_secret: api account secret key
+        :type api_secret: str
+        :param mode: mode work (testnet or Mainenet)
+        :type mode: str
+        :param symbol: symbol instrument
+        :type symbol: str
+        :param proxy: proxy
+        :type proxy: str
+        :param interval: interval trading (minutes)
+        :type proxy: int
+        :param base_url: REST url (https://{mode}.bybit.com if None)
+        :type base_url: str
+        :return: None
+        """
+        super().__init__(api_key, api_secret, mode, symbol, proxy, interval, base_url=base_url)
+        self.snapshots = AsyncSnapshotCache()
+        self._session = None
+        self._sync_lock = asyncio.Lock()
+
+    def _get_session(self):
+        """
+        Function getting the keep-alive session of the running loop
+        :return: session
+        :rtype: aiohttp.ClientSession
+        """
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=HTTP_POOL_CONNECTIONS * HTTP_POOL_MAXSIZE,
+                                             limit_per_host=HTTP_POOL_MAXSIZE, ssl=False)
+            timeout = aiohttp.ClientTimeout(sock_connect=HTTP_CONNECT_TIMEOUT, sock_read=HTTP_READ_TIMEOUT)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        return self._session
+
+    async def close(self):
+        """
+        Function closing the session
+        :return: None
+        """
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _request(self, method: str, url: str, data: str = None, headers: dict = None):
+        # like requests with proxies={'http': proxy}, the proxy is applied to plain http urls only
+        proxy = f'http://{self.proxy}' if self.proxy and url.startswith('http://') else None
+        async with self._get_session().request(method, url, data=data, headers=headers, proxy=proxy) as response:
+            result = loads(await response.text())
+            self.scheduler.update(endpoint_group(url), response.headers, result)
+            return result
+
+    async def _send_command(self, method: str, url: str, secret_key: str, params: dict, proxies: dict):
+        request_url, body, headers = self._prepare_request(method, url, secret_key, params)
+        return await self._request(method, request_url, body, headers)
+
+    async def _acquire(self, group: str, priority: int, droppable: bool = True):
+        """
+        Function taking a rate limit token, a wait for the budget runs in a worker thread
+        :param group: endpoint group
+        :type group: str
+        :param priority: priority class
+        :type priority: int
+        :param droppable: a read gives up after read_max_wait
+        :type droppable: bool
+        :return: True if a token was taken
+        :rtype: bool
+        """
+        if self.scheduler.acquire(group, priority, 0):
+            return True
+        timeout = self.scheduler.read_max_wait if priority == PRIORITY_READ and droppable else None
+        return await asyncio.to_thread(self.scheduler.acquire, group, priority, timeout)
+
+    async def go_command(self, method: str, url: str, secret_key: str, params: dict, proxies: dict,
+                         priority: int = None, droppable: bool = True):
+        """
+        Function creating a request through the rate limit scheduler
+        (resigned once with a fresh timestamp if the exchange rejects it)
+        :param method: GET or POST
+        :type method: str
+        :param url: url bybit
+        :type url: str
+        :param secret_key: client's secret key
+        :type secret_key: str
+        :param params: dict with data for request
+        :type params: str
+        :param proxies: dict with proxy
+        :type proxies: dict
+        :param priority: PRIORITY_CRITICAL, PRIORITY_TRADE or PRIORITY_READ (derived from the request if None)
+        :type priority: int
+        :param droppable: a read may be dropped when its group has no budget within read_max_wait, False waits
+            for the budget (reads the strategies can not go without)
+        :type droppable: bool
+        :return: dict with data
+        """
+        group = endpoint_group(url)
+        if priority is None:
+            priority = request_priority(method, url, params)
+        started = time.perf_counter()
+        try:
+            if not await self._acquire(group, priority, droppable):
+                response = self.scheduler.dropped_response(group)
+                observe_request(url, time.perf_counter() - started, response)
+                return response
+            response = await self._send_command(method, url, secret_key, params, proxies)
+            if isinstance(response, dict) and response.get('ret_code') == TIMESTAMP_ERROR_CODE and \
+                    'timestamp' in params:
+                log_error.error(f"timestamp rejected by exchange: {response.get('ret_msg')}")
+                observe_retry(url, 'timestamp')
+                await asyncio.to_thread(self.clock.request_resync)
+                params = dict(params, timestamp=await self.get_timestamp(self.proxy))
+                response = await self._send_command(method, url, secret_key, params, proxies)
+            observe_request(url, time.perf_counter() - started, response)
+            return response
+        except Exception as exc:
+            observe_request(url, time.perf_counter() - started, error=exc)
+            raise
+        finally:
+            if method == 'POST':
+                self.snapshots.invalidate()
+
+    async def get_timestamp(self, proxy):
+        """
+        Get timestamp function (the first sync of the process runs in a worker thread)
+        :return: time
+        """
+        if not self.clock.synced:
+            return await asyncio.to_thread(self.clock.timestamp)
+        return self.clock.timestamp()
+
+    async def _signed_data(self, **kwargs):
+        data = {"api_key": self.api_key, "symbol": self.symbol, "timestamp": await self.get_timestamp(self.proxy)}
+        data.update(kwargs)
+        return data
+
+    async def _fetch_snapshot(self, path: str):
+        url = f'{self.base_url}{path}'
+        return await self.go_command('GET', url, self.api_secret, await self._signed_data(), {'http': self.proxy},
+                                     droppable=False)
+
+    async def get_positions_snapshot(self, max_age: float = None):
+        """
+        Function getting positions shared by all tasks within SNAPSHOT_TTL
+        :param max_age: override of ttl (0 forces a new fetch)
+        :type max_age: float
+        :return: response of /private/linear/position/list
+        :rtype: dict
+        """
+        return await self.snapshots.get('positions', lambda: self._fetch_snapshot('/private/linear/position/list'),
+                                        max_age, _is_success)
+
+    async def get_orders_snapshot(self, max_age: float = None):
+        """
+        Function getting active orders shared by all tasks within SNAPSHOT_TTL
+        :param max_age: override of ttl (0 forces a new fetch)
+        :type max_age: float
+        :return: response of /private/linear/order/search
+        :rtype: dict
+        """
+        return await self.snapshots.get('orders', lambda: self._fetch_snapshot('/private/linear/order/search'),
+                                        max_age, _is_success)
+
+    async def _fetch_active_orders(self):
+        response = await self._fetch_snapshot('/private/linear/order/search')
+        if not _is_success(response):
+            return None
+        return response['result'] or []
+
+    async def sync_orders(self, max_age: float = None):
+        """
+        Function reconciling the order manager with the exchange when its state is older than max_age, one task
+        fetches while the others answer from the current state (they wait for the first reconcile only)
+        :param max_age: seconds (OMS_RECONCILE_INTERVAL with the stream connected, OMS_POLL_INTERVAL without it)
+        :type max_age: float
+        :return: True if reconciled
+        :rtype: bool
+        """
+        if max_age is None:
+            connected = self.stream is not None and self.stream.connected
+            max_age = OMS_RECONCILE_INTERVAL if connected else OMS_POLL_INTERVAL
+        if self.orders.age() < max_age:
+            return False
+        if self._sync_lock.locked() and self.orders.reconciled is not None:
+            return False
+        try:
+            async with self._sync_lock:
+                if self.orders.age() < max_age:
+                    return False
+                started = self.orders.clock()
+                infos = await self._fetch_active_orders()
+                if infos is None:
+                    return False
+                self.orders.reconcile(infos, started)
+                return True
+        except Exception as exc:
+            log_error.error(exc)
+            return False
+
+    def _recover_stream_gap(self):
+        # runs in the stream thread, the next awaited query refetches
+        self.snapshots.invalidate()
+        self.orders.expire()
+        self.prices.invalidate_balance()
+        self.updates.notify()
+
+    async def wait_for_update(self, timeout: float):
+        """
+        Function sleeping until a stream update or timeout
+        :param timeout: max seconds to wait
+        :type timeout: float
+        :return: True if woken by an update
+        :rtype: bool
+        """
+        return await asyncio.to_thread(self.updates.wait, timeout)
+
+    async def _fetch_balance(self):
+        url = f'{self.base_url}/v2/private/wallet/balance'
+        try:
+            response_balance = await self.go_command('GET', url, self.api_secret, await self._signed_data(),
+                                                     {'http': self.proxy})
+            balance = response_balance['result']['USDT']['available_balance']
+        except Exception as exc:
+            log_error.error(exc)
+            return None
+        self.prices.set_balance(balance)
+        return float(balance)
+
+    async def _fetch_last_price(self):
+        url = f'{self.base_url}/v2/public/tickers?symbol={self.symbol}'
+        last_price = float((await self._request('GET', url))['result'][0]['last_price'])
+        self.prices.set_last_price(last_price)
+        return last_price
+
+    async def get_params(self):
+        """
+        Function getting sizing params, missing values are requested concurrently and shared by concurrent tasks
+        :return: dict of params:
+            -balance
+            -currency
+        """
+        balance = self.prices.get_balance()
+        currency = self.prices.get_last_price()
+        requests = []
+        if balance is None:
+            requests.append(self.snapshots.get('balance', self._fetch_balance, cacheable=lambda value: False))
+        if currency is None:
+            requests.append(self.snapshots.get('ticker', self._fetch_last_price, cacheable=lambda value: False))
+        results = iter(await asyncio.gather(*requests))
+        if balance is None:
+            balance = next(results)
+            if balance is None:
+                return None
+        if currency is None:
+            currency = next(results)
+        self.balance = balance
+        return {
+            'balance': balance,
+            'currency': currency
+        }
+
+    async def calculate_limit_price(self, direction):
+        limit_price = None
+        while limit_price is None:
+            try:
+                last_price = float((await self.get_params())['currency'])
+                if direction == 'long':
+                    limit_price = last_price - 2
+                else:
+                    limit_price = last_price + 2
+            except Exception as exc:
+                log_error.error(exc)
+                await asyncio.sleep(0.1)
+        return limit_price
+
+    async def find_price(self):
+        return float((await self.get_params())['currency'])
+
+    async def calculate_qty(self, percent: float):
+        """
+        Function calculating qty
+        :param percent: percent
+        :type percent: float
+        :return: qty for limit
+        """
+        param_dict = await self.get_params()
+        if param_dict is None:
+            return 0
+        percents_from_balance = self.percentator(param_dict['balance'], percent)
+        percents_from_balance *= 100
+        value = self.usdt_to_btc(percents_from_balance, param_dict['currency'])
+        return self.my_round(value)
+
+    async def _create_order(self, side: str, order_type: str, qty: float, reduce_only: bool, **kwargs):
+        url = f"{self.base_url}/private/linear/order/create"
+        data = await self._signed_data(side=side, order_type=order_type, qty=qty, time_in_force="GoodTillCancel",
+                                       reduce_only=reduce_only, close_on_trigger=False, **kwargs)
+        if order_type == 'Limit':
+            response = await self._send_limit_order(url, data)
+        else:
+            response = await self.go_command("POST", url, self.api_secret, data, {'http': self.proxy})
+        self._record_order(response, reduce_only)
+        result = response['result']
+        self._log_information(symbol=result['symbol'], side=side, order_type=result['order_type'],
+                              price=result['price'], qty=result['qty'])
+        return result
+
+    async def _send_limit_order(self, url: str, data: dict):
+        """
+        Function sending a limit order create, the order manager holds it as pending until the answer
+        :param url: create url
+        :type url: str
+        :param data: request params (an order_link_id is added)
+        :type data: dict
+        :return: response
+        :rtype: dict
+        """
+        link_id = self.orders.new_link_id()
+        data['order_link_id'] = link_id
+        self.orders.submitted(link_id, data['side'], data['price'], data['qty'], data['reduce_only'])
+        response = None
+        try:
+            response = await self.go_command('POST', url, self.api_secret, data, {'http': self.proxy})
+            return response
+        finally:
+            self.orders.created(link_id, response)
+
+    async def post_market_order(self, direction: str, percent: float):
+        """
+        Function post market order
+        :param direction: long or short
+        :type direction: str
+        :param percent: percent
+        :type percent: float
+        :return: None
+        """
+        try:
+            self.qty_market = await self.calculate_qty(percent=percent)
+        except Exception as exc:
+            log_error.error(exc)
+            self.qty_market = 0
+        try:
+            await self._create_order("Buy" if direction == 'long' else "Sell", "Market", self.qty_market, False)
+        except Exception as exc:
+            log_error.error(exc)
+
+    async def get_order_id(self, direction: str):
+        """
+        Function found open order id
+        :param direction: long or short
+        :type direction: str
+        :return: order_id
+        :rtype: str
+        """
+        url = f'{self.base_url}/private/linear/trade/execution/list'
+        response_history = await self.go_command('GET', url, self.api_secret, await self._signed_data(limit=200),
+                                                 {'http': f'http://{self.proxy}'}, droppable=False)
+        side = 'Buy' if direction == 'long' else 'Sell'
+        for info in response_history['result']['data']:
+            if info['side'] == side and float(info['closed_size']) == float(0):
+                return info['order_id']
+
+    async def post_limit_order(self, percent_limit: float, limit_price: float, direction: str,
+                               reduce_only: bool, take_profit=None):
+        """
+        Function post limit orders
+        :param percent_limit: percent fo limit order
+        :rtype percent_limit: float
+        :param limit_price: price for limit
+        :rtype limit_price: float
+        :param direction: long or short
+        :rtype direction: str
+        :param reduce_only: open or close order (True or False)
+        :type reduce_only: bool
+        :return: qty of the created order
+        """
+        try:
+            if reduce_only is False:
+                try:
+                    qty_limit = await self.calculate_qty(percent_limit)
+                except Exception as exc:
+                    log_error.error(exc)
+                    qty_limit = 0
+            else:
+                try:
+                    qty_market = await self.get_market_qty(direction, reduce_only)
+                    qty_limit = self.round_limit_orders(float(qty_market * percent_limit / 100))
+                except Exception as exc:
+                    log_error.error(exc)
+                    qty_limit = 0
+            kwargs = {'price': limit_price}
+            if take_profit is not None:
+                kwargs['take_profit'] = take_profit
+            result = await self._create_order("Buy" if direction == 'long' else "Sell", "Limit", qty_limit,
+                                              reduce_only, **kwargs)
+            return result['qty']
+        except Exception as exc:
+            log_error.error(exc)
+
+    async def post_limit_orders(self, orders: list):
+        """
+        Function posting a ladder of limit orders concurrently
+        :param orders: list of dicts with post_limit_order params
+        :type orders: list
+        :return: list of created qty in the order of the ladder
+        :rtype: list
+        """
+        return await asyncio.gather(*[self.post_limit_order(**order) for order in orders])
+
+    async def _cancel_order(self, order_id: str):
+        url = f"{self.base_url}/private/linear/order/cancel"
+        try:
+            response = await self.go_command("POST", url, self.api_secret, await self._signed_data(order_id=order_id),
+                                              {'http': self.proxy})
+            return _is_success(response)
+        except Exception as exc:
+            log_error.error(exc)
+            return False
+
+    async def _cancel_all_orders(self, list_orders: list):
+        url = f"{self.base_url}/private/linear/order/cancel-all"
+        response = await self.go_command("POST", url, self.api_secret, await self._signed_data(), {'http': self.proxy})
+        cancelled = set(response['result']) if _is_success(response) and response['result'] else set()
+        return {order_id: order_id in cancelled for order_id in list_orders}
+
+    async def _covers_all_orders(self, list_orders: list):
+        # coroutines of the loop interleave at every request, see BotTrader.serialized_writes
+        if not self.serialized_writes or len(set(list_orders)) < CANCEL_ALL_MIN_ORDERS:
+            return False
+        started = self.orders.clock()
+        response = await self.get_orders_snapshot(max_age=0)
+        if not _is_success(response):
+            return False
+        self.orders.reconcile(response['result'] or [], started)
+        return set(list_orders) == {dict_info['order_id'] for dict_info in response['result']}
+
+    async def del_limit_order(self, direction: str, reduce_only: bool, list_orders=None):
+        """
+        Function del limit orders in one batch: cancel-all if the writes of the account are serialized and
+        the batch is every active order of the symbol, otherwise all cancels by id sent concurrently
+        :param direction: long or short
+        :type direction: str
+        :param reduce_only: True or False (open or close limite order)
+        :type direction: bool
+        :param list_orders: order ids (open orders of direction and reduce_only if None)
+        :type list_orders: list
+        :return: dict order_id - True if cancelled
+        :rtype: dict
+        """
+        try:
+            if list_orders is None:
+                list_orders = await self.get_limit_orders_by_del(direction, reduce_only)
+            if not list_orders:
+                return {}
+            covers_all = await self._covers_all_orders(list_orders)
+            self.orders.cancel_requested(list_orders)
+            if covers_all:
+                results = await self._cancel_all_orders(list_orders)
+            else:
+                done = await asyncio.gather(*[self._cancel_order(order_id) for order_id in list_orders])
+                results = dict(zip(list_orders, done))
+            self._apply_cancelled(results)
+            return results
+        except Exception as exc:
+            log_error.error(exc)
+            return {}
+
+    async def get_info_open_limit_orders(self, direction: str, reduce_only: bool):
+        """
+        Function getting open limit orders from the order manager
+        :param direction: Buy or Sell
+        :type direction: str
+        :param reduce_only: open or close orders (True or False)
+        :type reduce_only: bool
+        :return: [(order_id, price, qty), ...]
+        :rtype: list
+        """
+        await self.sync_orders()
+        return [(order.order_id, order.price, order.qty) for order in self.orders.open_orders(direction, reduce_only)]
+
+    async def get_price_last_draw_limit_order(self, direction: str, reduce_only: bool):
+        list_order_limit = sorted(await self.get_info_open_limit_orders(direction, reduce_only), key=lambda x: x[1])
+        if direction == "Sell":
+            return list_order_limit[-1][1]
+        else:
+            return list_order_limit[0][1]
+
+    async def get_limit_orders_by_del(self, direction: str, reduce_only: bool):
+        """
+        Function get the ids of open limit orders
+        :param direction: Buy or Sell
+        :type direction: str
+        :param reduce_only: open or close orders (True or False)
+        :type reduce_only: bool
+        :return: order ids
+        :rtype: list
+        """
+        await self.sync_orders()
+        return [order.order_id for order in self.orders.open_orders(direction, reduce_only)]
+
+    async def put_stop_loss(self, stop_loss: int, side: str):
+        """
+        Function put stop loss
+        :param stop_loss: value stop loss
+        :type stop_loss: int
+        :param side: long or short
+        :type side: str
+        :return: None
+        """
+        try:
+            url = f"{self.base_url}/private/linear/position/trading-stop"
+            data = await self._signed_data(side=side, stop_loss=stop_loss)
+            response = await self.go_command("POST", url, self.api_secret, data, {'http': self.proxy})
+            if self.journal is not None and _is_success(response):
+                self.journal.record(self.account, self.symbol, 'stop_loss', side=side, price=stop_loss)
+        except Exception as exc:
+            log_error.error(exc)
+
+    async def get_market_qty(self, direction: str, reduce_only: bool):
+        """
+        Function getting market qty
+        :param direction: long or short
+        :type direction: str
+        :return: qty market position
+        :rtype: float
+        """
+        response = await self.get_positions_snapshot()
+        if reduce_only is True:
+            try:
+                return float(response['result'][1 if direction == 'long' else 0]['size'])
+            except Exception:
+                return 0
+        return float(response['result'][0 if direction == 'long' else 1]['size'])
+
+    async def get_market_entry_price(self, direction: str):
+        while True:
+            try:
+                response = await self.get_positions_snapshot()
+                return float(response['result'][0 if direction == 'long' else 1]['entry_price'])
+            except Exception as exc:
+                await asyncio.sleep(0.1)
+                log_error.error(exc)
+
+    async def market_all(self, side: str):
+        """
+        Function close position orders
+        :param side: Buy or Sell
+        :type side: str
+        :return: None
+        """
+        try:
+            response, order_id_link = await asyncio.gather(
+                self.get_positions_snapshot(max_age=0), self.get_order_id('long' if side == 'Buy' else 'short'))
+            if side == 'Buy':
+                await self._create_order("Sell", "Market", float(response['result'][0]['size']), True,
+                                         order_link_id=order_id_link)
+            else:
+                await self._create_order("Buy", "Market", float(response['result'][1]['size']), True,
+                                         order_link_id=order_id_link)
+        except Exception as exc:
+            log_error.error(exc)
+
+    async def get_qty_limits_order(self, side):
+        """
+        Function get count of open limit orders
+        :param side: Buy or Sell
+        :type side: str
+        :return: count
+        :rtype: int
+        """
+        orders = await self.get_info_open_limit_orders(side, False)
+        return None if orders is None else len(orders)
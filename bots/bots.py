@@ -4,43 +4,74 @@ import hashlib
 import hmac
 import logging
 import math
+import os
 from urllib.parse import quote_plus
-import urllib3
 from json import loads, dumps
 from bots.settings import *
-import requests
+from bots.httpClient import HttpClient
+from bots.clockSync import ClockSync
+from bots.accountSnapshot import SnapshotCache
+from bots.stream import BybitStream, UpdateNotifier
+from bots.priceBalance import PriceBalanceProvider
+from bots.indicators import IndicatorEngine, interval_seconds
+from bots.marketArchive import MarketArchive, request_klines
+from bots.orderManager import OrderManager
+from bots.rateLimiter import RequestScheduler, endpoint_group, request_priority
+from bots.metrics import observe_request, observe_retry, LoopTimer
+from bots.logQueue import setup_logging
 from math import floor
 import pandas as pd
-from time import sleep
+from time import sleep, perf_counter
 import time
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 
 log_debug = logging.getLogger('bots_debug')
 log_info = logging.getLogger('bots_info')
 log_error = logging.getLogger('bots_error')
 
-file_handler_debug = logging.FileHandler(filename='logs/bots.log')
-file_handler_debug.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s', datefmt='%d-%m-%Y %H:%M'))
-file_handler_debug.setLevel(logging.DEBUG)
-log_debug.addHandler(file_handler_debug)
-log_debug.setLevel(logging.DEBUG)
+setup_logging()
 
-file_handler_info = logging.FileHandler(filename='logs/bots.log')
-file_handler_info.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s', datefmt='%d-%m-%Y %H:%M'))
-file_handler_info.setLevel(logging.INFO)
-log_info.addHandler(file_handler_info)
-log_info.setLevel(logging.INFO)
 
-file_handler_error = logging.FileHandler(filename='logs/bots.log')
-file_handler_error.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s', datefmt='%d-%m-%Y %H:%M'))
-file_handler_error.setLevel(logging.ERROR)
-log_error.addHandler(file_handler_error)
-log_error.setLevel(logging.ERROR)
+def _is_success(response):
+    return isinstance(response, dict) and response.get('ret_code') == 0
+
+
+def _merge_positions(response: dict, updates: list):
+    """
+    Function patching a position/list response with stream updates
+    :return: patched response or None if an update has no matching position
+    """
+    positions = list(response['result'])
+    for update in updates:
+        for index, position in enumerate(positions):
+            if position.get('symbol', update.get('symbol')) == update.get('symbol') and \
+                    position.get('side') == update.get('side'):
+                positions[index] = dict(position, **update)
+                break
+        else:
+            return None
+    return dict(response, result=positions)
+
+
+def _merge_orders(response: dict, updates: list):
+    """
+    Function patching an order/search response with stream updates
+    :return: patched response
+    """
+    orders = {order['order_id']: order for order in response['result']}
+    for update in updates:
+        if update.get('order_status') in ACTIVE_ORDER_STATUSES:
+            orders[update['order_id']] = dict(orders.get(update['order_id'], {}), **update)
+        else:
+            orders.pop(update['order_id'], None)
+    return dict(response, result=list(orders.values()))
 
 
 class BotBybit:
 
-    def __init__(self, api_key: str, api_secret: str, mode: str):
+    def __init__(self, api_key: str, api_secret: str, mode: str, http_client: HttpClient = None,
+                 base_url: str = None, clock: ClockSync = None):
         """
         Initializing the parent bot
         :param api_key: api account key
@@ -49,15 +80,28 @@ class BotBybit:
         :type api_secret: str
         :param mode: mode work (testnet or Mainenet)
         :type mode: str
+        :param http_client: keep-alive client (a new pool is created if None)
+        :type http_client: HttpClient
+        :param base_url: REST url (https://{mode}.bybit.com if None, a local fake exchange in tests)
+        :type base_url: str
+        :param clock: server clock estimator shared with other bots (a new one if None)
+        :type clock: ClockSync
         :return: None
         """
         self.api_key = api_key
         self.api_secret = api_secret
         self.mode = mode
+        self.base_url = base_url if base_url is not None else f'https://{mode}.bybit.com'
+        self.proxy = None
+        self.http = http_client if http_client is not None else HttpClient()
+        self.clock = clock if clock is not None else ClockSync(self._fetch_server_time)
+        self.scheduler = RequestScheduler()
 
-    def go_command(self, method: str, url: str, secret_key: str, params: dict, proxies: dict):
+    def go_command(self, method: str, url: str, secret_key: str, params: dict, proxies: dict, priority: int = None,
+                   droppable: bool = True):
         """
-        Function creating a request
+        Function creating a request through the rate limit scheduler
+        (resigned once with a fresh timestamp if the exchange rejects it)
         :param method: GET or POST
         :type method: str
         :param url: url bybit
@@ -68,8 +112,54 @@ class BotBybit:
         :type params: str
         :param proxies: dict with proxy
         :type proxies: dict
+        :param priority: PRIORITY_CRITICAL, PRIORITY_TRADE or PRIORITY_READ (derived from the request if None)
+        :type priority: int
+        :param droppable: a read may be dropped when its group has no budget within read_max_wait, False waits
+            for the budget (reads the strategies can not go without)
+        :type droppable: bool
         :return: dict with data
         """
+        group = endpoint_group(url)
+        if priority is None:
+            priority = request_priority(method, url, params)
+        key = None
+        if priority == PRIORITY_READ:
+            key = (method, url, tuple(sorted((k, str(v)) for k, v in params.items() if k != 'timestamp')))
+
+        def send():
+            response = self._send_command(method, url, secret_key, params, proxies)
+            if isinstance(response, dict) and response.get('ret_code') == TIMESTAMP_ERROR_CODE and \
+                    'timestamp' in params:
+                log_error.error(f"timestamp rejected by exchange: {response.get('ret_msg')}")
+                observe_retry(url, 'timestamp')
+                self.clock.request_resync()
+                response = self._send_command(method, url, secret_key, dict(params, timestamp=self.clock.timestamp()),
+                                              proxies)
+            return response
+
+        started = perf_counter()
+        try:
+            response = self.scheduler.run(group, priority, send, key, droppable)
+        except Exception as exc:
+            observe_request(url, perf_counter() - started, error=exc)
+            raise
+        observe_request(url, perf_counter() - started, response)
+        return response
+
+    def _prepare_request(self, method: str, url: str, secret_key: str, params: dict):
+        """
+        Function signing a request
+        :param method: GET or POST
+        :type method: str
+        :param url: url bybit
+        :type url: str
+        :param secret_key: client's secret key
+        :type secret_key: str
+        :param params: dict with data for request
+        :type params: str
+        :return: (url with query, body, headers)
+        :rtype: tuple
+        """
 
         # Create the param str
         param_str = ""
@@ -98,45 +188,144 @@ class BotBybit:
         # Request information
         if "spot" in url or method == "GET":
             headers = {"Content-Type": "application/x-www-form-urlencoded"}
-            body = None
-        else:
-            headers = {"Content-Type": "application/json"}
-            body = dict(params, **sign_real)
-
-        urllib3.disable_warnings()
-        s = requests.session()
-        s.keep_alive = False
-
-        # Send the request(s)
+            return f"{url}?{full_param_str}", None, headers
+        headers = {"Content-Type": "application/json"}
+        return url, dumps(dict(params, **sign_real)), headers
 
+    def _send_command(self, method: str, url: str, secret_key: str, params: dict, proxies: dict):
+        """
+        Function signing and sending a request
+        :param method: GET or POST
+        :type method: str
+        :param url: url bybit
+        :type url: str
+        :param secret_key: client's secret key
+        :type secret_key: str
+        :param params: dict with data for request
+        :type params: str
+        :param proxies: dict with proxy
+        :type proxies: dict
+        :return: dict with data
+        """
+        request_url, body, headers = self._prepare_request(method, url, secret_key, params)
+        # Send the request(s) through the keep-alive pool
         if "spot" in url:
             # Send a request to the spot API
-            response = requests.request(method, f"{url}?{full_param_str}",
-                                        headers=headers, verify=False)
+            response = self.http.request(method, request_url, headers=headers)
         else:
             # Send a request to the futures API
-            if method == "POST":
-                response = requests.request(method, url, data=dumps(body),
-                                            headers=headers, verify=False, proxies=proxies)
-            else:  # GET
-                response = requests.request(method, f"{url}?{full_param_str}",
-                                            headers=headers, verify=False, proxies=proxies)
+            response = self.http.request(method, request_url, data=body, headers=headers, proxies=proxies)
 
-        return loads(response.text)
+        result = loads(response.text)
+        self.scheduler.update(endpoint_group(url), response.headers, result)
+        return result
+
+    def _fetch_server_time(self):
+        """
+        Function requesting exchange time
+        :return: time (seconds)
+        :rtype: float
+        """
+        resp = self.http.request('GET', url=f'{self.base_url}/v2/public/time',
+                                 proxies={'http': self.proxy})
+        return float(loads(resp.text)['time_now'])
 
     def get_timestamp(self, proxy):
         """
-        Get timestamp function
+        Get timestamp function (local clock corrected by the synced server offset, no network call)
         :return: time
         """
-        resp = requests.request('GET', url=f'https://{self.mode}.bybit.com/v2/public/time', proxies={'http': proxy})
-        server_time = int(float(loads(resp.text)['time_now']) * 1000)
-        return server_time
+        return self.clock.timestamp()
+
+    def get_connection_stats(self):
+        """
+        Function getting keep-alive reuse stats of the bot's pool
+        :return: dict of stats (requests, connections, reused, hosts)
+        """
+        return self.http.get_stats()
+
+
+class BotAnalyst(BotBybit):
+
+    def __init__(self, api_key: str, api_secret: str, mode: str, symbol: str, interval, proxy: str,
+                 ma_window: int = INDICATOR_MA_WINDOW, ema_window: int = INDICATOR_EMA_WINDOW,
+                 engine: IndicatorEngine = None, http_client: HttpClient = None, base_url: str = None,
+                 archive: MarketArchive = None):
+        """
+        Initializing the market analyst bot
+        :param api_key: api account key
+        :type api_key: str
+        :param api_secret: api account secret key
+        :type api_secret: str
+        :param mode: mode work (testnet or Mainenet)
+        :type mode: str
+        :param symbol: symbol instrument
+        :type symbol: str
+        :param interval: kline interval (minutes, D, W or M)
+        :param proxy: proxy
+        :type proxy: str
+        :param ma_window: candles of the MA
+        :type ma_window: int
+        :param ema_window: candles of the EMA
+        :type ema_window: int
+        :param engine: indicator engine shared by analysts (a new one is created if None)
+        :type engine: IndicatorEngine
+        :param http_client: keep-alive client (a new pool is created if None)
+        :type http_client: HttpClient
+        :param base_url: REST url (https://{mode}.bybit.com if None)
+        :type base_url: str
+        :param archive: local kline history (ARCHIVE_DIR if None)
+        :type archive: MarketArchive
+        :return: None
+        """
+        super().__init__(api_key, api_secret, mode, http_client, base_url)
+        self.symbol = symbol
+        self.interval = interval
+        self.proxy = proxy
+        self.ma_window = ma_window
+        self.ema_window = ema_window
+        self.archive = archive if archive is not None else MarketArchive()
+        self.indicators = engine if engine is not None else IndicatorEngine(self.get_klines, mode,
+                                                                             archive=self.archive)
+        self.indicators.register(symbol, interval, ma_windows=(ma_window,), ema_windows=(ema_window,))
+
+    def get_klines(self, symbol: str, interval, limit: int):
+        """
+        Function getting the last klines from the archive, only the candles it misses are requested
+        :param symbol: symbol instrument
+        :type symbol: str
+        :param interval: kline interval
+        :param limit: number of candles
+        :type limit: int
+        :return: [(open time, close), ...] from the oldest
+        :rtype: list
+        """
+        series = self.archive.klines(symbol, interval)
+        step = interval_seconds(interval)
+        since = int(time.time()) // step * step - step * (limit - 1)
+        last = series.last_time()
+        if last is not None and last >= since - step * ARCHIVE_FILL_LIMIT:
+            # the last stored candle may have been open, it is requested again
+            since = last
+        series.update(lambda start, count: request_klines(self.http, self.base_url, symbol, interval, start, count,
+                                                          {'http': self.proxy}), since, step)
+        return series.closes(limit)
+
+    def getCurrentMaEma(self):
+        """
+        Function getting current MA and EMA (no history request after the first one)
+        :return: (ma, ema)
+        :rtype: tuple
+        """
+        self.indicators.start()
+        series = self.indicators.get(self.symbol, self.interval)
+        return series.ma(self.ma_window), series.ema(self.ema_window)
 
 
 class BotTrader(BotBybit):
 
-    def __init__(self, api_key: str, api_secret: str, mode: str, symbol: str, proxy: str, interval: int):
+    def __init__(self, api_key: str, api_secret: str, mode: str, symbol: str, proxy: str, interval: int,
+                 http_client: HttpClient = None, base_url: str = None, clock: ClockSync = None):
         """
         Initializing the parent bot
         :param api_key: api account key
@@ -151,14 +340,212 @@ class BotTrader(BotBybit):
         :type proxy: str
         :param interval: interval trading (minutes)
         :type proxy: int
+        :param http_client: keep-alive client (a new pool is created if None)
+        :type http_client: HttpClient
+        :param base_url: REST url (https://{mode}.bybit.com if None)
+        :type base_url: str
+        :param clock: server clock estimator shared with other bots (a new one if None)
+        :type clock: ClockSync
         :return: None
         """
-        super().__init__(api_key, api_secret, mode)
+        super().__init__(api_key, api_secret, mode, http_client, base_url, clock)
         self.symbol = symbol
         self.proxy = proxy
         self.qty_market = 0
-        self.list_order_limit_by_del = []
         self.interval = interval
+        self.snapshots = SnapshotCache()
+        self.orders = OrderManager(symbol)
+        self.prices = PriceBalanceProvider()
+        # fills the stream did not deliver change the balance too
+        self.orders.on_missed = self.prices.invalidate_balance
+        self.updates = UpdateNotifier()
+        self.stream = None
+        self._stream_pid = None
+        self.journal = None  # TradeJournal recording orders, cancels and fills (nothing is recorded if None)
+        self.account = JOURNAL_ACCOUNT  # name of the account in the journal (username of the users table)
+        # set by the owner running every order write of the account one by one (OrderGateway, AccountSession),
+        # cancel-all can wipe an order another writer posts after the check otherwise
+        self.serialized_writes = False
+
+    def go_command(self, method: str, url: str, secret_key: str, params: dict, proxies: dict, priority: int = None,
+                   droppable: bool = True):
+        """
+        Function creating a request, every order create / cancel / stop update drops the account snapshots
+        :param method: GET or POST
+        :type method: str
+        :param url: url bybit
+        :type url: str
+        :param secret_key: client's secret key
+        :type secret_key: str
+        :param params: dict with data for request
+        :type params: str
+        :param proxies: dict with proxy
+        :type proxies: dict
+        :param priority: priority class (derived from the request if None)
+        :type priority: int
+        :param droppable: a read may be dropped when its group has no budget within read_max_wait, False waits
+            for the budget (reads the strategies can not go without)
+        :type droppable: bool
+        :return: dict with data
+        """
+        try:
+            return super().go_command(method, url, secret_key, params, proxies, priority, droppable)
+        finally:
+            if method == 'POST':
+                self.snapshots.invalidate()
+
+    def _fetch_snapshot(self, path: str):
+        """
+        Function requesting an account snapshot
+        :param path: endpoint path
+        :type path: str
+        :return: dict with data
+        """
+        url = f'{self.base_url}{path}'
+        data = {"api_key": self.api_key, "symbol": self.symbol, "timestamp": self.get_timestamp(self.proxy)}
+        # positions and orders size every decision of the strategies, they wait for the budget
+        return self.go_command('GET', url, self.api_secret, data, {'http': self.proxy}, droppable=False)
+
+    def get_positions_snapshot(self, max_age: float = None):
+        """
+        Function getting positions shared by all callers within SNAPSHOT_TTL
+        :param max_age: override of ttl (0 forces a new fetch)
+        :type max_age: float
+        :return: response of /private/linear/position/list
+        :rtype: dict
+        """
+        return self.snapshots.get('positions', lambda: self._fetch_snapshot('/private/linear/position/list'),
+                                  max_age, _is_success)
+
+    def get_orders_snapshot(self, max_age: float = None):
+        """
+        Function getting active orders shared by all callers within SNAPSHOT_TTL
+        :param max_age: override of ttl (0 forces a new fetch)
+        :type max_age: float
+        :return: response of /private/linear/order/search
+        :rtype: dict
+        """
+        return self.snapshots.get('orders', lambda: self._fetch_snapshot('/private/linear/order/search'),
+                                  max_age, _is_success)
+
+    def start_stream(self, url: str = None):
+        """
+        Function starting the private stream of the current process
+        :param url: websocket url (PRIVATE_STREAM_URLS[mode] if None, a local stand-in in tests)
+        :type url: str
+        :return: None
+        """
+        if self._stream_pid == os.getpid():
+            return
+        url = url if url is not None else PRIVATE_STREAM_URLS[self.mode]
+        self.stream = BybitStream(url, PRIVATE_STREAM_TOPICS, self._on_stream_message, self._recover_stream_gap,
+                                  self.api_key, self.api_secret)
+        self._stream_pid = os.getpid()
+        self.stream.start()
+
+    def stop_stream(self):
+        """
+        Function stopping the private stream
+        :return: None
+        """
+        if self.stream is not None and self._stream_pid == os.getpid():
+            self.stream.stop()
+        self.stream = None
+        self._stream_pid = None
+
+    def _on_stream_message(self, topic: str, message: dict):
+        """
+        Function applying a private stream update to the snapshots and waking the strategy loops
+        :param topic: position, order or execution
+        :type topic: str
+        :param message: stream message
+        :type message: dict
+        :return: None
+        """
+        data = [info for info in message['data'] if info.get('symbol', self.symbol) == self.symbol]
+        if len(data) == 0:
+            return
+        if topic == 'position':
+            if not self.snapshots.update('positions', lambda response: _merge_positions(response, data)):
+                self.snapshots.invalidate('positions')
+        elif topic == 'order':
+            self.orders.apply_updates(data)
+            if not self.snapshots.update('orders', lambda response: _merge_orders(response, data)):
+                self.snapshots.invalidate('orders')
+        elif topic == 'execution':
+            self.snapshots.invalidate('positions')
+            self.prices.invalidate_balance()
+            if self.journal is not None:
+                for info in data:
+                    self.journal.record(self.account, self.symbol, 'execution', info.get('order_id'),
+                                        info.get('side'), info.get('order_type'), info.get('price'),
+                                        info.get('exec_qty'), details=info)
+        elif topic == 'wallet':
+            self.prices.set_balance(data[-1]['available_balance'])
+        self.updates.notify()
+
+    def _recover_stream_gap(self):
+        """
+        Function reloading the snapshots after a (re)connect, updates may have been missed while disconnected
+        :return: None
+        """
+        self.snapshots.invalidate()
+        self.orders.expire()
+        self.prices.invalidate_balance()
+        try:
+            self.get_positions_snapshot(max_age=0)
+            self.sync_orders()
+        except Exception as exc:
+            log_error.error(exc)
+        self.updates.notify()
+
+    def _fetch_active_orders(self):
+        response = self._fetch_snapshot('/private/linear/order/search')
+        if not _is_success(response):
+            return None
+        return response['result'] or []
+
+    def sync_orders(self, max_age: float = None):
+        """
+        Function reconciling the order manager with the exchange when its state is older than max_age
+        :param max_age: seconds (OMS_RECONCILE_INTERVAL with the stream connected, OMS_POLL_INTERVAL without it)
+        :type max_age: float
+        :return: True if reconciled
+        :rtype: bool
+        """
+        if max_age is None:
+            connected = self.stream is not None and self.stream.connected
+            max_age = OMS_RECONCILE_INTERVAL if connected else OMS_POLL_INTERVAL
+        try:
+            return self.orders.sync(self._fetch_active_orders, max_age)
+        except Exception as exc:
+            log_error.error(exc)
+            return False
+
+    def wait_for_update(self, timeout: float):
+        """
+        Function sleeping until a stream update or timeout (a plain sleep without the stream)
+        :param timeout: max seconds to wait
+        :type timeout: float
+        :return: True if woken by an update
+        :rtype: bool
+        """
+        return self.updates.wait(timeout)
+
+    def _record_order(self, response: dict, reduce_only: bool):
+        """
+        Function recording a created order in the trade journal
+        :param response: response of /private/linear/order/create
+        :type response: dict
+        :param reduce_only: open or close order (True or False)
+        :type reduce_only: bool
+        :return: None
+        """
+        if self.journal is None or not _is_success(response):
+            return
+        result = response['result']
+        self.journal.record(self.account, self.symbol, 'order', result.get('order_id'), result.get('side'),
+                            result.get('order_type'), result.get('price'), result.get('qty'), reduce_only)
 
     def _log_information(self, **kwargs):
         """
@@ -177,37 +564,56 @@ class BotTrader(BotBybit):
 
     def get_params(self):
         """
+        Function getting sizing params, the exchange is asked only for values the provider has not cached
         :return: dict of params:
             -balance
             -currency
-            -balance in usd
+        """
+        balance = self.prices.get_balance()
+        if balance is None:
+            balance = self._fetch_balance()
+            if balance is None:
+                return None
+        currency = self.prices.get_last_price()
+        if currency is None:
+            currency = self._fetch_last_price()
+        self.balance = balance
+        data_dict = {
+            'balance': balance,
+            'currency': currency
+        }
+        return data_dict
+
+    def _fetch_balance(self):
+        """
+        Function requesting the available balance
+        :return: balance or None on error
+        :rtype: float
         """
         method = 'GET'
-        url = f'https://{self.mode}.bybit.com/v2/private/wallet/balance'
+        url = f'{self.base_url}/v2/private/wallet/balance'
         data = {"api_key": self.api_key, "symbol": self.symbol, "timestamp": self.get_timestamp(proxy=self.proxy)}
         try:
             response_balance = self.go_command(method, url, self.api_secret, data, {'http': self.proxy})
-        except  Exception as exc:
-            log_error.error(exc)
-            return None
-        try:
-            self.balance = response_balance['result']['USDT']['available_balance']
+            balance = response_balance['result']['USDT']['available_balance']
         except Exception as exc:
             log_error.error(exc)
             return None
-        now = datetime.datetime.utcnow()
-        unixtime = calendar.timegm(now.utctimetuple())
-        since = unixtime - self.interval * 60 * 200
-        method = 'GET'
-        url = f'https://{self.mode}.bybit.com/public/linear/kline?symbol={self.symbol}&interval={self.interval}&from={since}'
-        response_currency = loads(requests.request(method, url, verify=False, proxies={'http': self.proxy}).text)
-        currency = response_currency['result'][-1]['close']
-        data_dict = {
-            'balance': self.balance,
-            'currency': currency
-        }
-        return data_dict
-    
+        self.prices.set_balance(balance)
+        return float(balance)
+
+    def _fetch_last_price(self):
+        """
+        Function requesting the last price from the ticker
+        :return: last price
+        :rtype: float
+        """
+        url = f'{self.base_url}/v2/public/tickers?symbol={self.symbol}'
+        response_ticker = loads(self.http.request('GET', url, proxies={'http': self.proxy}).text)
+        last_price = float(response_ticker['result'][0]['last_price'])
+        self.prices.set_last_price(last_price)
+        return last_price
+
     def calculate_limit_price(self, direction):
         limit_price = None
         while limit_price is None:
@@ -257,13 +663,14 @@ class BotTrader(BotBybit):
             self.qty_market = 0
         try:
             method = "POST"
-            url = f"https://{self.mode}.bybit.com/private/linear/order/create"
+            url = f"{self.base_url}/private/linear/order/create"
             if direction == 'long':
                 data = {"api_key": self.api_key, "side": "Buy", "symbol": self.symbol,
                         "order_type": "Market", "qty": self.qty_market,
                         "time_in_force": "GoodTillCancel", "timestamp": self.get_timestamp(self.proxy),
                         "reduce_only": False, "close_on_trigger": False}
                 response = self.go_command(method, url, self.api_secret, data, {'http': self.proxy})
+                self._record_order(response, False)
                 result = response['result']
                 information_log = dict(symbol=result['symbol'], side='Buy', order_type=result['order_type'],
                                        price=result['price'],
@@ -274,6 +681,7 @@ class BotTrader(BotBybit):
                         "time_in_force": "GoodTillCancel", "timestamp": self.get_timestamp(self.proxy),
                         "reduce_only": False, "close_on_trigger": False}
                 response = self.go_command(method, url, self.api_secret, data, {'http': self.proxy})
+                self._record_order(response, False)
                 result = response['result']
                 information_log = dict(symbol=result['symbol'], side='Sell', order_type=result['order_type'],
                                        price=result['price'],
@@ -302,13 +710,14 @@ class BotTrader(BotBybit):
         :return: order_id
         :rtype: str
         """
-        url = f'https://{self.mode}.bybit.com/private/linear/trade/execution/list'
+        url = f'{self.base_url}/private/linear/trade/execution/list'
         method = 'GET'
         data = {"api_key": self.api_key, "symbol": self.symbol,
                 "timestamp": self.get_timestamp(proxy={'http': f'http://{self.proxy}'}),
                 'limit': 200}
 
-        response_history = self.go_command(method, url, self.api_secret, data, {'http': f'http://{self.proxy}'})
+        response_history = self.go_command(method, url, self.api_secret, data, {'http': f'http://{self.proxy}'},
+                                           droppable=False)
         for info in response_history['result']['data']:
             if direction == 'long':
                 if info['side'] == 'Buy' and float(info['closed_size']) == float(0):
@@ -348,8 +757,7 @@ class BotTrader(BotBybit):
                 except Exception as exc:
                     log_error.error(exc)
                     qty_limit = 0
-            method = "POST"
-            url = f"https://{self.mode}.bybit.com/private/linear/order/create"
+            url = f"{self.base_url}/private/linear/order/create"
             if direction == 'long':
                 data = {"api_key": self.api_key, "side": "Buy", "symbol": self.symbol,
                         "order_type": "Limit", "qty": qty_limit, 'price': limit_price,
@@ -357,7 +765,8 @@ class BotTrader(BotBybit):
                         "reduce_only": reduce_only, "close_on_trigger": False}
                 if take_profit is not None:
                     data['take_profit'] = take_profit
-                response = self.go_command(method, url, self.api_secret, data, {'http': self.proxy})
+                response = self._send_limit_order(url, data)
+                self._record_order(response, reduce_only)
                 result = response['result']
                 information_log = dict(symbol=result['symbol'], side='Buy', order_type=result['order_type'],
                                        price=result['price'],
@@ -370,7 +779,8 @@ class BotTrader(BotBybit):
                         "reduce_only": reduce_only, "close_on_trigger": False}
                 if take_profit is not None:
                     data['take_profit'] = take_profit
-                response = self.go_command(method, url, self.api_secret, data, {'http': self.proxy})
+                response = self._send_limit_order(url, data)
+                self._record_order(response, reduce_only)
                 result = response['result']
                 information_log = dict(symbol=result['symbol'], side='Sell', order_type=result['order_type'],
                                        price=result['price'],
@@ -380,47 +790,134 @@ class BotTrader(BotBybit):
         except Exception as exc:
             log_error.error(exc)
 
+    def _send_limit_order(self, url: str, data: dict):
+        """
+        Function sending a limit order create, the order manager holds it as pending until the answer
+        :param url: create url
+        :type url: str
+        :param data: request params (an order_link_id is added)
+        :type data: dict
+        :return: response
+        :rtype: dict
+        """
+        link_id = self.orders.new_link_id()
+        data['order_link_id'] = link_id
+        self.orders.submitted(link_id, data['side'], data['price'], data['qty'], data['reduce_only'])
+        response = None
+        try:
+            response = self.go_command('POST', url, self.api_secret, data, {'http': self.proxy})
+            return response
+        finally:
+            self.orders.created(link_id, response)
+
     def del_limit_order(self, direction: str, reduce_only: bool, list_orders=None):
         """
-        Function del limit orders
+        Function del limit orders in one batch: cancel-all if the writes of the account are serialized and
+        the batch is every active order of the symbol, otherwise concurrent cancels by id
         :param direction: long or short
         :type direction: str
         :param reduce_only: True or False (open or close limite order)
         :type direction: bool
-        :return: None
+        :param list_orders: order ids (open orders of direction and reduce_only if None)
+        :type list_orders: list
+        :return: dict order_id - True if cancelled
+        :rtype: dict
         """
-        method = "POST"
-        url = f"https://{self.mode}.bybit.com/private/linear/order/cancel"
-        if list_orders is not None:
-            for order_id in list_orders:
-                data = {"api_key": self.api_key, "symbol": self.symbol,
-                        "order_id": order_id, "timestamp": self.get_timestamp(self.proxy)}
-                resp = self.go_command(method, url, self.api_secret, data, {'http': self.proxy})
-        else:
-            self.get_limit_orders_by_del(direction, reduce_only)
-            try:
-                if self.list_order_limit_by_del is None:
-                    return
-                for order_id in self.list_order_limit_by_del:
-                    data = {"api_key": self.api_key, "symbol": self.symbol,
-                            "order_id": order_id, "timestamp": self.get_timestamp(self.proxy)}
+        try:
+            if list_orders is None:
+                list_orders = self.get_limit_orders_by_del(direction, reduce_only)
+            if not list_orders:
+                return {}
+            covers_all = self._covers_all_orders(list_orders)
+            self.orders.cancel_requested(list_orders)
+            if covers_all:
+                results = self._cancel_all_orders(list_orders)
+            else:
+                with ThreadPoolExecutor(max_workers=min(len(list_orders), HTTP_POOL_MAXSIZE)) as executor:
+                    results = dict(zip(list_orders, executor.map(self._cancel_order, list_orders)))
+            self._apply_cancelled(results)
+            return results
+        except Exception as exc:
+            log_error.error(exc)
+            return {}
 
-                    resp = self.go_command(method, url, self.api_secret, data, {'http': self.proxy})
-            except Exception as exc:
-                log_error.error(exc)
+    def _covers_all_orders(self, list_orders: list):
+        """
+        Function checking on fresh exchange state if a batch is every active order of the symbol
+        :param list_orders: order ids
+        :type list_orders: list
+        :return: True if cancel-all can be used
+        :rtype: bool
+        """
+        if not self.serialized_writes or len(set(list_orders)) < CANCEL_ALL_MIN_ORDERS:
+            return False
+        started = self.orders.clock()
+        response = self.get_orders_snapshot(max_age=0)
+        if not _is_success(response):
+            return False
+        # a fresh view of the exchange, the order manager is reconciled with it too
+        self.orders.reconcile(response['result'] or [], started)
+        return set(list_orders) == {dict_info['order_id'] for dict_info in response['result']}
 
-    def get_info_open_limit_orders(self, direction: str, reduce_only: bool):
-        method = 'GET'
-        url = f'https://{self.mode}.bybit.com/private/linear/order/search'
-        data = {"api_key": self.api_key, "symbol": self.symbol, "timestamp": self.get_timestamp(self.proxy)}
-        response = self.go_command(method, url, self.api_secret, data, {'http': self.proxy})
+    def _cancel_order(self, order_id: str):
+        """
+        Function cancel one order
+        :param order_id: order id
+        :type order_id: str
+        :return: True if cancelled
+        :rtype: bool
+        """
+        url = f"{self.base_url}/private/linear/order/cancel"
+        data = {"api_key": self.api_key, "symbol": self.symbol,
+                "order_id": order_id, "timestamp": self.get_timestamp(self.proxy)}
         try:
-            list_order_limit = [(dict_info['order_id'], dict_info['price'], dict_info['qty'])  for dict_info in response['result'] if
-                                     dict_info['side'] == direction and dict_info['reduce_only'] == reduce_only]
-            return list_order_limit
+            return _is_success(self.go_command("POST", url, self.api_secret, data, {'http': self.proxy}))
         except Exception as exc:
             log_error.error(exc)
-            return None
+            return False
+
+    def _cancel_all_orders(self, list_orders: list):
+        """
+        Function cancel every active order of the symbol with one request
+        :param list_orders: order ids expected to be cancelled
+        :type list_orders: list
+        :return: dict order_id - True if cancelled
+        :rtype: dict
+        """
+        url = f"{self.base_url}/private/linear/order/cancel-all"
+        data = {"api_key": self.api_key, "symbol": self.symbol, "timestamp": self.get_timestamp(self.proxy)}
+        response = self.go_command("POST", url, self.api_secret, data, {'http': self.proxy})
+        cancelled = set(response['result']) if _is_success(response) and response['result'] else set()
+        return {order_id: order_id in cancelled for order_id in list_orders}
+
+    def _apply_cancelled(self, results: dict):
+        """
+        Function applying cancel answers to the local order state in one step
+        :param results: dict order_id - True if cancelled
+        :type results: dict
+        :return: None
+        """
+        self.orders.cancelled(results)
+        cancelled = {order_id for order_id, done in results.items() if done}
+        if len(cancelled) == 0:
+            return
+        if self.journal is not None:
+            for order_id in cancelled:
+                self.journal.record(self.account, self.symbol, 'cancel', order_id)
+        self.snapshots.invalidate('orders')
+
+    def get_info_open_limit_orders(self, direction: str, reduce_only: bool):
+        """
+        Function getting open limit orders from the order manager
+        :param direction: Buy or Sell
+        :type direction: str
+        :param reduce_only: open or close orders (True or False)
+        :type reduce_only: bool
+        :return: [(order_id, price, qty), ...]
+        :rtype: list
+        """
+        self.sync_orders()
+        return [(order.order_id, order.price, order.qty) for order in self.orders.open_orders(direction, reduce_only)]
 
     def get_price_last_draw_limit_order(self, direction: str, reduce_only: bool):
         list_order_limit = self.get_info_open_limit_orders(direction, reduce_only)
@@ -433,21 +930,16 @@ class BotTrader(BotBybit):
 
     def get_limit_orders_by_del(self, direction: str, reduce_only: bool):
         """
-        Function get information about limit orders
-        :param direction: long or short
+        Function get the ids of open limit orders
+        :param direction: Buy or Sell
         :type direction: str
-        :return: None
+        :param reduce_only: open or close orders (True or False)
+        :type reduce_only: bool
+        :return: order ids
+        :rtype: list
         """
-        method = 'GET'
-        url = f'https://{self.mode}.bybit.com/private/linear/order/search'
-        data = {"api_key": self.api_key, "symbol": self.symbol, "timestamp": self.get_timestamp(self.proxy)}
-        response = self.go_command(method, url, self.api_secret, data, {'http': self.proxy})
-        try:
-            self.list_order_limit_by_del = [dict_info['order_id'] for dict_info in response['result'] if
-                                     dict_info['side'] == direction and dict_info['reduce_only'] == reduce_only]
-        except Exception as exc:
-            log_error.error(exc)
-            return None
+        self.sync_orders()
+        return [order.order_id for order in self.orders.open_orders(direction, reduce_only)]
 
     def put_stop_loss(self, stop_loss: int, side: str):
         """
@@ -460,10 +952,12 @@ class BotTrader(BotBybit):
         """
         try:
             method = "POST"
-            url = f"https://{self.mode}.bybit.com/private/linear/position/trading-stop"
+            url = f"{self.base_url}/private/linear/position/trading-stop"
             data = {"api_key": self.api_key, "symbol": self.symbol, 'side': side,
                     "stop_loss": stop_loss, "timestamp": self.get_timestamp(self.proxy)}
             response = self.go_command(method, url, self.api_secret, data, {'http': self.proxy})
+            if self.journal is not None and _is_success(response):
+                self.journal.record(self.account, self.symbol, 'stop_loss', side=side, price=stop_loss)
         except Exception as exc:
             log_error.error(exc)
 
@@ -475,10 +969,7 @@ class BotTrader(BotBybit):
         :return: qty market position
         :rtype: float
         """
-        method = 'GET'
-        url = f'https://{self.mode}.bybit.com/private/linear/position/list'
-        data = {"api_key": self.api_key, "symbol": self.symbol, "timestamp": self.get_timestamp(self.proxy)}
-        response = self.go_command(method, url, self.api_secret, data, {'http': self.proxy})
+        response = self.get_positions_snapshot()
         if direction == 'long' and reduce_only is True:
             try: 
                 return float(response['result'][1]['size'])
@@ -498,10 +989,7 @@ class BotTrader(BotBybit):
         checking = None
         while checking is None:
             try:
-                method = 'GET'
-                url = f'https://{self.mode}.bybit.com/private/linear/position/list'
-                data = {"api_key": self.api_key, "symbol": self.symbol, "timestamp": self.get_timestamp(self.proxy)}
-                response = self.go_command(method, url, self.api_secret, data, {'http': self.proxy})
+                response = self.get_positions_snapshot()
                 if direction == 'long':
                     return float(response['result'][0]['entry_price'])
                 else:
@@ -518,11 +1006,8 @@ class BotTrader(BotBybit):
         :return: None
         """
         try:
-            method = 'GET'
-            url = f'https://{self.mode}.bybit.com/private/linear/position/list'
-            data = {"api_key": self.api_key, "symbol": self.symbol, "timestamp": self.get_timestamp(self.proxy)}
-            response = self.go_command(method, url, self.api_secret, data, {'http': self.proxy})
-            url = f"https://{self.mode}.bybit.com/private/linear/order/create"
+            response = self.get_positions_snapshot(max_age=0)
+            url = f"{self.base_url}/private/linear/order/create"
             method = 'POST'
             if side == 'Buy':
                 order_id_link = self.get_order_id('long')
@@ -530,14 +1015,14 @@ class BotTrader(BotBybit):
                         "order_type": "Market", "qty": float(response['result'][0]['size']),
                         "time_in_force": "GoodTillCancel", "timestamp": self.get_timestamp(self.proxy),
                         "reduce_only": True, "close_on_trigger": False, 'order_link_id': order_id_link}
-                self.go_command(method, url, self.api_secret, data, {'http': self.proxy})
+                self._record_order(self.go_command(method, url, self.api_secret, data, {'http': self.proxy}), True)
             else:
                 order_id_link = self.get_order_id('short')
                 data = {"api_key": self.api_key, "side": "Buy", "symbol": self.symbol,
                         "order_type": "Market", "qty": float(response['result'][1]['size']),
                         "time_in_force": "GoodTillCancel", "timestamp": self.get_timestamp(self.proxy),
                         "reduce_only": True, "close_on_trigger": False, 'order_link_id': order_id_link}
-                self.go_command(method, url, self.api_secret, data, {'http': self.proxy})
+                self._record_order(self.go_command(method, url, self.api_secret, data, {'http': self.proxy}), True)
         except Exception as exc:
             log_error.error(exc)
 
@@ -580,27 +1065,19 @@ class BotTrader(BotBybit):
 
     def get_qty_limits_order(self, side):
         """
-        Function get information about limit orders
-        :param direction: long or short
-        :type direction: str
-        :return: None
+        Function get the number of open (not reduce-only) limit orders
+        :param side: Buy or Sell
+        :type side: str
+        :return: number of orders
+        :rtype: int
         """
-        method = 'GET'
-        url = f'https://{self.mode}.bybit.com/private/linear/order/search'
-        data = {"api_key": self.api_key, "symbol": self.symbol, "timestamp": self.get_timestamp(self.proxy)}
-        response = self.go_command(method, url, self.api_secret, data, {'http': self.proxy})
-        try:
-            list_order_limit = [dict_info['order_id'] for dict_info in response['result'] if
-                                     dict_info['side'] == side and dict_info['reduce_only'] == False]
-            count_limit_orders = len(list_order_limit)
-            return count_limit_orders
-        except Exception as exc:
-            log_error.error(exc)
-            return None
+        self.sync_orders()
+        return self.orders.count(side, False)
 
 class FlatBotTrader(BotTrader):
 
-    def __init__(self, api_key: str, api_secret: str, mode:str, symbol: str, proxy: str, interval: int, limits_threshold: list):
+    def __init__(self, api_key: str, api_secret: str, mode:str, symbol: str, proxy: str, interval: int, limits_threshold: list,
+                 http_client: HttpClient = None, base_url: str = None):
         """
         Initializing the parent bot
         :param api_key: api account key
@@ -613,15 +1090,24 @@ class FlatBotTrader(BotTrader):
         :type symbol: str
         :param proxy: proxy
         :type proxy: str
+        :param interval: interval trading (minutes)
+        :type interval: int
+        :param limits_threshold: [(percent, distance from entry), ...] of the extra limit orders
+        :type limits_threshold: list
+        :param http_client: keep-alive client (a new pool is created if None)
+        :type http_client: HttpClient
+        :param base_url: REST url (https://{mode}.bybit.com if None)
+        :type base_url: str
         :return: None
         """
-        super().__init__(api_key, api_secret, symbol, proxy, interval)
-        self.interval
-        self.limits_threshold =  limits_threshold
+        super().__init__(api_key, api_secret, mode, symbol, proxy, interval, http_client, base_url)
+        self.limits_threshold = limits_threshold
 
 
     def work_short(self):
         log_info.info("bot started working in short!!!")
+        self.start_stream()
+        waiting_timer = LoopTimer('work_short_waiting')
         while True:
             self.stop_price_short = 0
             try:
@@ -639,7 +1125,7 @@ class FlatBotTrader(BotTrader):
                                                  direction='short',
                                                  reduce_only=False)
                         market_qty = self.get_market_qty(direction='short', reduce_only = False)
-                        time.sleep(0.3)
+                        waiting_timer.wait(self.wait_for_update, 0.3)
                     except Exception as exc:
                         log_error.error(exc)
                         time.sleep(1)
@@ -649,6 +1135,7 @@ class FlatBotTrader(BotTrader):
                     self.post_limit_order(percent_limit=100, limit_price=entry_price - 50,
                                          direction='long',
                                          reduce_only=True)
+                    waiting_timer.reacted('work_short', 'entry')
                     for percent, price in self.limits_threshold:
                         self.post_limit_order(percent_limit=percent, limit_price=entry_price + price,
                                              direction='short',
@@ -659,9 +1146,10 @@ class FlatBotTrader(BotTrader):
                     market_qty = self.get_market_qty(direction='Sell', reduce_only = False)
                     qty_limit_orders_start = self.get_qty_limits_order('Sell')
                     log_info.info("bot arranged extras and stop losses in short!!!")
+                    position_timer = LoopTimer('work_short_position')
                     while market_qty != 0:
                         try:
-                            time.sleep(0.5)
+                            position_timer.wait(self.wait_for_update, 1.5)
                             qty_limit_orders = self.get_qty_limits_order('Sell')
                             if qty_limit_orders is not None:
                                 if qty_limit_orders_start > qty_limit_orders:
@@ -672,8 +1160,8 @@ class FlatBotTrader(BotTrader):
                                                          limit_price=entry_price - 50,
                                                          direction='long',
                                                          reduce_only=True)
+                                    position_timer.reacted('work_short', 'extra')
                                     log_info.info("bot collected an additional short!!!")
-                            time.sleep(1)
                             market_qty = self.get_market_qty(direction='short', reduce_only = False)
                         except Exception as exc:
                             log_error.error(exc)
@@ -691,6 +1179,8 @@ class FlatBotTrader(BotTrader):
 
     def work_long(self):
         log_info.info("bot started working in long!!!")
+        self.start_stream()
+        waiting_timer = LoopTimer('work_long_waiting')
         self.stop_price_long = 0
         while True:
             try:
@@ -711,7 +1201,7 @@ class FlatBotTrader(BotTrader):
                                                  limit_price=limit_price,
                                                  direction='long',
                                                  reduce_only=False)
-                        time.sleep(0.3)
+                        waiting_timer.wait(self.wait_for_update, 0.3)
                         market_qty = self.get_market_qty(direction='long', reduce_only = False)
                     except Exception as exc:
                         log_error.error(exc)
@@ -722,6 +1212,7 @@ class FlatBotTrader(BotTrader):
                     self.post_limit_order(percent_limit=100, limit_price=entry_price + 50,
                                          direction='short',
                                          reduce_only=True)
+                    waiting_timer.reacted('work_long', 'entry')
                     for percent, price in self.limits_threshold:
                         self.post_limit_order(percent_limit=percent, limit_price=entry_price - price,
                                              direction='long',
@@ -731,9 +1222,10 @@ class FlatBotTrader(BotTrader):
                     market_qty = self.get_market_qty(direction='long', reduce_only = False)
                     qty_limit_orders_start = self.get_qty_limits_order('Buy')
                     log_info.info("bot arranged extras and stop losses in long!!!")
+                    position_timer = LoopTimer('work_long_position')
                     while market_qty != 0:
                         try:
-                            time.sleep(0.5)
+                            position_timer.wait(self.wait_for_update, 1.5)
                             qty_limit_orders = self.get_qty_limits_order('Buy')
                             if qty_limit_orders is not None:
                                 if qty_limit_orders_start > qty_limit_orders:
@@ -744,8 +1236,8 @@ class FlatBotTrader(BotTrader):
                                                          limit_price=entry_price + 50,
                                                          direction='short',
                                                          reduce_only=True)
+                                    position_timer.reacted('work_long', 'extra')
                                     log_info.info("bot collected an additional long!!!")
-                            time.sleep(1)
                             market_qty = self.get_market_qty(direction='long', reduce_only = False)
                         except Exception as exc:
                             log_error.error(exc)
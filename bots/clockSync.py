@@ -0,0 +1,129 @@
+import logging
+import os
+import threading
+import time
+from bots.settings import CLOCK_SYNC_SAMPLES, CLOCK_SYNC_INTERVAL, CLOCK_SYNC_ALPHA
+
+log_error = logging.getLogger('bots_error')
+
+
+class ClockSync:
+
+    def __init__(self, fetch_server_time, samples: int = CLOCK_SYNC_SAMPLES, interval: float = CLOCK_SYNC_INTERVAL,
+                 alpha: float = CLOCK_SYNC_ALPHA):
+        """
+        Estimator of the exchange clock offset
+        :param fetch_server_time: function returning server time in seconds
+        :type fetch_server_time: callable
+        :param samples: requests per sync
+        :type samples: int
+        :param interval: seconds between background resyncs
+        :type interval: float
+        :param alpha: weight of a new offset in the smoothed offset
+        :type alpha: float
+        :return: None
+        """
+        self.fetch_server_time = fetch_server_time
+        self.samples = samples
+        self.interval = interval
+        self.alpha = alpha
+        self.offset_ms = 0.0
+        self.rtt_ms = None
+        self.synced = False
+        self.last_sync = 0.0
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_pid'] = None
+        state['_lock'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _measure(self):
+        """
+        Function measuring offset and rtt
+        :return: (offset ms, rtt ms) of the lowest rtt sample
+        :rtype: tuple
+        """
+        best = None
+        for _ in range(self.samples):
+            try:
+                sent = time.time()
+                server_time = self.fetch_server_time()
+                received = time.time()
+            except Exception as exc:
+                log_error.error(exc)
+                continue
+            rtt = received - sent
+            offset = server_time - (sent + received) / 2
+            if best is None or rtt < best[1]:
+                best = (offset * 1000, rtt * 1000)
+        return best
+
+    def sync(self, reset: bool = False):
+        """
+        Function resyncing the offset
+        :param reset: drop the smoothed offset and take the new one as is
+        :type reset: bool
+        :return: True if the offset was measured
+        :rtype: bool
+        """
+        with self._lock:
+            measured = self._measure()
+            if measured is None:
+                return False
+            offset_ms, rtt_ms = measured
+            if self.synced and not reset:
+                self.offset_ms = self.alpha * offset_ms + (1 - self.alpha) * self.offset_ms
+            else:
+                self.offset_ms = offset_ms
+            self.rtt_ms = rtt_ms
+            self.synced = True
+            self.last_sync = time.monotonic()
+            return True
+
+    def request_resync(self):
+        """
+        Function resyncing after the exchange rejected a timestamp
+        :return: None
+        """
+        self.sync(reset=True)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.sync()
+            except Exception as exc:
+                log_error.error(exc)
+
+    def start(self):
+        """
+        Function starting the background resync of the current process
+        :return: None
+        """
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        self._pid = pid
+        thread = threading.Thread(target=self._run, name='clock-sync', daemon=True)
+        thread.start()
+
+    def timestamp(self):
+        """
+        Function getting exchange time without a network call
+        :return: time (ms)
+        :rtype: int
+        """
+        if self._pid != os.getpid():
+            # a lock inherited through fork may be held by a thread that does not exist here
+            self._lock = threading.Lock()
+            if not self.synced:
+                self.sync()
+            self.start()
+        return int(time.time() * 1000 + self.offset_ms)
@@ -0,0 +1,147 @@
+import os
+import threading
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from bots.settings import HTTP_POOL_CONNECTIONS, HTTP_POOL_MAXSIZE, HTTP_POOL_BLOCK, HTTP_CONNECT_TIMEOUT, \
+    HTTP_READ_TIMEOUT, HTTP_CONNECT_RETRIES
+
+urllib3.disable_warnings()
+
+
+class HttpClient:
+
+    def __init__(self, pool_connections: int = HTTP_POOL_CONNECTIONS, pool_maxsize: int = HTTP_POOL_MAXSIZE,
+                 pool_block: bool = HTTP_POOL_BLOCK, connect_timeout: float = HTTP_CONNECT_TIMEOUT,
+                 read_timeout: float = HTTP_READ_TIMEOUT, connect_retries: int = HTTP_CONNECT_RETRIES,
+                 verify: bool = False):
+        """
+        Long-lived keep-alive http client with a bounded connection pool
+        :param pool_connections: number of host pools kept alive
+        :type pool_connections: int
+        :param pool_maxsize: max connections per host
+        :type pool_maxsize: int
+        :param pool_block: wait for a free connection when the host pool is exhausted
+        :type pool_block: bool
+        :param connect_timeout: connect timeout (seconds)
+        :type connect_timeout: float
+        :param read_timeout: read timeout (seconds)
+        :type read_timeout: float
+        :param connect_retries: retries of failed connects
+        :type connect_retries: int
+        :param verify: verify tls certificates
+        :type verify: bool
+        :return: None
+        """
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.timeout = (connect_timeout, read_timeout)
+        self.connect_retries = connect_retries
+        self.verify = verify
+        self._session = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._requests = 0
+
+    def __getstate__(self):
+        # sockets and locks are not shared between processes, every process opens its own pool
+        state = self.__dict__.copy()
+        state['_session'] = None
+        state['_pid'] = None
+        state['_lock'] = None
+        state['_requests'] = 0
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _create_session(self):
+        """
+        Function creating a session with pooled adapters
+        :return: session
+        :rtype: requests.Session
+        """
+        session = requests.Session()
+        retries = Retry(total=self.connect_retries, connect=self.connect_retries, read=0, status=0,
+                        redirect=0, raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize,
+                              pool_block=self.pool_block, max_retries=retries)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.verify = self.verify
+        return session
+
+    @property
+    def session(self):
+        """
+        Session of the current process (a forked child never reuses the parent's sockets)
+        :return: session
+        :rtype: requests.Session
+        """
+        pid = os.getpid()
+        if self._session is None or self._pid != pid:
+            with self._lock:
+                if self._session is None or self._pid != pid:
+                    self._session = self._create_session()
+                    self._pid = pid
+                    self._requests = 0
+        return self._session
+
+    def request(self, method: str, url: str, **kwargs):
+        """
+        Function sending a request through the pool
+        :param method: GET or POST
+        :type method: str
+        :param url: url
+        :type url: str
+        :return: response
+        :rtype: requests.Response
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        session = self.session
+        self._requests += 1
+        return session.request(method, url, **kwargs)
+
+    def get_stats(self):
+        """
+        Function getting connection reuse stats of the current process
+        :return: dict of stats:
+            -requests
+            -connections (opened tcp+tls connections)
+            -reused (requests served by an already open connection)
+            -hosts (stats per host)
+        """
+        hosts = {}
+        if self._session is not None and self._pid == os.getpid():
+            for adapter in set(self._session.adapters.values()):
+                managers = [adapter.poolmanager] + list(adapter.proxy_manager.values())
+                for manager in managers:
+                    for key in manager.pools.keys():
+                        pool = manager.pools.get(key)
+                        if pool is None:
+                            continue
+                        host = f'{pool.scheme}://{pool.host}:{pool.port}'
+                        info = hosts.setdefault(host, {'requests': 0, 'connections': 0})
+                        info['requests'] += pool.num_requests
+                        info['connections'] += pool.num_connections
+        connections = sum(info['connections'] for info in hosts.values())
+        return {
+            'requests': self._requests,
+            'connections': connections,
+            'reused': max(self._requests - connections, 0),
+            'hosts': hosts
+        }
+
+    def close(self):
+        """
+        Function closing pooled connections
+        :return: None
+        """
+        if self._session is not None and self._pid == os.getpid():
+            self._session.close()
+        self._session = None
+        self._pid = None
+
@@ -0,0 +1,391 @@
+import logging
+import os
+import threading
+import time
+import numpy as np
+import pandas as pd
+from bots.stream import BybitStream
+from bots.settings import INDICATOR_HISTORY, INDICATOR_RESYNC, INTERVAL_SECONDS, PUBLIC_STREAM_URLS
+
+log_error = logging.getLogger('bots_error')
+
+
+def interval_seconds(interval):
+    """
+    Function getting the length of a kline interval
+    :param interval: interval (minutes, D, W or M)
+    :return: seconds
+    :rtype: int
+    """
+    return INTERVAL_SECONDS.get(str(interval), None) or int(interval) * 60
+
+
+class RingBuffer:
+
+    def __init__(self, size: int):
+        """
+        Fixed size buffer of the last values
+        :param size: max values
+        :type size: int
+        :return: None
+        """
+        self.size = size
+        self.data = np.zeros(size, dtype=np.float64)
+        self.index = 0  # position of the next value
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def push(self, value: float):
+        """
+        Function appending a value
+        :param value: value
+        :type value: float
+        :return: value pushed out of the buffer or None
+        """
+        old = self.data[self.index] if self.count == self.size else None
+        self.data[self.index] = value
+        self.index = (self.index + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+        return old
+
+    def replace_last(self, value: float):
+        """
+        Function replacing the last value
+        :param value: value
+        :type value: float
+        :return: replaced value
+        """
+        last = (self.index - 1) % self.size
+        old = self.data[last]
+        self.data[last] = value
+        return old
+
+    def last(self):
+        return self.data[(self.index - 1) % self.size] if self.count else None
+
+    def values(self):
+        """
+        Function getting the values from the oldest to the newest
+        :return: values
+        :rtype: np.ndarray
+        """
+        if self.count < self.size:
+            return self.data[:self.count].copy()
+        return np.roll(self.data, -self.index)
+
+
+class RollingWindow:
+
+    def __init__(self, window: int):
+        """
+        Moving mean / variance of the last values, O(1) per value
+        :param window: values in the window
+        :type window: int
+        :return: None
+        """
+        self.window = window
+        self.buffer = RingBuffer(window)
+        self.sum = 0.0
+        self.sum_sq = 0.0
+        self._updates = 0
+
+    def backfill(self, values: np.ndarray):
+        values = np.asarray(values, dtype=np.float64)[-self.window:]
+        self.buffer = RingBuffer(self.window)
+        self.buffer.data[:len(values)] = values
+        self.buffer.count = len(values)
+        self.buffer.index = len(values) % self.window
+        self._resync()
+
+    def _resync(self):
+        # running sums drift with float error, the exact ones are recomputed now and then
+        values = self.buffer.data[:self.buffer.count]
+        self.sum = float(values.sum())
+        self.sum_sq = float(np.dot(values, values))
+        self._updates = 0
+
+    def _changed(self, old, new: float):
+        if old is not None:
+            self.sum -= old
+            self.sum_sq -= old * old
+        self.sum += new
+        self.sum_sq += new * new
+        self._updates += 1
+        if self._updates >= INDICATOR_RESYNC:
+            self._resync()
+
+    def push(self, value: float):
+        self._changed(self.buffer.push(value), value)
+
+    def replace_last(self, value: float):
+        self._changed(self.buffer.replace_last(value), value)
+
+    @property
+    def ready(self):
+        return self.buffer.count == self.window
+
+    def mean(self):
+        return self.sum / self.buffer.count if self.buffer.count else None
+
+    def variance(self):
+        count = self.buffer.count
+        if count < 2:
+            return None
+        return max(self.sum_sq - self.sum * self.sum / count, 0.0) / (count - 1)
+
+    def std(self):
+        variance = self.variance()
+        return None if variance is None else variance ** 0.5
+
+
+class Ema:
+
+    def __init__(self, window: int):
+        """
+        Exponential moving average (same as pandas ewm(span=window, adjust=False)), O(1) per value
+        :param window: span
+        :type window: int
+        :return: None
+        """
+        self.window = window
+        self.alpha = 2 / (window + 1)
+        self.base = None  # ema of the closed values
+        self.value = None  # ema including the last value
+
+    def backfill(self, values: np.ndarray):
+        if len(values) == 0:
+            self.base = self.value = None
+            return
+        ema = pd.Series(values, dtype=np.float64).ewm(span=self.window, adjust=False).mean().to_numpy()
+        self.base = float(ema[-2]) if len(ema) > 1 else None
+        self.value = float(ema[-1])
+
+    def push(self, value: float):
+        self.base = self.value
+        self.replace_last(value)
+
+    def replace_last(self, value: float):
+        self.value = value if self.base is None else self.alpha * value + (1 - self.alpha) * self.base
+
+
+class IndicatorSeries:
+
+    def __init__(self, history: int = INDICATOR_HISTORY):
+        """
+        Closes of one symbol / interval with its moving statistics, the last candle may still be forming
+        :param history: closes kept
+        :type history: int
+        :return: None
+        """
+        self.closes = RingBuffer(history)
+        self.last_start = None
+        self.updated = 0.0
+        self.windows = {}
+        self.emas = {}
+
+    def add_window(self, window: int):
+        if window not in self.windows:
+            self.windows[window] = RollingWindow(window)
+            self.windows[window].backfill(self.closes.values())
+
+    def add_ema(self, window: int):
+        if window not in self.emas:
+            self.emas[window] = Ema(window)
+            self.emas[window].backfill(self.closes.values())
+
+    def backfill(self, starts: list, closes: list):
+        """
+        Function loading history (vectorized)
+        :param starts: open times of the candles
+        :type starts: list
+        :param closes: closes of the candles
+        :type closes: list
+        :return: None
+        """
+        closes = np.asarray(closes, dtype=np.float64)[-self.closes.size:]
+        self.closes = RingBuffer(self.closes.size)
+        for value in closes:
+            self.closes.push(value)
+        self.last_start = starts[-1] if len(starts) else None
+        for stats in list(self.windows.values()) + list(self.emas.values()):
+            stats.backfill(closes)
+        self.updated = time.monotonic()
+
+    def on_kline(self, start: int, close: float):
+        """
+        Function applying a kline update, a new open time starts a new candle
+        :param start: candle open time
+        :type start: int
+        :param close: current close
+        :type close: float
+        :return: None
+        """
+        if self.last_start is not None and start < self.last_start:
+            return
+        if start == self.last_start:
+            self.closes.replace_last(close)
+            for stats in list(self.windows.values()) + list(self.emas.values()):
+                stats.replace_last(close)
+        else:
+            self.closes.push(close)
+            for stats in list(self.windows.values()) + list(self.emas.values()):
+                stats.push(close)
+            self.last_start = start
+        self.updated = time.monotonic()
+
+    def ma(self, window: int):
+        return self.windows[window].mean()
+
+    def std(self, window: int):
+        return self.windows[window].std()
+
+    def ema(self, window: int):
+        return self.emas[window].value
+
+
+class IndicatorEngine:
+
+    def __init__(self, fetch_klines, mode: str, history: int = INDICATOR_HISTORY, archive=None):
+        """
+        Moving statistics of many symbols / intervals, history is fetched once and kept current by the public stream
+        :param fetch_klines: function (symbol, interval, limit) returning [(open time, close), ...] oldest first
+        :type fetch_klines: callable
+        :param mode: mode work (testnet or Mainenet)
+        :type mode: str
+        :param history: candles backfilled per series
+        :type history: int
+        :param archive: market archive the streamed candles are appended to (not stored if None)
+        :type archive: MarketArchive
+        :return: None
+        """
+        self.fetch_klines = fetch_klines
+        self.mode = mode
+        self.history = history
+        self.archive = archive
+        self.series = {}
+        self.url = None
+        self.stream = None
+        self._stream_pid = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['stream'] = None
+        state['_stream_pid'] = None
+        state['_lock'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def register(self, symbol: str, interval, ma_windows: tuple = (), ema_windows: tuple = ()):
+        """
+        Function adding a series (backfilled once) and its windows
+        :param symbol: symbol instrument
+        :type symbol: str
+        :param interval: kline interval
+        :param ma_windows: windows of moving means / deviations
+        :type ma_windows: tuple
+        :param ema_windows: windows of EMAs
+        :type ema_windows: tuple
+        :return: series
+        :rtype: IndicatorSeries
+        """
+        key = (symbol, str(interval))
+        with self._lock:
+            series = self.series.get(key)
+            created = series is None
+            if created:
+                series = IndicatorSeries(self.history)
+                klines = self.fetch_klines(symbol, interval, self.history)
+                series.backfill([start for start, _ in klines], [close for _, close in klines])
+                self.series[key] = series
+            for window in ma_windows:
+                series.add_window(window)
+            for window in ema_windows:
+                series.add_ema(window)
+        if created and self.stream is not None:
+            # the new topic needs a new subscription
+            self.stop()
+            self.start()
+        return series
+
+    def get(self, symbol: str, interval):
+        """
+        Function getting a series, polled from REST while the stream is down
+        :param symbol: symbol instrument
+        :type symbol: str
+        :param interval: kline interval
+        :return: series
+        :rtype: IndicatorSeries
+        """
+        series = self.series[(symbol, str(interval))]
+        if self.stream is None or not self.stream.connected:
+            self.poll(symbol, interval)
+        return series
+
+    def poll(self, symbol: str, interval):
+        """
+        Function updating a series with the candles missed since its last update
+        :param symbol: symbol instrument
+        :type symbol: str
+        :param interval: kline interval
+        :return: None
+        """
+        try:
+            series = self.series[(symbol, str(interval))]
+            limit = self.history
+            if series.last_start is not None:
+                missed = int((time.time() - series.last_start) // interval_seconds(interval)) + 2
+                limit = min(max(missed, 2), self.history)
+            for start, close in self.fetch_klines(symbol, interval, limit):
+                series.on_kline(start, close)
+        except Exception as exc:
+            log_error.error(exc)
+
+    def _on_stream_message(self, topic: str, message: dict):
+        _, interval, symbol = topic.split('.', 2)
+        series = self.series.get((symbol, interval))
+        if series is None:
+            return
+        for kline in message['data']:
+            series.on_kline(int(kline['start']), float(kline['close']))
+        if self.archive is not None:
+            try:
+                self.archive.klines(symbol, interval).append_klines(message['data'])
+            except Exception as exc:
+                log_error.error(exc)
+
+    def start(self, url: str = None):
+        """
+        Function subscribing the klines of every series in the current process
+        :param url: websocket url (PUBLIC_STREAM_URLS[mode] if None)
+        :type url: str
+        :return: None
+        """
+        if self._stream_pid == os.getpid() or not self.series:
+            return
+        if url is not None:
+            self.url = url
+        url = self.url if self.url is not None else PUBLIC_STREAM_URLS[self.mode]
+        topics = [f'candle.{interval}.{symbol}' for symbol, interval in self.series]
+        self.stream = BybitStream(url, topics, self._on_stream_message, self._recover_stream_gap)
+        self._stream_pid = os.getpid()
+        self.stream.start()
+
+    def _recover_stream_gap(self):
+        for symbol, interval in list(self.series):
+            self.poll(symbol, interval)
+
+    def stop(self):
+        """
+        Function stopping the kline stream
+        :return: None
+        """
+        if self.stream is not None and self._stream_pid == os.getpid():
+            self.stream.stop()
+        self.stream = None
+        self._stream_pid = None
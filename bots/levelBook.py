@@ -0,0 +1,125 @@
+import threading
+from bisect import bisect_left, bisect_right
+from decimal import Decimal
+from bots.settings import TICK_SIZES, DEFAULT_TICK_SIZE
+
+
+class LevelBook:
+
+    def __init__(self, tick_size: float = DEFAULT_TICK_SIZE):
+        """
+        Sorted levels of one symbol keyed by integer ticks, safe to share between the loops of a process
+        :param tick_size: price tick of the symbol
+        :type tick_size: float
+        :return: None
+        """
+        self.tick_size = tick_size
+        self.decimals = max(-Decimal(str(tick_size)).as_tuple().exponent, 0)
+        self._keys = []
+        self._set = set()
+        self._lock = threading.Lock()
+
+    def to_ticks(self, price):
+        """
+        Function normalizing a price (float or exchange string) to ticks
+        :param price: price
+        :return: ticks
+        :rtype: int
+        """
+        return int(round(float(price) / self.tick_size))
+
+    def to_price(self, ticks: int):
+        """
+        Function converting ticks to a price
+        :param ticks: ticks
+        :type ticks: int
+        :return: price
+        :rtype: float
+        """
+        return round(ticks * self.tick_size, self.decimals)
+
+    def update(self, prices: list):
+        """
+        Function replacing the levels, only added and removed levels touch the sorted keys
+        :param prices: prices of levels
+        :type prices: list
+        :return: (added ticks, removed ticks)
+        :rtype: tuple
+        """
+        new_set = {self.to_ticks(price) for price in prices}
+        with self._lock:
+            added = new_set - self._set
+            removed = self._set - new_set
+            if len(added) + len(removed) > len(self._keys) // 2:
+                self._keys = sorted(new_set)
+            else:
+                for ticks in removed:
+                    del self._keys[bisect_left(self._keys, ticks)]
+                for ticks in added:
+                    self._keys.insert(bisect_left(self._keys, ticks), ticks)
+            self._set = new_set
+        return added, removed
+
+    def below(self, price: float, count: int = None):
+        """
+        Function getting levels strictly below price
+        :param price: price
+        :type price: float
+        :param count: max number of levels
+        :type count: int
+        :return: ticks, nearest first
+        :rtype: list
+        """
+        with self._lock:
+            index = bisect_left(self._keys, float(price) / self.tick_size)
+            start = 0 if count is None else max(index - count, 0)
+            return self._keys[start:index][::-1]
+
+    def above(self, price: float, count: int = None):
+        """
+        Function getting levels strictly above price
+        :param price: price
+        :type price: float
+        :param count: max number of levels
+        :type count: int
+        :return: ticks, nearest first
+        :rtype: list
+        """
+        with self._lock:
+            index = bisect_right(self._keys, float(price) / self.tick_size)
+            return self._keys[index:] if count is None else self._keys[index:index + count]
+
+    def diff(self, levels: list, open_orders: list):
+        """
+        Function comparing wanted levels with open orders
+        :param levels: wanted ticks, in placement priority
+        :type levels: list
+        :param open_orders: list of (order_id, price, qty)
+        :type open_orders: list
+        :return: (ticks without an order in levels order, ids of orders off the levels)
+        :rtype: tuple
+        """
+        wanted = set(levels)
+        ordered = set()
+        to_cancel = []
+        for order_id, price, qty in open_orders:
+            ticks = self.to_ticks(price)
+            ordered.add(ticks)
+            if ticks not in wanted:
+                to_cancel.append(order_id)
+        to_add = [ticks for ticks in levels if ticks not in ordered]
+        return to_add, to_cancel
+
+    def __len__(self):
+        return len(self._keys)
+
+
+def create_level_book(symbol: str):
+    """
+    Function creating a level book with the tick of the symbol
+    :param symbol: symbol instrument
+    :type symbol: str
+    :return: level book
+    :rtype: LevelBook
+    """
+    return LevelBook(TICK_SIZES.get(symbol, DEFAULT_TICK_SIZE))
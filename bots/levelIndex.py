@@ -0,0 +1,142 @@
+import logging
+import time
+from bots.settings import LEVELS_KEY, LEVELS_BLOB_KEY, LEVELS_SOURCE_KEY, MARKET_UPDATES_CHANNEL
+
+log_error = logging.getLogger('bots_error')
+
+# marks a sorted set written by LevelIndex.store, the json blob is not copied into it
+_DIRECT_SOURCE = '*'
+
+# support and resistance around last_value in one round trip. The sorted set is rebuilt from the json blob of
+# the producers that do not use the index when the blob differs from the one it was built from
+_LEVELS_SCRIPT = """
+local raw = redis.call('GET', KEYS[3])
+if raw then
+    local source = redis.call('GET', KEYS[4])
+    if source ~= raw and source ~= ARGV[2] then
+        redis.call('DEL', KEYS[1])
+        for _, level in ipairs(cjson.decode(raw)) do
+            local price = tonumber(level[2])
+            redis.call('ZADD', KEYS[1], price, string.format('%.17g', price))
+        end
+        redis.call('SET', KEYS[4], raw)
+        redis.call('PUBLISH', ARGV[1], KEYS[1])
+    end
+end
+local last_value = redis.call('GET', KEYS[2])
+if not last_value then
+    return false
+end
+local support = redis.call('ZREVRANGEBYSCORE', KEYS[1], '(' .. last_value, '-inf')
+local resistance = redis.call('ZRANGEBYSCORE', KEYS[1], '(' .. last_value, '+inf')
+return {last_value, support, resistance}
+"""
+
+
+class LevelIndex:
+
+    def __init__(self, redis_con, key: str = LEVELS_KEY, channel: str = MARKET_UPDATES_CHANNEL,
+                 blob_key: str = LEVELS_BLOB_KEY, source_key: str = LEVELS_SOURCE_KEY):
+        """
+        Levels stored in a redis sorted set so support / resistance are range queries
+        :param redis_con: redis connection
+        :type redis_con: redis.Redis
+        :param key: sorted set key
+        :type key: str
+        :param channel: channel notified when the levels change
+        :type channel: str
+        :param blob_key: json blob [[index, price], ...] of the producers that do not use the index
+        :type blob_key: str
+        :param source_key: copy of the blob the sorted set was built from
+        :type source_key: str
+        :return: None
+        """
+        self.redis_con = redis_con
+        self.key = key
+        self.channel = channel
+        self.blob_key = blob_key
+        self.source_key = source_key
+        self._script = redis_con.register_script(_LEVELS_SCRIPT)
+
+    def store(self, levels: list):
+        """
+        Function replacing the levels atomically and notifying consumers
+        :param levels: prices
+        :type levels: list
+        :return: None
+        """
+        pipe = self.redis_con.pipeline(transaction=True)
+        pipe.delete(self.key)
+        if len(levels) > 0:
+            pipe.zadd(self.key, {repr(float(price)): float(price) for price in levels})
+        pipe.set(self.source_key, _DIRECT_SOURCE)
+        pipe.publish(self.channel, self.key)
+        pipe.execute()
+
+    def get_levels(self):
+        """
+        Function getting levels split around last_value
+        :return: (last_value, support levels descending, resistance levels ascending)
+        :rtype: tuple
+        """
+        result = self._script(keys=[self.key, 'last_value', self.blob_key, self.source_key],
+                              args=[self.channel, _DIRECT_SOURCE])
+        if result is None:
+            raise ValueError("last_value is not in redis")
+        last_value, support, resistance = result
+        return float(last_value), [float(price) for price in support], [float(price) for price in resistance]
+
+    def get_support(self):
+        """
+        Function getting support levels
+        :return: levels below last_value, nearest first
+        :rtype: list
+        """
+        return self.get_levels()[1]
+
+    def get_resistance(self):
+        """
+        Function getting resistance levels
+        :return: levels above last_value, nearest first
+        :rtype: list
+        """
+        return self.get_levels()[2]
+
+
+class ChangeListener:
+
+    def __init__(self, redis_con, channel: str = MARKET_UPDATES_CHANNEL):
+        """
+        Subscriber waking a loop when market data or levels change
+        :param redis_con: redis connection
+        :type redis_con: redis.Redis
+        :param channel: channel
+        :type channel: str
+        :return: None
+        """
+        self.pubsub = redis_con.pubsub(ignore_subscribe_messages=True)
+        self.pubsub.subscribe(channel)
+
+    def wait(self, timeout: float):
+        """
+        Function sleeping until a change notification or timeout
+        :param timeout: max seconds to wait
+        :type timeout: float
+        :return: True if woken by a change
+        :rtype: bool
+        """
+        try:
+            message = self.pubsub.get_message(timeout=timeout)
+        except Exception as exc:
+            log_error.error(exc)
+            time.sleep(timeout)
+            return False
+        if message is None:
+            return False
+        # drain the backlog, one wake-up is enough for any number of changes
+        while self.pubsub.get_message(timeout=0) is not None:
+            pass
+        return True
+
+    def close(self):
+        self.pubsub.close()
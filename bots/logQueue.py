@@ -0,0 +1,167 @@
+import logging
+import multiprocessing
+import multiprocessing.util
+import os
+import queue
+import re
+import threading
+from datetime import datetime, timezone
+from json import dumps
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from bots.metrics import REGISTRY
+from bots.settings import LOG_DIR, LOG_NAME, LOG_FORMAT, LOG_DATE_FORMAT, LOG_JSON, LOG_PER_PROCESS, LOG_QUEUE_SIZE, \
+    LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOGGER_LEVELS
+
+LOG_RECORDS_DROPPED = REGISTRY.counter('log_records_dropped_total', 'log records dropped with a full queue')
+
+
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record: logging.LogRecord):
+        entry = {'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+                 'level': record.levelname, 'logger': record.name, 'process': record.processName,
+                 'pid': record.process, 'thread': record.threadName, 'message': record.getMessage()}
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return dumps(entry, default=str)
+
+
+class _Listener(QueueListener):
+
+    def enqueue_sentinel(self):
+        # a full queue is drained by the listener, so waiting for room cannot block forever
+        self.queue.put(self._sentinel)
+
+
+class ProcessQueueHandler(QueueHandler):
+
+    def __init__(self, name: str, directory: str = LOG_DIR, json_format: bool = LOG_JSON,
+                 per_process: bool = LOG_PER_PROCESS, maxsize: int = LOG_QUEUE_SIZE, max_bytes: int = LOG_MAX_BYTES,
+                 backup_count: int = LOG_BACKUP_COUNT):
+        """
+        Handler only queueing records, a listener thread of the process formats and writes them once
+        to a rotating file
+        :param name: file name (without .log)
+        :type name: str
+        :param directory: directory of the files
+        :type directory: str
+        :param json_format: json lines instead of LOG_FORMAT
+        :type json_format: bool
+        :param per_process: child processes write their own file
+        :type per_process: bool
+        :param maxsize: records buffered, new ones are dropped when the queue is full
+        :type maxsize: int
+        :param max_bytes: size of a file before it is rotated
+        :type max_bytes: int
+        :param backup_count: rotated files kept
+        :type backup_count: int
+        :return: None
+        """
+        super().__init__(queue.Queue(maxsize))
+        self.file_name = name
+        self.directory = directory
+        self.json_format = json_format
+        self.per_process = per_process
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.dropped = 0
+        self.listener = None
+        self._unreported = 0
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def get_path(self):
+        """
+        Function getting the file of the current process, a child process is named by the name= it was started
+        with, so a restarted process writes the same file
+        :return: path
+        :rtype: str
+        """
+        process_name = multiprocessing.current_process().name
+        if not self.per_process or process_name == 'MainProcess':
+            return os.path.join(self.directory, f'{self.file_name}.log')
+        process_name = re.sub(r'[^\w.-]', '_', process_name)
+        return os.path.join(self.directory, f'{self.file_name}.{process_name}.log')
+
+    def _start(self):
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            # a forked child gets its own queue and writer, the thread of the parent does not exist in it
+            self.queue = queue.Queue(self.maxsize)
+            self._unreported = 0
+            os.makedirs(self.directory, exist_ok=True)
+            file_handler = RotatingFileHandler(self.get_path(), maxBytes=self.max_bytes,
+                                               backupCount=self.backup_count, delay=True)
+            if self.json_format:
+                file_handler.setFormatter(JsonFormatter())
+            else:
+                file_handler.setFormatter(logging.Formatter(LOG_FORMAT, datefmt=LOG_DATE_FORMAT))
+            self.listener = _Listener(self.queue, file_handler)
+            self.listener.start()
+            self._pid = os.getpid()
+            # multiprocessing children leave through os._exit, atexit does not run in them but the finalizers do
+            multiprocessing.util.Finalize(self, self.stop, exitpriority=10)
+
+    def prepare(self, record: logging.LogRecord):
+        # only the message is merged here, the listener formats (exceptions included)
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            if self._unreported > 0:
+                self.queue.put_nowait(logging.makeLogRecord(
+                    {'name': record.name, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                     'msg': f"{self._unreported} log records dropped, the writer fell behind"}))
+                self._unreported = 0
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            self._unreported += 1
+            LOG_RECORDS_DROPPED.inc()
+
+    def emit(self, record: logging.LogRecord):
+        if self._pid != os.getpid():
+            self._start()
+        super().emit(record)
+
+    def stop(self):
+        """
+        Function writing the queued records and stopping the listener of the process
+        :return: None
+        """
+        if self.listener is not None and self._pid == os.getpid():
+            self.listener.stop()
+            for handler in self.listener.handlers:
+                handler.close()
+            self.listener = None
+            self._pid = None
+
+
+_HANDLER = None
+_HANDLER_LOCK = threading.Lock()
+
+
+def setup_logging(name: str = LOG_NAME):
+    """
+    Function attaching the queue handler to the bots loggers, once per interpreter
+    :param name: file name (without .log)
+    :type name: str
+    :return: handler
+    :rtype: ProcessQueueHandler
+    """
+    global _HANDLER
+    with _HANDLER_LOCK:
+        if _HANDLER is None:
+            _HANDLER = ProcessQueueHandler(name)
+            for logger_name, level in LOGGER_LEVELS.items():
+                logger = logging.getLogger(logger_name)
+                logger.setLevel(level)
+                logger.addHandler(_HANDLER)
+        elif _HANDLER.file_name != name:
+            raise ValueError(f"logging is already set up to {_HANDLER.file_name}.log")
+    return _HANDLER
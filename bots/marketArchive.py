@@ -0,0 +1,346 @@
+import fcntl
+import os
+import threading
+from json import loads
+import numpy as np
+from bots.settings import ARCHIVE_DIR, ARCHIVE_KLINE_LIMIT
+
+# one little-endian file per column, a row is the same index in every file
+KLINE_COLUMNS = (('open_time', '<i8'), ('open', '<f8'), ('high', '<f8'), ('low', '<f8'), ('close', '<f8'),
+                 ('volume', '<f8'))
+TRADE_COLUMNS = (('ts', '<f8'), ('price', '<f8'), ('size', '<f8'), ('side', '<i1'))
+
+
+class ArchiveSeries:
+
+    def __init__(self, directory: str, columns: tuple):
+        """
+        Append-only columnar series, the columns are memory-mapped read-only so readers get numpy views of the
+        files without copies. The first column is the time, ascending
+        :param directory: directory of the column files
+        :type directory: str
+        :param columns: (name, dtype) of the columns
+        :type columns: tuple
+        :return: None
+        """
+        self.directory = directory
+        self.columns = columns
+        self.time_column = columns[0][0]
+        self.paths = {name: os.path.join(directory, f'{name}.bin') for name, _ in columns}
+        self.dtypes = {name: np.dtype(dtype) for name, dtype in columns}
+        self._maps = {}
+        self._mapped_rows = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_maps'] = {}
+        state['_mapped_rows'] = 0
+        state['_lock'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        # a row counts once it is in every file, an append cut by a crash is not visible
+        rows = None
+        for name, path in self.paths.items():
+            try:
+                column_rows = os.stat(path).st_size // self.dtypes[name].itemsize
+            except FileNotFoundError:
+                return 0
+            rows = column_rows if rows is None else min(rows, column_rows)
+        return rows
+
+    def _views(self):
+        """
+        Function getting the mapped columns, they are mapped again when the files grew
+        :return: name -> read-only array
+        :rtype: dict
+        """
+        rows = len(self)
+        if rows != self._mapped_rows or len(self._maps) == 0:
+            if rows == 0:
+                self._maps = {name: np.empty(0, dtype) for name, dtype in self.dtypes.items()}
+            else:
+                # plain array views of the maps, slicing a memmap costs more than the search
+                self._maps = {name: np.memmap(path, self.dtypes[name], mode='r', shape=(rows,)).view(np.ndarray)
+                              for name, path in self.paths.items()}
+            self._mapped_rows = rows
+        return self._maps
+
+    def column(self, name: str):
+        return self._views()[name]
+
+    def first_time(self):
+        times = self.column(self.time_column)
+        return times[0].item() if len(times) else None
+
+    def last_time(self):
+        times = self.column(self.time_column)
+        return times[-1].item() if len(times) else None
+
+    def range(self, start=None, end=None):
+        """
+        Function getting the rows of a time range (binary search, no copy)
+        :param start: first time (included), from the first row if None
+        :param end: last time (excluded), to the last row if None
+        :return: name -> read-only array
+        :rtype: dict
+        """
+        views = self._views()
+        times = views[self.time_column]
+        first = 0 if start is None else int(np.searchsorted(times, start, side='left'))
+        last = len(times) if end is None else int(np.searchsorted(times, end, side='left'))
+        return {name: array[first:last] for name, array in views.items()}
+
+    def tail(self, count: int):
+        """
+        Function getting the last rows
+        :param count: number of rows
+        :type count: int
+        :return: name -> read-only array
+        :rtype: dict
+        """
+        views = self._views()
+        return {name: array[max(len(array) - count, 0):] for name, array in views.items()}
+
+    def _locked(self):
+        # writers of other processes are excluded by a lock file, threads of this one by the lock
+        lock_file = open(os.path.join(self.directory, '.lock'), 'a')
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return lock_file
+
+    def _repair(self, rows: int):
+        # columns longer than the others hold the start of an append that did not finish
+        for name, path in self.paths.items():
+            size = rows * self.dtypes[name].itemsize
+            if os.path.exists(path) and os.path.getsize(path) != size:
+                os.truncate(path, size)
+
+    def _write(self, rows: dict, overwrite_last: bool):
+        """
+        Function writing rows at the end of the files
+        :param rows: name -> values of the new rows
+        :type rows: dict
+        :param overwrite_last: the first row replaces the last stored row
+        :type overwrite_last: bool
+        :return: None
+        """
+        count = len(self)
+        self._repair(count)
+        for name, path in self.paths.items():
+            data = np.ascontiguousarray(rows[name], dtype=self.dtypes[name]).tobytes()
+            with open(path, 'r+b' if os.path.exists(path) else 'wb') as file:
+                file.seek((count - 1 if overwrite_last else count) * self.dtypes[name].itemsize)
+                file.write(data)
+
+    def append(self, rows: dict, replace_last: bool = False, after_last: bool = False):
+        """
+        Function appending rows in time order, rows older than the last stored one are skipped
+        :param rows: name -> values (every column)
+        :type rows: dict
+        :param replace_last: a row with the last stored time replaces it (a candle still open),
+            otherwise rows with that time are appended
+        :type replace_last: bool
+        :param after_last: rows with the last stored time are skipped too (history overlapping the stored one)
+        :type after_last: bool
+        :return: number of rows written
+        :rtype: int
+        """
+        times = np.asarray(rows[self.time_column], dtype=self.dtypes[self.time_column])
+        if len(times) == 0:
+            return 0
+        order = np.argsort(times, kind='stable')
+        rows = {name: np.asarray(rows[name])[order] for name in self.paths}
+        times = times[order]
+        keep = np.ones(len(times), dtype=bool)
+        if replace_last:
+            # a time is stored once, the newest version of a row wins
+            keep = np.append(times[1:] != times[:-1], True)
+        with self._lock:
+            lock_file = self._locked()
+            try:
+                last = self.last_time()
+                if last is not None:
+                    keep &= times > last if after_last else times >= last
+                overwrite_last = bool(replace_last and last is not None and keep.any() and times[keep][0] == last)
+                rows = {name: values[keep] for name, values in rows.items()}
+                times = times[keep]
+                if len(times) > 0:
+                    self._write(rows, overwrite_last)
+                return len(times)
+            finally:
+                lock_file.close()
+
+
+class KlineSeries(ArchiveSeries):
+
+    def __init__(self, directory: str):
+        super().__init__(directory, KLINE_COLUMNS)
+
+    def append_klines(self, klines: list):
+        """
+        Function appending candles from the REST api or the stream, the last stored candle is updated
+        :param klines: dicts with open_time (or start), open, high, low, close, volume
+        :type klines: list
+        :return: number of rows written
+        :rtype: int
+        """
+        return self.append({'open_time': [int(kline['open_time'] if 'open_time' in kline else kline['start'])
+                                          for kline in klines],
+                            'open': [float(kline['open']) for kline in klines],
+                            'high': [float(kline['high']) for kline in klines],
+                            'low': [float(kline['low']) for kline in klines],
+                            'close': [float(kline['close']) for kline in klines],
+                            'volume': [float(kline['volume']) for kline in klines]}, replace_last=True)
+
+    def closes(self, count: int):
+        """
+        Function getting the last candles as the indicators use them
+        :param count: number of candles
+        :type count: int
+        :return: [(open time, close), ...] from the oldest
+        :rtype: list
+        """
+        rows = self.tail(count)
+        return list(zip(rows['open_time'].tolist(), rows['close'].tolist()))
+
+    def update(self, request, since: int, step: int, limit: int = ARCHIVE_KLINE_LIMIT):
+        """
+        Function requesting the candles from since to now page by page and appending them
+        :param request: function (since, limit) returning kline dicts from the oldest
+        :type request: callable
+        :param since: open time of the first candle
+        :type since: int
+        :param step: candle length (seconds)
+        :type step: int
+        :param limit: candles per request
+        :type limit: int
+        :return: number of rows written
+        :rtype: int
+        """
+        written = 0
+        while True:
+            klines = request(since, limit)
+            if len(klines) == 0:
+                return written
+            written += self.append_klines(klines)
+            last = self.last_time()
+            if len(klines) < limit or last is None or last < since:
+                return written
+            # the last candle may still be open, it is requested again with the next page
+            since = last if last > since else since + step
+
+
+class TradeSeries(ArchiveSeries):
+
+    def __init__(self, directory: str):
+        super().__init__(directory, TRADE_COLUMNS)
+
+    def append_trades(self, ts, price, size, side, after_last: bool = False):
+        """
+        Function appending trades (one writer per symbol, trades older than the last stored one are skipped)
+        :param ts: times (seconds)
+        :param price: prices
+        :param size: sizes (contracts)
+        :param side: taker sides (1 buy, -1 sell)
+        :param after_last: trades at the last stored time are skipped too (backfill overlapping the archive)
+        :type after_last: bool
+        :return: number of rows written
+        :rtype: int
+        """
+        return self.append({'ts': ts, 'price': price, 'size': size, 'side': side}, after_last=after_last)
+
+    def append_stream(self, trades: list):
+        """
+        Function appending trades of the public trade stream
+        :param trades: dicts with trade_time_ms, price, size, side
+        :type trades: list
+        :return: number of rows written
+        :rtype: int
+        """
+        return self.append_trades([int(trade['trade_time_ms']) / 1000 for trade in trades],
+                                  [float(trade['price']) for trade in trades],
+                                  [float(trade['size']) for trade in trades],
+                                  [1 if trade['side'] == 'Buy' else -1 for trade in trades])
+
+
+class MarketArchive:
+
+    def __init__(self, directory: str = ARCHIVE_DIR):
+        """
+        Local history of klines and trades, {directory}/{symbol}/klines_{interval} and {directory}/{symbol}/trades
+        :param directory: root directory
+        :type directory: str
+        :return: None
+        """
+        self.directory = directory
+        self.series = {}
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_lock'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _get(self, key: tuple, factory):
+        with self._lock:
+            series = self.series.get(key)
+            if series is None:
+                series = factory(os.path.join(self.directory, *key))
+                self.series[key] = series
+            return series
+
+    def klines(self, symbol: str, interval):
+        """
+        Function getting the candles of a symbol / interval
+        :param symbol: symbol instrument
+        :type symbol: str
+        :param interval: kline interval (minutes, D, W or M)
+        :return: series
+        :rtype: KlineSeries
+        """
+        return self._get((symbol, f'klines_{interval}'), KlineSeries)
+
+    def trades(self, symbol: str):
+        """
+        Function getting the trades of a symbol
+        :param symbol: symbol instrument
+        :type symbol: str
+        :return: series
+        :rtype: TradeSeries
+        """
+        return self._get((symbol, 'trades'), TradeSeries)
+
+
+def request_klines(http, base_url: str, symbol: str, interval, since: int, limit: int = ARCHIVE_KLINE_LIMIT,
+                   proxies: dict = None):
+    """
+    Function requesting klines from the public REST api
+    :param http: keep-alive client
+    :type http: HttpClient
+    :param base_url: REST url
+    :type base_url: str
+    :param symbol: symbol instrument
+    :type symbol: str
+    :param interval: kline interval
+    :param since: open time of the first candle
+    :type since: int
+    :param limit: number of candles (max 200)
+    :type limit: int
+    :param proxies: proxies of the request
+    :type proxies: dict
+    :return: kline dicts from the oldest
+    :rtype: list
+    """
+    url = f'{base_url}/public/linear/kline?symbol={symbol}&interval={interval}&from={since}&limit={limit}'
+    response = loads(http.request('GET', url, proxies=proxies).text)
+    return response['result'] or []
@@ -0,0 +1,195 @@
+import logging
+import threading
+import time
+import redis
+from bots.settings import PUBLIC_STREAM_URLS, MARKET_DATA_PUBLISH_INTERVAL, MARKET_DATA_BOOK_TOPIC, \
+    MARKET_UPDATES_CHANNEL, ORDERBOOK_BANDS, ORDERBOOK_SUPERIORITY_BAND, ORDERBOOK_SEQ_KEY, MARKET_DATA_BOOK_TTL
+from bots.stream import BybitStream
+from bots.orderBook import create_order_book
+from bots.marketArchive import MarketArchive
+
+log_info = logging.getLogger('bots_info')
+log_error = logging.getLogger('bots_error')
+
+# written without expiry, last_value_ts (receive time of the last trade) tells how old the price is
+PRICE_KEYS = ('last_value', 'last_value_ts')
+
+
+class MarketDataDaemon:
+
+    def __init__(self, symbol: str, mode: str, redis_con, publish_interval: float = MARKET_DATA_PUBLISH_INTERVAL,
+                 url: str = None, archive: MarketArchive = None, book_ttl: float = MARKET_DATA_BOOK_TTL):
+        """
+        Producer of the market keys read by the strategies (last_value, last_value_ts, superiority_buy,
+        superiority_sell, imbalance_{ticks} of every depth band)
+        :param symbol: symbol instrument
+        :type symbol: str
+        :param mode: mode work (testnet or Mainenet)
+        :type mode: str
+        :param redis_con: redis connection
+        :type redis_con: redis.Redis
+        :param publish_interval: seconds between batched redis writes
+        :type publish_interval: float
+        :param url: websocket url (PUBLIC_STREAM_URLS[mode] if None)
+        :type url: str
+        :param archive: market archive the trades are appended to (not stored if None)
+        :type archive: MarketArchive
+        :param book_ttl: seconds the order book keys live in redis without a refresh
+        :type book_ttl: float
+        :return: None
+        """
+        self.symbol = symbol
+        self.redis_con = redis_con
+        self.publish_interval = publish_interval
+        self.book_ttl = book_ttl
+        self.trade_topic = f'trade.{symbol}'
+        self.book_topic = f'{MARKET_DATA_BOOK_TOPIC}.{symbol}'
+        self.stream = BybitStream(url if url is not None else PUBLIC_STREAM_URLS[mode],
+                                  [self.trade_topic, self.book_topic], self._on_message, self._on_connect)
+        self.last_price = None
+        self.last_price_time = None
+        self.book = create_order_book(symbol)
+        self.published = {}
+        self._book_written = 0.0  # monotonic time the book keys were last written with their expiry
+        self.archive = archive
+        self._trades = []
+        self.writes = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def _on_connect(self):
+        # the book is rebuilt from the snapshot sent after every subscription
+        with self._lock:
+            self.book.reset()
+
+    def _on_message(self, topic: str, message: dict):
+        if topic == self.trade_topic:
+            if len(message['data']) > 0:
+                self.last_price = float(message['data'][-1]['price'])
+                self.last_price_time = time.time()
+                if self.archive is not None:
+                    with self._lock:
+                        self._trades.extend(message['data'])
+        elif topic == self.book_topic:
+            with self._lock:
+                if message.get('type') == 'snapshot':
+                    self.book.apply_snapshot(message['data']['order_book'], message.get(ORDERBOOK_SEQ_KEY))
+                    return
+                data = message['data']
+                if self.book.apply_delta(data.get('delete', []), data.get('update', []), data.get('insert', []),
+                                         message.get(ORDERBOOK_SEQ_KEY)):
+                    return
+            # the stream reconnects and the new subscription sends a snapshot
+            raise ConnectionError(f"order book of {self.symbol} is out of sync: {self.book.gap_reason}")
+
+    def get_values(self):
+        """
+        Function getting current market values
+        :return: dict of redis keys and values
+        """
+        values = {}
+        if self.last_price is not None:
+            values['last_value'] = self.last_price
+            values['last_value_ts'] = round(self.last_price_time, 3)
+        with self._lock:
+            if not self.book.ready:
+                return values
+            superiority = self.book.superiority(ORDERBOOK_SUPERIORITY_BAND)
+            imbalances = {ticks: self.book.imbalance(ticks) for ticks in ORDERBOOK_BANDS}
+        if superiority is not None:
+            values['superiority_buy'] = round(superiority[0], 4)
+            values['superiority_sell'] = round(superiority[1], 4)
+        for ticks, imbalance in imbalances.items():
+            if imbalance is not None:
+                values[f'imbalance_{ticks}'] = round(imbalance, 4)
+        return values
+
+    def publish(self):
+        """
+        Function writing changed values to redis in one pipelined batch and notifying consumers.
+        The order book keys expire unless refreshed, so a dead daemon or book does not leave them behind,
+        and they are deleted as soon as the book is out of sync
+        :return: number of changed or deleted keys
+        :rtype: int
+        """
+        values = self.get_values()
+        changed = {key: value for key, value in values.items() if self.published.get(key) != value}
+        removed = [key for key in self.published if key not in values]
+        now = time.monotonic()
+        book_values = {key: value for key, value in values.items() if key not in PRICE_KEYS}
+        refresh = len(book_values) > 0 and now - self._book_written >= self.book_ttl / 2
+        if len(changed) == 0 and len(removed) == 0 and not refresh:
+            return 0
+        pipe = self.redis_con.pipeline(transaction=False)
+        prices = {key: value for key, value in changed.items() if key in PRICE_KEYS}
+        if len(prices) > 0:
+            pipe.mset(prices)
+        ttl_ms = int(self.book_ttl * 1000)
+        for key, value in (book_values if refresh else changed).items():
+            if key not in PRICE_KEYS:
+                pipe.set(key, value, px=ttl_ms)
+        if len(removed) > 0:
+            pipe.delete(*removed)
+        # a new trade at the same price is no change for the consumers
+        notified = [key for key in changed if key != 'last_value_ts'] + removed
+        if len(notified) > 0:
+            pipe.publish(MARKET_UPDATES_CHANNEL, ','.join(notified))
+        pipe.execute()
+        if refresh:
+            self._book_written = now
+        self.published.update(changed)
+        for key in removed:
+            del self.published[key]
+        self.writes += 1
+        return len(changed) + len(removed)
+
+    def store_trades(self):
+        """
+        Function appending the trades received since the last call to the archive (one write per batch)
+        :return: number of stored trades
+        :rtype: int
+        """
+        with self._lock:
+            trades, self._trades = self._trades, []
+        if len(trades) == 0:
+            return 0
+        return self.archive.trades(self.symbol).append_stream(trades)
+
+    def run(self):
+        """
+        Function running the daemon
+        :return: None
+        """
+        log_info.info(f"market data daemon started for {self.symbol}")
+        self.stream.start()
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                self.publish()
+            except Exception as exc:
+                log_error.error(exc)
+            if self.archive is not None:
+                try:
+                    self.store_trades()
+                except Exception as exc:
+                    log_error.error(exc)
+            self._stop.wait(max(self.publish_interval - (time.monotonic() - started), 0))
+        self.stream.stop()
+        if self.archive is not None:
+            try:
+                self.store_trades()
+            except Exception as exc:
+                log_error.error(exc)
+
+    def stop(self):
+        """
+        Function stopping the daemon
+        :return: None
+        """
+        self._stop.set()
+
+
+def runMarketData(symbol, mode, host_redis, port_redis):
+    redis_con = redis.Redis(host=host_redis, port=port_redis, db=0)
+    daemon = MarketDataDaemon(symbol, mode, redis_con, archive=MarketArchive())
+    daemon.run()
@@ -0,0 +1,419 @@
+import bisect
+import logging
+import threading
+import time
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+from bots.settings import METRICS_HOST, METRICS_PORT, METRICS_REQUEST_BUCKETS, METRICS_LOOP_BUCKETS, \
+    METRICS_REDIS_BUCKETS, METRICS_REDIS_READS
+
+log_info = logging.getLogger('bots_info')
+log_error = logging.getLogger('bots_error')
+
+
+def _format_value(value: float):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _CounterChild:
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+
+class _HistogramChild:
+
+    def __init__(self, bounds: list):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)  # per bucket, made cumulative when rendered
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.buckets[index] += 1
+            self.sum += value
+
+    def time(self):
+        return _Timer(self)
+
+
+class _Timer:
+
+    def __init__(self, child: _HistogramChild):
+        self.child = child
+        self.started = 0.0
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.child.observe(time.perf_counter() - self.started)
+
+
+class Metric:
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        """
+        Metric family, one child per label values
+        :param name: metric name
+        :type name: str
+        :param documentation: help text
+        :type documentation: str
+        :param labelnames: label names
+        :type labelnames: tuple
+        :return: None
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def _create_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """
+        Function getting the child of label values (created once, then a dict lookup)
+        :return: child
+        """
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(values, self._create_child())
+        return child
+
+    def collect(self):
+        """
+        Function getting the exposition lines of the family
+        :return: lines
+        :rtype: list
+        """
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def _create_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def collect(self):
+        return [f'{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}'
+                for values, child in list(self._children.items())]
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: list = METRICS_REQUEST_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.bounds = sorted(float(bound) for bound in buckets)
+
+    def _create_child(self):
+        return _HistogramChild(self.bounds)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def collect(self):
+        lines = []
+        for values, child in list(self._children.items()):
+            with child._lock:
+                buckets, total = list(child.buckets), child.sum
+            cumulative = 0
+            for bound, count in zip(self.bounds + [float('inf')], buckets):
+                cumulative += count
+                labels = _format_labels(self.labelnames, values, f'le="{_format_value(bound)}"')
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        """
+        Metrics of the process, rendered in the prometheus text format
+        :return: None
+        """
+        self.metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: Metric):
+        with self._lock:
+            if metric.name in self.metrics:
+                raise ValueError(f"metric {metric.name} is already registered")
+            self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple = (), buckets: list = METRICS_REQUEST_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        """
+        Function rendering every metric
+        :return: text exposition format 0.0.4
+        :rtype: str
+        """
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.collect())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+REQUEST_SECONDS = REGISTRY.histogram('bybit_request_seconds', 'go_command latency, rate limit wait included',
+                                     ('endpoint', 'status'), METRICS_REQUEST_BUCKETS)
+REQUEST_ERRORS = REGISTRY.counter('bybit_request_errors_total', 'requests answered with ret_code != 0 or failed',
+                                  ('endpoint', 'code'))
+REQUEST_RETRIES = REGISTRY.counter('bybit_request_retries_total', 'requests sent again', ('endpoint', 'reason'))
+LOOP_SECONDS = REGISTRY.histogram('strategy_loop_iteration_seconds', 'work of a strategy loop iteration, wait excluded',
+                                  ('loop',), METRICS_LOOP_BUCKETS)
+REACTION_SECONDS = REGISTRY.histogram('strategy_reaction_seconds',
+                                      'wake-up by a fill to the take profit acknowledged', ('strategy', 'event'),
+                                      METRICS_REQUEST_BUCKETS)
+REDIS_READ_SECONDS = REGISTRY.histogram('redis_read_seconds', 'redis read latency', ('command',),
+                                        METRICS_REDIS_BUCKETS)
+
+
+@lru_cache(maxsize=256)
+def endpoint_path(url: str):
+    """
+    Function getting the endpoint label of an url
+    :param url: url
+    :type url: str
+    :return: path
+    :rtype: str
+    """
+    return urlsplit(url).path
+
+
+def observe_request(url: str, seconds: float, response=None, error: Exception = None):
+    """
+    Function recording a go_command call
+    :param url: url bybit
+    :type url: str
+    :param seconds: duration
+    :type seconds: float
+    :param response: dict with data
+    :type response: dict
+    :param error: exception raised instead of a response
+    :type error: Exception
+    :return: None
+    """
+    endpoint = endpoint_path(url)
+    if error is not None:
+        status = 'exception'
+        REQUEST_ERRORS.labels(endpoint, type(error).__name__).inc()
+    elif isinstance(response, dict):
+        status = str(response.get('ret_code'))
+        if response.get('ret_code') != 0:
+            REQUEST_ERRORS.labels(endpoint, status).inc()
+    else:
+        status = 'invalid'
+        REQUEST_ERRORS.labels(endpoint, status).inc()
+    REQUEST_SECONDS.labels(endpoint, status).observe(seconds)
+
+
+def observe_retry(url: str, reason: str):
+    REQUEST_RETRIES.labels(endpoint_path(url), reason).inc()
+
+
+class LoopTimer:
+
+    def __init__(self, loop: str):
+        """
+        Timer of a strategy loop, the loop waits through it
+        :param loop: loop name
+        :type loop: str
+        :return: None
+        """
+        self.loop = loop
+        self.iterations = LOOP_SECONDS.labels(loop)
+        self.woken = time.perf_counter()
+
+    def wait(self, wait_for_update, timeout: float):
+        """
+        Function recording the iteration and waiting
+        :param wait_for_update: wait function of the bot
+        :param timeout: max seconds to wait
+        :type timeout: float
+        :return: result of the wait
+        """
+        self.iterations.observe(time.perf_counter() - self.woken)
+        try:
+            return wait_for_update(timeout)
+        finally:
+            self.woken = time.perf_counter()
+
+    def reacted(self, strategy: str, event: str):
+        """
+        Function recording the time since the last wake-up (call it when the reaction is acknowledged)
+        :param strategy: strategy name
+        :type strategy: str
+        :param event: what was reacted to
+        :type event: str
+        :return: None
+        """
+        REACTION_SECONDS.labels(strategy, event).observe(time.perf_counter() - self.woken)
+
+
+class InstrumentedRedis:
+
+    def __init__(self, redis_con, reads: list = METRICS_REDIS_READS):
+        """
+        Redis connection timing its reads, everything else is passed through
+        :param redis_con: redis connection
+        :type redis_con: redis.Redis
+        :param reads: timed commands
+        :type reads: list
+        :return: None
+        """
+        self.redis_con = redis_con
+        self.reads = {name: REDIS_READ_SECONDS.labels(name) for name in reads}
+
+    def __getattr__(self, name: str):
+        attr = getattr(self.redis_con, name)
+        child = self.reads.get(name)
+        if child is None or not callable(attr):
+            return attr
+
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return attr(*args, **kwargs)
+            finally:
+                child.observe(time.perf_counter() - started)
+        return timed
+
+    def register_script(self, script: str):
+        # the script calls evalsha on this wrapper, so its round trips are timed too
+        from redis.commands.core import Script
+        return Script(self, script)
+
+
+class MetricsServer:
+
+    def __init__(self, port: int = METRICS_PORT, host: str = METRICS_HOST, registry: MetricsRegistry = REGISTRY):
+        """
+        Local http endpoint serving the metrics on /metrics
+        :param port: port (a free one if 0)
+        :type port: int
+        :param host: host
+        :type host: str
+        :param registry: metrics
+        :type registry: MetricsRegistry
+        :return: None
+        """
+        self.registry = registry
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}/metrics'
+
+    def _handler_class(self):
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                data = registry.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                return None
+
+        return Handler
+
+    def start(self):
+        """
+        Function serving in a background thread
+        :return: url of the metrics
+        :rtype: str
+        """
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='metrics', daemon=True)
+        self._thread.start()
+        log_info.info(f"metrics served on {self.url}")
+        return self.url
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def start_metrics_server(port: int = METRICS_PORT, host: str = METRICS_HOST):
+    """
+    Function starting the metrics endpoint of the process, a taken port only disables it
+    :param port: port
+    :type port: int
+    :param host: host
+    :type host: str
+    :return: server or None
+    :rtype: MetricsServer
+    """
+    try:
+        server = MetricsServer(port, host)
+    except OSError as exc:
+        log_error.error(f"metrics endpoint on port {port} is not started: {exc}")
+        return None
+    server.start()
+    return server
+
+
+def run_with_metrics(port: int, target, *args):
+    """
+    Function serving the metrics of a child process on its own port and running its target
+    :param port: port
+    :type port: int
+    :param target: process function
+    :return: result of target
+    """
+    start_metrics_server(port)
+    return target(*args)
@@ -0,0 +1,333 @@
+from bots.settings import TICK_SIZES, DEFAULT_TICK_SIZE, ORDERBOOK_LADDER_SIZE, ORDERBOOK_RESYNC
+
+
+class PriceLadder:
+
+    def __init__(self, capacity: int = ORDERBOOK_LADDER_SIZE):
+        """
+        Sizes of one book side indexed by tick offset, with a Fenwick tree for O(log n) band sums
+        :param capacity: number of ticks
+        :type capacity: int
+        :return: None
+        """
+        self.capacity = capacity
+        self.sizes = [0.0] * capacity
+        self.tree = [0.0] * (capacity + 1)
+        self.total = 0.0
+        self.levels = 0
+
+    def set(self, index: int, size: float):
+        """
+        Function setting the size of a tick
+        :param index: tick offset
+        :type index: int
+        :param size: size (0 removes the level)
+        :type size: float
+        :return: None
+        """
+        sizes = self.sizes
+        delta = size - sizes[index]
+        if delta == 0:
+            return
+        if sizes[index] == 0:
+            self.levels += 1
+        elif size == 0:
+            self.levels -= 1
+        sizes[index] = size
+        self.total += delta
+        tree = self.tree
+        capacity = self.capacity
+        index += 1
+        while index <= capacity:
+            tree[index] += delta
+            index += index & -index
+
+    def prefix(self, index: int):
+        """
+        Function summing the sizes of the ticks below an offset
+        :param index: tick offset (excluded)
+        :type index: int
+        :return: volume
+        :rtype: float
+        """
+        tree = self.tree
+        index = min(max(index, 0), self.capacity)
+        total = 0.0
+        while index > 0:
+            total += tree[index]
+            index -= index & -index
+        return total
+
+    def range_sum(self, start: int, stop: int):
+        """
+        Function summing the sizes of [start, stop)
+        :return: volume
+        :rtype: float
+        """
+        if stop <= start:
+            return 0.0
+        return self.prefix(stop) - self.prefix(start)
+
+    def rebuild(self):
+        """
+        Function recomputing the tree and the totals exactly from the sizes in O(n)
+        :return: None
+        """
+        tree = [0.0] + list(self.sizes)
+        capacity = self.capacity
+        for index in range(1, capacity + 1):
+            parent = index + (index & -index)
+            if parent <= capacity:
+                tree[parent] += tree[index]
+        self.tree = tree
+        self.total = sum(self.sizes)
+        self.levels = sum(1 for size in self.sizes if size != 0)
+
+
+class OrderBook:
+
+    def __init__(self, tick_size: float = DEFAULT_TICK_SIZE, capacity: int = ORDERBOOK_LADDER_SIZE,
+                 resync: int = ORDERBOOK_RESYNC):
+        """
+        L2 book maintained from snapshot and delta messages, price levels live in tick ladders so an update
+        costs O(log n) per changed level and a depth band sum O(log n)
+        :param tick_size: price tick of the symbol
+        :type tick_size: float
+        :param capacity: ticks per ladder
+        :type capacity: int
+        :param resync: level changes between exact recomputations of the sums
+        :type resync: int
+        :return: None
+        """
+        self.tick_size = tick_size
+        self.capacity = capacity
+        self.resync = resync
+        self.base = 0
+        self.bids = PriceLadder(capacity)
+        self.asks = PriceLadder(capacity)
+        self.best_bid = None  # ladder offsets
+        self.best_ask = None
+        self.ready = False
+        self.seq = None
+        self.gaps = 0
+        self.changes = 0
+        self.gap_reason = None
+
+    def reset(self):
+        self.bids = PriceLadder(self.capacity)
+        self.asks = PriceLadder(self.capacity)
+        self.best_bid = None
+        self.best_ask = None
+        self.ready = False
+        self.seq = None
+
+    def to_ticks(self, price):
+        return int(round(float(price) / self.tick_size))
+
+    def _recenter(self, ticks: int):
+        """
+        Function moving the ladders so a tick outside of them fits, they grow when the book is wider
+        :param ticks: tick that has to fit
+        :type ticks: int
+        :return: None
+        """
+        levels = [(self.base + index, size, side) for side, ladder in (('Buy', self.bids), ('Sell', self.asks))
+                  for index, size in enumerate(ladder.sizes) if size != 0]
+        low = min([level[0] for level in levels] + [ticks])
+        high = max([level[0] for level in levels] + [ticks])
+        while high - low >= self.capacity // 2:
+            self.capacity *= 2
+        self.base = (low + high) // 2 - self.capacity // 2
+        self.bids = PriceLadder(self.capacity)
+        self.asks = PriceLadder(self.capacity)
+        for level_ticks, size, side in levels:
+            ladder = self.bids if side == 'Buy' else self.asks
+            ladder.sizes[level_ticks - self.base] = size
+        self.bids.rebuild()
+        self.asks.rebuild()
+        self.best_bid = self._scan_bid(self.capacity - 1)
+        self.best_ask = self._scan_ask(0)
+
+    def _scan_bid(self, index: int):
+        sizes = self.bids.sizes
+        while index >= 0:
+            if sizes[index] != 0:
+                return index
+            index -= 1
+        return None
+
+    def _scan_ask(self, index: int):
+        sizes = self.asks.sizes
+        capacity = self.capacity
+        while index < capacity:
+            if sizes[index] != 0:
+                return index
+            index += 1
+        return None
+
+    def _set(self, level: dict, size: float, must_exist: bool):
+        """
+        Function setting a level
+        :param level: level of the message (price, side)
+        :type level: dict
+        :param size: new size (0 deletes)
+        :type size: float
+        :param must_exist: the level has to be in the book (update / delete)
+        :type must_exist: bool
+        :return: False if the book does not match the message
+        :rtype: bool
+        """
+        index = self.to_ticks(level['price']) - self.base
+        if index < 0 or index >= self.capacity:
+            if must_exist:
+                return False
+            self._recenter(index + self.base)
+            index = self.to_ticks(level['price']) - self.base
+        if level['side'] == 'Buy':
+            ladder = self.bids
+            if must_exist and ladder.sizes[index] == 0:
+                return False
+            ladder.set(index, size)
+            if size != 0:
+                if self.best_bid is None or index > self.best_bid:
+                    self.best_bid = index
+            elif index == self.best_bid:
+                self.best_bid = self._scan_bid(index - 1)
+        else:
+            ladder = self.asks
+            if must_exist and ladder.sizes[index] == 0:
+                return False
+            ladder.set(index, size)
+            if size != 0:
+                if self.best_ask is None or index < self.best_ask:
+                    self.best_ask = index
+            elif index == self.best_ask:
+                self.best_ask = self._scan_ask(index + 1)
+        return True
+
+    def apply_snapshot(self, levels: list, seq: int = None):
+        """
+        Function replacing the book
+        :param levels: levels (price, side, size)
+        :type levels: list
+        :param seq: sequence of the message
+        :type seq: int
+        :return: None
+        """
+        self.reset()
+        ticks = [self.to_ticks(level['price']) for level in levels]
+        if len(ticks) > 0:
+            while max(ticks) - min(ticks) >= self.capacity // 2:
+                self.capacity *= 2
+            self.base = (max(ticks) + min(ticks)) // 2 - self.capacity // 2
+        self.bids = PriceLadder(self.capacity)
+        self.asks = PriceLadder(self.capacity)
+        for level in levels:
+            self._set(level, float(level['size']), False)
+        self.seq = seq
+        self.ready = True
+        self.gap_reason = None
+
+    def apply_delta(self, delete: list, update: list, insert: list, seq: int = None):
+        """
+        Function applying a delta message, a gap (sequence going back, level missing) invalidates the book
+        until the next snapshot
+        :param delete: removed levels
+        :type delete: list
+        :param update: changed levels
+        :type update: list
+        :param insert: new levels
+        :type insert: list
+        :param seq: sequence of the message
+        :type seq: int
+        :return: False if the book is out of sync
+        :rtype: bool
+        """
+        if not self.ready:
+            return False
+        if seq is not None and self.seq is not None and seq <= self.seq:
+            return self._gap(f"sequence {seq} after {self.seq}")
+        for level in delete:
+            if not self._set(level, 0.0, True):
+                return self._gap(f"deleted level {level['side']} {level['price']} is not in the book")
+        for level in update:
+            if not self._set(level, float(level['size']), True):
+                return self._gap(f"updated level {level['side']} {level['price']} is not in the book")
+        for level in insert:
+            self._set(level, float(level['size']), False)
+        if seq is not None:
+            self.seq = seq
+        self.changes += len(delete) + len(update) + len(insert)
+        if self.changes >= self.resync:
+            # incremental float sums drift, they are recomputed exactly once in a while
+            self.changes = 0
+            self.bids.rebuild()
+            self.asks.rebuild()
+        return True
+
+    def _gap(self, reason: str):
+        self.ready = False
+        self.gaps += 1
+        self.gap_reason = reason
+        return False
+
+    def get_best(self):
+        """
+        Function getting the best prices
+        :return: (best bid, best ask), None for an empty side
+        :rtype: tuple
+        """
+        bid = None if self.best_bid is None else round((self.base + self.best_bid) * self.tick_size, 10)
+        ask = None if self.best_ask is None else round((self.base + self.best_ask) * self.tick_size, 10)
+        return bid, ask
+
+    def band_volumes(self, ticks: int = None):
+        """
+        Function summing the sizes within ticks of the best price of every side
+        :param ticks: band width (whole book if None)
+        :type ticks: int
+        :return: (bid volume, ask volume)
+        :rtype: tuple
+        """
+        if ticks is None:
+            return self.bids.total, self.asks.total
+        bids = 0.0 if self.best_bid is None else self.bids.range_sum(self.best_bid - ticks + 1, self.best_bid + 1)
+        asks = 0.0 if self.best_ask is None else self.asks.range_sum(self.best_ask, self.best_ask + ticks)
+        return bids, asks
+
+    def imbalance(self, ticks: int = None):
+        """
+        Function getting (bids - asks) / (bids + asks) of a band
+        :param ticks: band width (whole book if None)
+        :type ticks: int
+        :return: imbalance in [-1, 1], None for an empty band
+        :rtype: float
+        """
+        bids, asks = self.band_volumes(ticks)
+        if bids + asks <= 0:
+            return None
+        return (bids - asks) / (bids + asks)
+
+    def superiority(self, ticks: int = None):
+        """
+        Function getting the ratios of the sides of a band
+        :param ticks: band width (whole book if None)
+        :type ticks: int
+        :return: (bids / asks, asks / bids), None if a side is empty
+        :rtype: tuple
+        """
+        bids, asks = self.band_volumes(ticks)
+        if bids <= 0 or asks <= 0:
+            return None
+        return bids / asks, asks / bids
+
+
+def create_order_book(symbol: str):
+    """
+    Function creating an order book with the tick of the symbol
+    :param symbol: symbol instrument
+    :type symbol: str
+    :return: order book
+    :rtype: OrderBook
+    """
+    return OrderBook(TICK_SIZES.get(symbol, DEFAULT_TICK_SIZE))
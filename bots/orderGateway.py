@@ -0,0 +1,204 @@
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from bots.stream import UpdateNotifier
+from bots.settings import GATEWAY_READ_WORKERS, GATEWAY_HEARTBEAT_INTERVAL, GATEWAY_HEARTBEAT_TIMEOUT, \
+    GATEWAY_CALL_TIMEOUT
+
+log_info = logging.getLogger('bots_info')
+log_error = logging.getLogger('bots_error')
+
+# answered from the shared account state by a pool of readers
+GATEWAY_READ_METHODS = ['get_market_qty', 'get_market_entry_price', 'get_info_open_limit_orders',
+                        'get_price_last_draw_limit_order', 'get_qty_limits_order', 'get_params', 'find_price',
+                        'calculate_qty', 'calculate_limit_price', 'get_order_id', 'get_connection_stats']
+# order intents, executed one by one in arrival order
+GATEWAY_WRITE_METHODS = ['post_limit_order', 'post_market_order', 'del_limit_order', 'put_stop_loss', 'market_all']
+
+
+class SharedUpdateNotifier(UpdateNotifier):
+
+    def __init__(self):
+        """
+        Update notifier shared by the gateway and the worker processes
+        :return: None
+        """
+        self._seq = multiprocessing.Value('q', 0, lock=False)
+        self._condition = multiprocessing.Condition()
+        self._local = threading.local()
+
+    @property
+    def seq(self):
+        return self._seq.value
+
+    @seq.setter
+    def seq(self, value):
+        self._seq.value = value
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_local'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+
+class GatewayClient:
+
+    def __init__(self, client_id: int, requests, responses, updates: SharedUpdateNotifier, symbol: str,
+                 heartbeat, call_timeout: float = GATEWAY_CALL_TIMEOUT,
+                 heartbeat_timeout: float = GATEWAY_HEARTBEAT_TIMEOUT):
+        """
+        BotTrader stand-in of a worker process, every call is sent to the gateway
+        :param client_id: client id
+        :type client_id: int
+        :param requests: gateway request queue
+        :type requests: multiprocessing.Queue
+        :param responses: response queue of the client
+        :type responses: multiprocessing.Queue
+        :param updates: shared update notifier
+        :type updates: SharedUpdateNotifier
+        :param symbol: symbol instrument
+        :type symbol: str
+        :param heartbeat: shared time.time() of the last liveness mark of the gateway
+        :type heartbeat: multiprocessing.Value
+        :param call_timeout: seconds a call waits for its answer
+        :type call_timeout: float
+        :param heartbeat_timeout: seconds without a liveness mark before the gateway is considered dead
+        :type heartbeat_timeout: float
+        :return: None
+        """
+        self.client_id = client_id
+        self.requests = requests
+        self.responses = responses
+        self.updates = updates
+        self.symbol = symbol
+        self.heartbeat = heartbeat
+        self.call_timeout = call_timeout
+        self.heartbeat_timeout = heartbeat_timeout
+        self._call_id = 0
+
+    def _call(self, method: str, *args, **kwargs):
+        """
+        Function executing a BotTrader method in the gateway
+        :param method: method name
+        :type method: str
+        :return: result of the method
+        :raises ConnectionError: the gateway is dead or did not answer in call_timeout
+        """
+        self._call_id += 1
+        # the pid keeps the answers meant for a previous process of a restarted worker apart
+        call_id = (os.getpid(), self._call_id)
+        self.requests.put((self.client_id, call_id, method, args, kwargs))
+        started = time.monotonic()
+        while True:
+            waited = time.monotonic() - started
+            if waited >= self.call_timeout:
+                raise ConnectionError(f"order gateway did not answer {method} in {self.call_timeout} s")
+            try:
+                answer_id, ok, result = self.responses.get(timeout=min(self.call_timeout - waited,
+                                                                       GATEWAY_HEARTBEAT_INTERVAL))
+            except queue.Empty:
+                # a gateway starting up has not marked yet, it gets heartbeat_timeout like a running one
+                if waited >= self.heartbeat_timeout and \
+                        time.time() - self.heartbeat.value >= self.heartbeat_timeout:
+                    raise ConnectionError(f"order gateway is not alive, {method} is not answered")
+                continue
+            if answer_id == call_id:
+                break
+        if not ok:
+            raise result
+        return result
+
+    def __getattr__(self, name: str):
+        if name in GATEWAY_READ_METHODS or name in GATEWAY_WRITE_METHODS:
+            return lambda *args, **kwargs: self._call(name, *args, **kwargs)
+        raise AttributeError(name)
+
+    def start_stream(self, url: str = None):
+        # the stream is owned by the gateway
+        return None
+
+    def wait_for_update(self, timeout: float):
+        """
+        Function sleeping until a stream update in the gateway or timeout
+        :param timeout: max seconds to wait
+        :type timeout: float
+        :return: True if woken by an update
+        :rtype: bool
+        """
+        return self.updates.wait(timeout)
+
+
+class OrderGateway:
+
+    def __init__(self, bot_trader, read_workers: int = GATEWAY_READ_WORKERS):
+        """
+        Single owner of the exchange connection and the account state of a bot
+        :param bot_trader: bot
+        :type bot_trader: BotTrader
+        :param read_workers: threads answering reads
+        :type read_workers: int
+        :return: None
+        """
+        self.bot_trader = bot_trader
+        self.bot_trader.updates = SharedUpdateNotifier()
+        self.bot_trader.serialized_writes = True  # order intents run one by one in serve
+        self.read_workers = read_workers
+        self.requests = multiprocessing.Queue()
+        self.responses = []
+        self.heartbeat = multiprocessing.Value('d', 0.0, lock=False)
+
+    def connect(self):
+        """
+        Function creating a client for a worker process (must be called before the workers start)
+        :return: client
+        :rtype: GatewayClient
+        """
+        responses = multiprocessing.Queue()
+        self.responses.append(responses)
+        return GatewayClient(len(self.responses) - 1, self.requests, responses, self.bot_trader.updates,
+                             self.bot_trader.symbol, self.heartbeat)
+
+    def _beat(self):
+        # liveness mark read by the clients, it stops with the process
+        while True:
+            self.heartbeat.value = time.time()
+            time.sleep(GATEWAY_HEARTBEAT_INTERVAL)
+
+    def _execute(self, client_id: int, call_id: int, method: str, args: tuple, kwargs: dict):
+        try:
+            response = (call_id, True, getattr(self.bot_trader, method)(*args, **kwargs))
+        except Exception as exc:
+            log_error.error(exc)
+            response = (call_id, False, exc)
+        try:
+            self.responses[client_id].put(response)
+        except Exception as exc:
+            # an unpicklable result or error must not leave the worker waiting
+            self.responses[client_id].put((call_id, False, RuntimeError(repr(exc))))
+
+    def serve(self):
+        """
+        Function running the gateway: reads run concurrently on the shared state, order intents run one by one
+        :return: None
+        """
+        log_info.info("order gateway started")
+        threading.Thread(target=self._beat, name='gateway-heartbeat', daemon=True).start()
+        self.bot_trader.start_stream()
+        readers = ThreadPoolExecutor(max_workers=self.read_workers)
+        writer = ThreadPoolExecutor(max_workers=1)
+        while True:
+            client_id, call_id, method, args, kwargs = self.requests.get()
+            if method in GATEWAY_WRITE_METHODS:
+                writer.submit(self._execute, client_id, call_id, method, args, kwargs)
+            elif method in GATEWAY_READ_METHODS:
+                readers.submit(self._execute, client_id, call_id, method, args, kwargs)
+            else:
+                self.responses[client_id].put((call_id, False, AttributeError(method)))
@@ -0,0 +1,408 @@
+import threading
+import time
+import uuid
+from collections import deque
+from bots.settings import OMS_LINK_PREFIX, OMS_PENDING_TIMEOUT, OMS_DONE_TTL
+
+ORDER_PENDING_NEW = 'pending_new'  # create sent, no answer yet
+ORDER_OPEN = 'open'
+ORDER_PARTIALLY_FILLED = 'partially_filled'
+ORDER_PENDING_CANCEL = 'pending_cancel'  # cancel sent, no answer yet
+ORDER_DONE = 'done'  # filled, cancelled or rejected
+OPEN_STATES = (ORDER_OPEN, ORDER_PARTIALLY_FILLED)
+
+# order_status of the exchange -> local state
+EXCHANGE_STATES = {'Created': ORDER_OPEN, 'New': ORDER_OPEN, 'PartiallyFilled': ORDER_PARTIALLY_FILLED,
+                   'PendingCancel': ORDER_PENDING_CANCEL, 'Filled': ORDER_DONE, 'Cancelled': ORDER_DONE,
+                   'Rejected': ORDER_DONE, 'Deactivated': ORDER_DONE}
+
+
+class ManagedOrder:
+
+    def __init__(self, link_id: str, side: str, price: float, qty: float, reduce_only: bool, order_type: str,
+                 state: str, updated: float, order_id: str = None):
+        """
+        Local copy of an order
+        :param link_id: order_link_id (empty for an order placed outside of the manager)
+        :type link_id: str
+        :param side: Buy or Sell
+        :type side: str
+        :param price: limit price
+        :type price: float
+        :param qty: order qty
+        :type qty: float
+        :param reduce_only: open or close order (True or False)
+        :type reduce_only: bool
+        :param order_type: Limit or Market
+        :type order_type: str
+        :param state: local state
+        :type state: str
+        :param updated: clock time of the last change
+        :type updated: float
+        :param order_id: exchange order id (None until the exchange answered)
+        :type order_id: str
+        :return: None
+        """
+        self.link_id = link_id
+        self.order_id = order_id
+        self.side = side
+        self.price = price
+        self.qty = qty
+        self.filled = 0.0
+        self.reduce_only = reduce_only
+        self.order_type = order_type
+        self.state = state
+        self.updated = updated
+        self._previous_state = None  # state to return to when a cancel fails
+
+    @property
+    def key(self):
+        return self.link_id or self.order_id
+
+    def __repr__(self):
+        return f'ManagedOrder({self.order_id}, {self.link_id}, {self.side}, {self.price}, {self.qty}, {self.state})'
+
+
+class OrderManager:
+
+    def __init__(self, symbol: str, clock=time.monotonic, pending_timeout: float = OMS_PENDING_TIMEOUT,
+                 done_ttl: float = OMS_DONE_TTL):
+        """
+        In-memory order state of an account, updated from our own create / cancel answers and the order stream,
+        reconciled with order/search now and then. The open orders are indexed by side / reduce_only and price
+        :param symbol: symbol instrument
+        :type symbol: str
+        :param clock: monotonic clock function
+        :type clock: callable
+        :param pending_timeout: seconds an unanswered create is kept while the exchange does not show it
+        :type pending_timeout: float
+        :param done_ttl: seconds finished orders stay queryable
+        :type done_ttl: float
+        :return: None
+        """
+        self.symbol = symbol
+        self.clock = clock
+        self.pending_timeout = pending_timeout
+        self.done_ttl = done_ttl
+        self.orders = {}  # key -> order
+        self.active = {}  # key -> order not done
+        self.done = deque()  # (clock time, order) of finished orders, oldest first
+        self.by_id = {}  # order_id -> order
+        self.by_link = {}  # link_id -> order
+        self.open = {}  # (side, reduce_only) -> {key: order}
+        self.by_price = {}  # (side, reduce_only, price) -> {key: order}
+        self.reconciled = None  # clock time of the last reconcile
+        self.reconciles = 0
+        self.on_missed = None  # called when a reconcile finds orders filled or finished while we did not listen
+        self._lock = threading.RLock()
+        self._sync_lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_lock'] = None
+        state['_sync_lock'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+        self._sync_lock = threading.Lock()
+
+    def new_link_id(self):
+        return f'{OMS_LINK_PREFIX}-{uuid.uuid4().hex}'
+
+    def _set_state(self, order: ManagedOrder, state: str):
+        """
+        Function moving an order to a state and updating the indexes
+        :param order: order
+        :type order: ManagedOrder
+        :param state: new state
+        :type state: str
+        :return: None
+        """
+        was_open = order.state in OPEN_STATES and order.key in self.orders
+        if was_open:
+            self._unindex(order)
+        order.state = state
+        order.updated = self.clock()
+        if state == ORDER_DONE:
+            self.active.pop(order.key, None)
+            self.done.append((order.updated, order))
+        else:
+            self.active[order.key] = order
+        if state in OPEN_STATES:
+            self.open.setdefault((order.side, order.reduce_only), {})[order.key] = order
+            self.by_price.setdefault((order.side, order.reduce_only, order.price), {})[order.key] = order
+
+    def _unindex(self, order: ManagedOrder):
+        orders = self.open.get((order.side, order.reduce_only))
+        if orders is not None:
+            orders.pop(order.key, None)
+        price_key = (order.side, order.reduce_only, order.price)
+        orders = self.by_price.get(price_key)
+        if orders is not None:
+            orders.pop(order.key, None)
+            if len(orders) == 0:
+                del self.by_price[price_key]
+
+    def _add(self, order: ManagedOrder):
+        self.orders[order.key] = order
+        if order.link_id:
+            self.by_link[order.link_id] = order
+        if order.order_id:
+            self.by_id[order.order_id] = order
+        state, order.state = order.state, None
+        self._set_state(order, state)
+
+    def _find(self, order_id: str = None, link_id: str = None):
+        order = self.by_id.get(order_id) if order_id else None
+        if order is None and link_id:
+            order = self.by_link.get(link_id)
+        return order
+
+    def submitted(self, link_id: str, side: str, price: float, qty: float, reduce_only: bool,
+                  order_type: str = 'Limit'):
+        """
+        Function adding an order before its create request is sent
+        :param link_id: order_link_id of the request
+        :type link_id: str
+        :return: order
+        :rtype: ManagedOrder
+        """
+        with self._lock:
+            order = ManagedOrder(link_id, side, float(price), float(qty), reduce_only, order_type,
+                                 ORDER_PENDING_NEW, self.clock())
+            self._add(order)
+            return order
+
+    def created(self, link_id: str, response):
+        """
+        Function applying the answer of a create request
+        :param link_id: order_link_id of the request
+        :type link_id: str
+        :param response: response of /private/linear/order/create (None if the outcome is unknown)
+        :return: order or None if it was rejected
+        :rtype: ManagedOrder
+        """
+        with self._lock:
+            order = self.by_link.get(link_id)
+            if order is None:
+                return None
+            if response is None:
+                # a lost answer, reconcile finds the order by its link id
+                return order
+            if response.get('ret_code') != 0 or not response.get('result'):
+                self._set_state(order, ORDER_DONE)
+                return None
+            result = response['result']
+            self._attach_id(order, result.get('order_id'))
+            if order.state == ORDER_PENDING_NEW:
+                # the stream may have been faster, its state is newer than the answer
+                order.price = float(result.get('price', order.price) or order.price)
+                order.qty = float(result.get('qty', order.qty) or order.qty)
+                self._set_state(order, EXCHANGE_STATES.get(result.get('order_status'), ORDER_OPEN))
+            return order
+
+    def _attach_id(self, order: ManagedOrder, order_id: str):
+        if order_id and order.order_id != order_id:
+            order.order_id = order_id
+            self.by_id[order_id] = order
+
+    def cancel_requested(self, order_ids: list):
+        """
+        Function marking orders whose cancel request is sent
+        :param order_ids: order ids
+        :type order_ids: list
+        :return: None
+        """
+        with self._lock:
+            for order_id in order_ids:
+                order = self.by_id.get(order_id)
+                if order is not None and order.state in OPEN_STATES:
+                    order._previous_state = order.state
+                    self._set_state(order, ORDER_PENDING_CANCEL)
+
+    def cancelled(self, results: dict):
+        """
+        Function applying the answers of cancel requests, a failed cancel puts the order back
+        :param results: dict order_id - True if cancelled
+        :type results: dict
+        :return: None
+        """
+        with self._lock:
+            for order_id, done in results.items():
+                order = self.by_id.get(order_id)
+                if order is None or order.state != ORDER_PENDING_CANCEL:
+                    continue
+                self._set_state(order, ORDER_DONE if done else order._previous_state or ORDER_OPEN)
+
+    def _apply(self, info: dict, started: float = None):
+        """
+        Function applying the exchange view of an order (stream update or order/search entry)
+        :param info: order of the exchange
+        :type info: dict
+        :param started: clock time the order/search request was sent (None for a stream update)
+        :type started: float
+        :return: order
+        :rtype: ManagedOrder
+        """
+        state = EXCHANGE_STATES.get(info.get('order_status'))
+        if state is None:
+            return None
+        order = self._find(info.get('order_id'), info.get('order_link_id'))
+        if order is None:
+            if state == ORDER_DONE:
+                return None
+            order = ManagedOrder(info.get('order_link_id') or '', info.get('side'), float(info.get('price') or 0),
+                                 float(info.get('qty') or 0), bool(info.get('reduce_only')),
+                                 info.get('order_type', 'Limit'), state, self.clock(), info.get('order_id'))
+            self._add(order)
+        else:
+            self._attach_id(order, info.get('order_id'))
+            if order.state == ORDER_DONE:
+                # finished is final, a late update does not bring an order back
+                return order
+            if order.state == ORDER_PENDING_CANCEL and state in OPEN_STATES and \
+                    (started is None or order.updated >= started):
+                # our cancel is in flight, the answer decides
+                state = ORDER_PENDING_CANCEL
+            if order.state in OPEN_STATES:
+                self._unindex(order)
+                order.state = None
+            order.price = float(info.get('price') or order.price)
+            order.qty = float(info.get('qty') or order.qty)
+            self._set_state(order, state)
+        if info.get('cum_exec_qty') is not None:
+            order.filled = float(info['cum_exec_qty'])
+        return order
+
+    def apply_updates(self, infos: list):
+        """
+        Function applying order updates of the private stream
+        :param infos: orders of the stream message
+        :type infos: list
+        :return: None
+        """
+        with self._lock:
+            for info in infos:
+                self._apply(info)
+
+    def reconcile(self, infos: list, started: float):
+        """
+        Function making the local state match the active orders of the exchange, orders changed locally after the
+        request was sent keep their state
+        :param infos: result of /private/linear/order/search
+        :type infos: list
+        :param started: clock time the request was sent
+        :type started: float
+        :return: number of orders filled or finished without an update of ours or of the stream
+        :rtype: int
+        """
+        missed = 0
+        with self._lock:
+            seen = set()
+            for info in infos:
+                order = self._find(info.get('order_id'), info.get('order_link_id'))
+                filled = order.filled if order is not None else None
+                order = self._apply(info, started)
+                if order is not None:
+                    seen.add(order.key)
+                    if filled is not None and order.filled > filled:
+                        missed += 1
+            now = self.clock()
+            for key, order in list(self.active.items()):
+                if key in seen or order.updated >= started:
+                    continue
+                if order.state == ORDER_PENDING_NEW and now - order.updated < self.pending_timeout:
+                    # the create may still be on its way
+                    continue
+                # filled or cancelled while we did not listen
+                self._set_state(order, ORDER_DONE)
+                missed += 1
+            while self.done and now - self.done[0][0] > self.done_ttl:
+                updated, order = self.done.popleft()
+                if order.state == ORDER_DONE and order.updated == updated:
+                    self._drop(order)
+            self.reconciled = now
+            self.reconciles += 1
+        if missed > 0 and self.on_missed is not None:
+            self.on_missed()
+        return missed
+
+    def sync(self, fetch, max_age: float):
+        """
+        Function reconciling when the state is older than max_age, one thread fetches while the others answer
+        from the current state (they wait for the first reconcile only)
+        :param fetch: function returning the result of order/search (None on error)
+        :type fetch: callable
+        :param max_age: seconds
+        :type max_age: float
+        :return: True if reconciled
+        :rtype: bool
+        """
+        if self.age() < max_age:
+            return False
+        if not self._sync_lock.acquire(blocking=self.reconciled is None):
+            return False
+        try:
+            if self.age() < max_age:
+                return False
+            started = self.clock()
+            infos = fetch()
+            if infos is None:
+                return False
+            self.reconcile(infos, started)
+            return True
+        finally:
+            self._sync_lock.release()
+
+    def _drop(self, order: ManagedOrder):
+        self.orders.pop(order.key, None)
+        if order.order_id and self.by_id.get(order.order_id) is order:
+            del self.by_id[order.order_id]
+        if order.link_id and self.by_link.get(order.link_id) is order:
+            del self.by_link[order.link_id]
+
+    def expire(self):
+        """
+        Function asking for a reconcile before the next query
+        :return: None
+        """
+        self.reconciled = None
+
+    def age(self):
+        """
+        Function getting the seconds since the last reconcile
+        :return: seconds (inf before the first one)
+        :rtype: float
+        """
+        return float('inf') if self.reconciled is None else self.clock() - self.reconciled
+
+    def get(self, order_id: str = None, link_id: str = None):
+        with self._lock:
+            return self._find(order_id, link_id)
+
+    def open_orders(self, side: str, reduce_only: bool):
+        """
+        Function getting the open orders of a side
+        :param side: Buy or Sell
+        :type side: str
+        :param reduce_only: open or close orders (True or False)
+        :type reduce_only: bool
+        :return: orders
+        :rtype: list
+        """
+        with self._lock:
+            return list(self.open.get((side, reduce_only), {}).values())
+
+    def count(self, side: str, reduce_only: bool):
+        return len(self.open.get((side, reduce_only), ()))
+
+    def at_price(self, side: str, price: float, reduce_only: bool):
+        """
+        Function getting the open orders of a side at a price
+        :return: orders
+        :rtype: list
+        """
+        with self._lock:
+            return list(self.by_price.get((side, reduce_only, float(price)), {}).values())
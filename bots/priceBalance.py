@@ -0,0 +1,106 @@
+import logging
+import threading
+import time
+from bots.settings import PRICE_TTL, BALANCE_MAX_AGE
+
+log_error = logging.getLogger('bots_error')
+
+
+class PriceBalanceProvider:
+
+    def __init__(self, price_ttl: float = PRICE_TTL, balance_max_age: float = BALANCE_MAX_AGE, price_source=None):
+        """
+        Cache of the last price and the available balance used for order sizing
+        :param price_ttl: seconds a price is reused
+        :type price_ttl: float
+        :param balance_max_age: seconds a balance is reused if no fill or transfer invalidated it
+        :type balance_max_age: float
+        :param price_source: function returning a local (last price, time.time() of it) or None (e.g. the market
+            data in redis), optional. A price older than price_ttl is not used
+        :type price_source: callable
+        :return: None
+        """
+        self.price_ttl = price_ttl
+        self.balance_max_age = balance_max_age
+        self.price_source = price_source
+        self._price = None
+        self._price_time = 0.0
+        self._balance = None
+        self._balance_time = 0.0
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_lock'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def get_last_price(self):
+        """
+        Function getting a fresh last price without a call to the exchange
+        :return: price or None if it has to be requested
+        :rtype: float
+        """
+        with self._lock:
+            if self._price is not None and time.monotonic() - self._price_time < self.price_ttl:
+                return self._price
+        if self.price_source is not None:
+            try:
+                last = self.price_source()
+            except Exception as exc:
+                log_error.error(exc)
+                last = None
+            if last is not None:
+                price, price_time = last
+                # a producer that stopped leaves its last price behind, the ticker is requested instead
+                age = time.time() - price_time if price_time is not None else None
+                if price is not None and age is not None and age < self.price_ttl:
+                    self.set_last_price(price, age)
+                    return float(price)
+        return None
+
+    def set_last_price(self, price: float, age: float = 0.0):
+        """
+        Function storing a last price
+        :param price: price
+        :type price: float
+        :param age: seconds since the price was seen
+        :type age: float
+        :return: None
+        """
+        with self._lock:
+            self._price = float(price)
+            self._price_time = time.monotonic() - max(age, 0.0)
+
+    def get_balance(self):
+        """
+        Function getting the cached available balance
+        :return: balance or None if it has to be requested
+        :rtype: float
+        """
+        with self._lock:
+            if self._balance is not None and time.monotonic() - self._balance_time < self.balance_max_age:
+                return self._balance
+        return None
+
+    def set_balance(self, balance: float):
+        """
+        Function storing the available balance
+        :param balance: available balance (USDT)
+        :type balance: float
+        :return: None
+        """
+        with self._lock:
+            self._balance = float(balance)
+            self._balance_time = time.monotonic()
+
+    def invalidate_balance(self):
+        """
+        Function dropping the balance after a fill or a transfer
+        :return: None
+        """
+        with self._lock:
+            self._balance = None
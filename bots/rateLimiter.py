@@ -0,0 +1,327 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit
+from bots.settings import RATE_LIMITS, ENDPOINT_GROUPS, PRIORITY_CRITICAL, PRIORITY_TRADE, PRIORITY_READ, \
+    READ_RESERVE, READ_MAX_WAIT, READ_MAX_STALE, RATE_LIMIT_ERROR_CODES, RATE_LIMIT_PENALTY, RATE_LIMIT_DROPPED_CODE
+
+log_error = logging.getLogger('bots_error')
+
+
+def endpoint_group(url: str):
+    """
+    Function getting the rate limit group of an url
+    :param url: url
+    :type url: str
+    :return: group
+    :rtype: str
+    """
+    return ENDPOINT_GROUPS.get(urlsplit(url).path, 'other')
+
+
+def request_priority(method: str, url: str, params: dict):
+    """
+    Function getting the default priority of a request
+    :param method: GET or POST
+    :type method: str
+    :param url: url
+    :type url: str
+    :param params: dict with data for request
+    :type params: dict
+    :return: priority class
+    :rtype: int
+    """
+    if method == 'GET':
+        return PRIORITY_READ
+    path = urlsplit(url).path
+    if path.endswith('/cancel') or path.endswith('/cancel-all') or path.endswith('/trading-stop') or \
+            params.get('reduce_only') is True:
+        return PRIORITY_CRITICAL
+    return PRIORITY_TRADE
+
+
+class TokenBucket:
+
+    def __init__(self, limit: int, read_reserve: float = READ_RESERVE):
+        """
+        Token bucket of one endpoint group, waiters are served by priority
+        :param limit: requests per minute
+        :type limit: int
+        :param read_reserve: share of the bucket reads may not use
+        :type read_reserve: float
+        :return: None
+        """
+        self.capacity = float(limit)
+        self.rate = limit / 60
+        self.read_reserve = read_reserve
+        self.tokens = float(limit)
+        self.blocked_until = 0.0
+        self._updated = time.monotonic()
+        self._waiters = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _floor(self, priority: int):
+        return self.capacity * self.read_reserve if priority == PRIORITY_READ else 0.0
+
+    def under_pressure(self):
+        """
+        Function checking if reads would have to wait
+        :return: True if the tokens reads may use are spent
+        :rtype: bool
+        """
+        with self._condition:
+            now = time.monotonic()
+            self._refill(now)
+            return now < self.blocked_until or self.tokens - 1 < self._floor(PRIORITY_READ)
+
+    def acquire(self, priority: int, timeout: float = None):
+        """
+        Function taking a token, higher priority waiters go first
+        :param priority: priority class
+        :type priority: int
+        :param timeout: max seconds to wait (forever if None)
+        :type timeout: float
+        :return: True if a token was taken
+        :rtype: bool
+        """
+        ticket = (priority, next(self._counter))
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            heapq.heappush(self._waiters, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    floor = self._floor(priority)
+                    if self._waiters[0] == ticket and now >= self.blocked_until and self.tokens - 1 >= floor:
+                        self.tokens -= 1
+                        return True
+                    if deadline is not None and now >= deadline:
+                        return False
+                    if now < self.blocked_until:
+                        delay = self.blocked_until - now
+                    else:
+                        delay = max((floor + 1 - self.tokens) / self.rate, 0.001)
+                    if deadline is not None:
+                        delay = min(delay, deadline - now)
+                    self._condition.wait(delay)
+            finally:
+                self._waiters.remove(ticket)
+                heapq.heapify(self._waiters)
+                self._condition.notify_all()
+
+    def update(self, limit: int = None, remaining: int = None, reset_ms: int = None):
+        """
+        Function syncing the bucket with the exchange rate limit status
+        :param limit: requests per window
+        :type limit: int
+        :param remaining: requests left in the window
+        :type remaining: int
+        :param reset_ms: time (ms) the window resets
+        :type reset_ms: int
+        :return: None
+        """
+        with self._condition:
+            now = time.monotonic()
+            self._refill(now)
+            if limit:
+                self.capacity = float(limit)
+                self.rate = limit / 60
+            if remaining is not None:
+                self.tokens = min(float(remaining), self.capacity)
+                if remaining <= 0 and reset_ms:
+                    self.blocked_until = max(self.blocked_until, now + max(reset_ms / 1000 - time.time(), 0))
+            self._condition.notify_all()
+
+    def block(self, seconds: float):
+        """
+        Function stopping the group after the exchange rejected a request for its rate
+        :param seconds: seconds
+        :type seconds: float
+        :return: None
+        """
+        with self._condition:
+            self.tokens = 0.0
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self._condition.notify_all()
+
+
+class RequestScheduler:
+
+    def __init__(self, limits: dict = None, read_max_wait: float = READ_MAX_WAIT,
+                 read_max_stale: float = READ_MAX_STALE):
+        """
+        Rate-limit-aware scheduler between bot methods and the transport
+        :param limits: requests per minute of every endpoint group
+        :type limits: dict
+        :param read_max_wait: seconds a read waits for a token before it is dropped
+        :type read_max_wait: float
+        :param read_max_stale: max age (seconds) of a response reused instead of a read under pressure
+        :type read_max_stale: float
+        :return: None
+        """
+        limits = limits if limits is not None else RATE_LIMITS
+        self.buckets = {group: TokenBucket(limit) for group, limit in limits.items()}
+        self.read_max_wait = read_max_wait
+        self.read_max_stale = read_max_stale
+        self.dropped = 0
+        self.coalesced = 0
+        self._last_reads = OrderedDict()  # key -> (monotonic time, response), oldest first
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['buckets'] = {group: bucket.capacity for group, bucket in self.buckets.items()}
+        state['_last_reads'] = OrderedDict()
+        state['_inflight'] = {}
+        state['_lock'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.buckets = {group: TokenBucket(int(limit)) for group, limit in self.buckets.items()}
+        self._lock = threading.Lock()
+
+    def _bucket(self, group: str):
+        bucket = self.buckets.get(group)
+        if bucket is None:
+            bucket = self.buckets.setdefault(group, TokenBucket(RATE_LIMITS['other']))
+        return bucket
+
+    def acquire(self, group: str, priority: int, timeout: float = None):
+        """
+        Function taking a token of a group
+        :param group: endpoint group
+        :type group: str
+        :param priority: priority class
+        :type priority: int
+        :param timeout: max seconds to wait (forever if None)
+        :type timeout: float
+        :return: True if a token was taken
+        :rtype: bool
+        """
+        return self._bucket(group).acquire(priority, timeout)
+
+    def dropped_response(self, group: str):
+        """
+        Function counting a dropped read
+        :param group: endpoint group
+        :type group: str
+        :return: error dict in the exchange format
+        :rtype: dict
+        """
+        self.dropped += 1
+        return {'ret_code': RATE_LIMIT_DROPPED_CODE, 'ret_msg': f'read dropped by scheduler, {group} rate limit',
+                'result': None}
+
+    def run(self, group: str, priority: int, send, key=None, droppable: bool = True):
+        """
+        Function sending a request when its group has budget
+        :param group: endpoint group
+        :type group: str
+        :param priority: priority class
+        :type priority: int
+        :param send: function sending the request
+        :type send: callable
+        :param key: identity of a read, identical reads in flight or under pressure share a response
+        :param droppable: a read may be dropped when the group has no budget within read_max_wait
+        :type droppable: bool
+        :return: dict with data
+        """
+        if priority != PRIORITY_READ or key is None:
+            self._bucket(group).acquire(priority)
+            return send()
+        while True:
+            with self._lock:
+                inflight = self._inflight.get(key)
+                owner = inflight is None
+                if owner:
+                    inflight = [threading.Event(), None]
+                    self._inflight[key] = inflight
+            if owner:
+                break
+            self.coalesced += 1
+            inflight[0].wait()
+            response = inflight[1]
+            # a caller that can not go without the read does not take the drop of a shared one
+            if droppable or not (isinstance(response, dict) and response.get('ret_code') == RATE_LIMIT_DROPPED_CODE):
+                return response
+        try:
+            response = self._run_read(group, key, send, droppable)
+            inflight[1] = response
+            return response
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            inflight[0].set()
+
+    def _recent_read(self, key):
+        """
+        Function getting the last successful response of a read if it is not older than read_max_stale
+        :param key: identity of the read
+        :return: dict with data or None
+        """
+        with self._lock:
+            last_read = self._last_reads.get(key)
+        if last_read is None or time.monotonic() - last_read[0] > self.read_max_stale:
+            return None
+        return last_read[1]
+
+    def _store_read(self, key, response):
+        now = time.monotonic()
+        with self._lock:
+            self._last_reads[key] = (now, response)
+            self._last_reads.move_to_end(key)
+            # responses too old to be reused are dropped, the oldest are first
+            while True:
+                oldest_key, (received, _) = next(iter(self._last_reads.items()))
+                if now - received <= self.read_max_stale:
+                    break
+                del self._last_reads[oldest_key]
+
+    def _run_read(self, group: str, key, send, droppable: bool = True):
+        bucket = self._bucket(group)
+        if bucket.under_pressure():
+            response = self._recent_read(key)
+            if response is not None:
+                self.coalesced += 1
+                return response
+        if not bucket.acquire(PRIORITY_READ, self.read_max_wait if droppable else None):
+            return self.dropped_response(group)
+        response = send()
+        if isinstance(response, dict) and response.get('ret_code') == 0:
+            self._store_read(key, response)
+        return response
+
+    def update(self, group: str, headers, response):
+        """
+        Function updating the budget of a group from the exchange rate limit headers / fields
+        :param group: endpoint group
+        :type group: str
+        :param headers: response headers
+        :param response: dict with data
+        :return: None
+        """
+        bucket = self._bucket(group)
+        try:
+            body = response if isinstance(response, dict) else {}
+            limit = headers.get('X-Bapi-Limit', body.get('rate_limit'))
+            remaining = headers.get('X-Bapi-Limit-Status', body.get('rate_limit_status'))
+            reset_ms = headers.get('X-Bapi-Limit-Reset-Timestamp', body.get('rate_limit_reset_ms'))
+            if body.get('ret_code') in RATE_LIMIT_ERROR_CODES:
+                log_error.error(f"rate limit of {group}: {body.get('ret_msg')}")
+                wait = max(int(reset_ms) / 1000 - time.time(), 0) if reset_ms else RATE_LIMIT_PENALTY
+                bucket.block(wait or RATE_LIMIT_PENALTY)
+            elif remaining is not None:
+                bucket.update(int(limit) if limit else None, int(remaining), int(reset_ms) if reset_ms else None)
+        except Exception as exc:
+            log_error.error(exc)
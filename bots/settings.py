@@ -1 +1,200 @@
-MESSAGE_LOG = 'created order symbol - {}, side - {}, type order - {}, price - {}, number of contracts - {}.'
\ No newline at end of file
+MESSAGE_LOG = 'created order symbol - {}, side - {}, type order - {}, price - {}, number of contracts - {}.'
+
+# http client
+HTTP_POOL_CONNECTIONS = 4  # number of cached host pools
+HTTP_POOL_MAXSIZE = 8  # max keep-alive connections per host
+HTTP_POOL_BLOCK = True  # wait for a free connection instead of opening an extra one
+HTTP_CONNECT_TIMEOUT = 3.05  # seconds
+HTTP_READ_TIMEOUT = 10  # seconds
+HTTP_CONNECT_RETRIES = 2  # retries only for failed connects, never for sent requests
+
+# server clock sync
+CLOCK_SYNC_SAMPLES = 5  # requests per sync, the lowest rtt sample wins
+CLOCK_SYNC_INTERVAL = 60  # seconds between background resyncs
+CLOCK_SYNC_ALPHA = 0.3  # weight of a new offset in the smoothed one
+TIMESTAMP_ERROR_CODE = 10002  # ret_code of a request rejected for its timestamp / recv_window
+
+# account snapshots
+SNAPSHOT_TTL = 0.3  # seconds a position / open orders snapshot is shared between callers
+
+# private websocket stream
+PRIVATE_STREAM_URLS = {
+    'api': 'wss://stream.bybit.com/realtime_private',
+    'api-testnet': 'wss://stream-testnet.bybit.com/realtime_private'
+}
+PRIVATE_STREAM_TOPICS = ['position', 'order', 'execution', 'wallet']
+STREAM_PING_INTERVAL = 20  # seconds between heartbeats
+STREAM_RECONNECT_MAX_DELAY = 30  # seconds, reconnect backoff cap
+ACTIVE_ORDER_STATUSES = ['Created', 'New', 'PartiallyFilled']
+
+# market data daemon
+PUBLIC_STREAM_URLS = {
+    'api': 'wss://stream.bybit.com/realtime_public',
+    'api-testnet': 'wss://stream-testnet.bybit.com/realtime_public'
+}
+MARKET_DATA_PUBLISH_INTERVAL = 0.1  # seconds between batched redis writes
+MARKET_DATA_BOOK_TOPIC = 'orderBookL2_25'
+MARKET_DATA_BOOK_TTL = 5  # seconds superiority_* / imbalance_* live in redis without a refresh of the daemon
+
+# batch cancellation
+CANCEL_ALL_MIN_ORDERS = 2  # cancel-all is used when the batch covers every active order and has at least this many
+
+# price and balance provider
+PRICE_TTL = 1  # seconds a ticker price is reused
+BALANCE_MAX_AGE = 300  # seconds, safety refresh of a balance nothing invalidated
+
+# redis keys
+LEVELS_KEY = 'levels_index'  # sorted set of levels, score = price
+LEVELS_BLOB_KEY = 'levels'  # json [[index, price], ...] of the level producers, copied into LEVELS_KEY on read
+LEVELS_SOURCE_KEY = 'levels_index_source'  # blob LEVELS_KEY was built from
+MARKET_UPDATES_CHANNEL = 'market_updates'  # pub/sub channel notified on every market data / levels change
+
+# price ticks
+TICK_SIZES = {'BTCUSDT': 0.5, 'ETHUSDT': 0.05}
+DEFAULT_TICK_SIZE = 0.5
+QTY_STEPS = {'BTCUSDT': 0.001, 'ETHUSDT': 0.01}
+DEFAULT_QTY_STEP = 0.001
+
+# order gateway
+GATEWAY_READ_WORKERS = 4  # threads answering worker reads from the shared state
+GATEWAY_HEARTBEAT_INTERVAL = 1  # seconds between liveness marks of the gateway
+GATEWAY_HEARTBEAT_TIMEOUT = 5  # seconds without a liveness mark before a worker call fails
+GATEWAY_CALL_TIMEOUT = 120  # seconds a worker call waits for the answer of a live gateway
+PROCESS_CHECK_INTERVAL = 1  # seconds between checks of the strategy processes, dead ones are restarted
+
+# request scheduler
+RATE_LIMITS = {  # requests per minute of every endpoint group
+    'order': 100,
+    'order_query': 600,
+    'position': 120,
+    'trading_stop': 75,
+    'wallet': 120,
+    'execution': 120,
+    'other': 120
+}
+ENDPOINT_GROUPS = {
+    '/private/linear/order/create': 'order',
+    '/private/linear/order/cancel': 'order',
+    '/private/linear/order/cancel-all': 'order',
+    '/private/linear/order/search': 'order_query',
+    '/private/linear/position/list': 'position',
+    '/private/linear/position/trading-stop': 'trading_stop',
+    '/v2/private/wallet/balance': 'wallet',
+    '/private/linear/trade/execution/list': 'execution'
+}
+PRIORITY_CRITICAL = 0  # cancels, stop-loss updates, reduce-only orders
+PRIORITY_TRADE = 1  # new orders
+PRIORITY_READ = 2  # polling
+READ_RESERVE = 0.2  # share of every bucket reads may not use
+READ_MAX_WAIT = 2  # seconds a read waits for a token before it is dropped
+READ_MAX_STALE = 0.5  # max age (seconds) of a response reused instead of a read under pressure
+RATE_LIMIT_ERROR_CODES = [10006, 10018]  # too many visits / ip rate limit
+RATE_LIMIT_PENALTY = 1  # seconds a group is blocked after a rate limit error without reset time
+RATE_LIMIT_DROPPED_CODE = -10006  # ret_code of a read dropped by the scheduler
+
+# indicators
+INDICATOR_HISTORY = 200  # candles backfilled once per symbol / interval
+INDICATOR_MA_WINDOW = 50  # candles of the analyst MA
+INDICATOR_EMA_WINDOW = 20  # candles of the analyst EMA
+INDICATOR_RESYNC = 1000  # updates between exact recomputations of the running sums
+INTERVAL_SECONDS = {'D': 86400, 'W': 604800, 'M': 2592000}  # kline intervals that are not minutes
+
+# backtesting
+BACKTEST_BALANCE = 1000  # USDT
+BACKTEST_LEVERAGE = 10
+BACKTEST_MAKER_FEE = 0.0001
+BACKTEST_TAKER_FEE = 0.0006
+BACKTEST_QUEUE_VOLUME = 0  # contracts resting ahead of a new limit order at its price
+BACKTEST_LATENCY = 0.02  # seconds of simulated time every request of a strategy takes
+BACKTEST_SCAN_CHUNK = 65536  # events scanned per vectorized pass
+
+# fake exchange server
+FAKE_EXCHANGE_PRICE = 17000  # last price of the flat market served when no history is replayed
+FAKE_EXCHANGE_RECV_WINDOW = 5000  # ms, default recv_window of signed requests
+FAKE_EXCHANGE_ERROR_CODES = [10006, 10016]  # ret_codes of injected errors (rate limit, service error)
+
+# benchmarks
+BENCHMARK_REPEAT = 200  # timed calls of every operation
+BENCHMARK_WARMUP = 10  # untimed calls / loop iterations before the timed ones
+BENCHMARK_LOOP_ITERATIONS = 100  # timed strategy loop iterations per scenario
+BENCHMARK_LEVEL_OFFSETS = [-300, -200, -100, 100, 200, 300]  # levels around the fake market price
+BENCHMARK_RATE_LIMIT = 1000000  # requests per minute the fake exchange grants every group, the scheduler never waits
+
+# metrics
+METRICS_HOST = '127.0.0.1'  # local endpoint, scraped on /metrics
+METRICS_PORT = 9108  # port of the process owning the exchange connection, the strategy workers use the next ones
+METRICS_REQUEST_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]  # seconds
+METRICS_LOOP_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5]  # seconds
+METRICS_REDIS_BUCKETS = [0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1]  # seconds
+METRICS_REDIS_READS = ['get', 'mget', 'exists', 'evalsha']  # redis commands timed as reads
+
+# accounts runner
+ACCOUNTS_WORKERS = None  # worker processes sharing the accounts (os.cpu_count() if None)
+ACCOUNTS_REFRESH_INTERVAL = 30  # seconds between reloads of the users table
+ACCOUNTS_HTTP_POOL_MAXSIZE = 32  # keep-alive connections of a worker, shared by its accounts
+ACCOUNTS_STOP_TIMEOUT = 10  # seconds a removed account is given to leave its loops
+ACCOUNTS_LEVELS_MAX_AGE = 1  # seconds levels are reused by the accounts of a worker without a change notification
+
+# database
+DB_POOL_SIZE = 5  # connections kept open per process
+DB_MAX_OVERFLOW = 10  # extra connections opened under load, closed when returned
+DB_POOL_TIMEOUT = 30  # seconds to wait for a free connection
+DB_POOL_RECYCLE = 1800  # seconds before a connection is replaced (server / proxy idle timeouts)
+DB_POOL_PRE_PING = True  # check a connection before handing it out, dropped ones are replaced
+DB_BATCH_SIZE = 1000  # rows per multi-values insert / upsert statement
+DB_FETCH_SIZE = 1000  # rows per round trip of a server-side cursor
+
+# trade journal
+JOURNAL_TABLE = 'trade_journal'
+JOURNAL_ACCOUNT = 'main'  # account name of the single account runners (main.py), AccountsWorker uses the username
+JOURNAL_QUEUE_SIZE = 100000  # events buffered in memory, new ones are dropped (and counted) when it is full
+JOURNAL_BATCH_SIZE = 500  # events per COPY
+JOURNAL_FLUSH_INTERVAL = 1  # seconds an event waits for its batch to fill
+JOURNAL_RETRY_DELAY = 5  # seconds between attempts of a failed batch
+JOURNAL_MAX_RETRIES = 3  # attempts after the first one before a batch is dropped
+
+# order book
+ORDERBOOK_LADDER_SIZE = 4096  # ticks of a side ladder, recentered (and grown if needed) when a level falls outside
+ORDERBOOK_BANDS = [5, 25, 100]  # depth bands (ticks from the best price) of the published imbalance_{ticks} keys
+ORDERBOOK_SUPERIORITY_BAND = None  # band of superiority_buy / superiority_sell (whole book if None)
+ORDERBOOK_SEQ_KEY = 'cross_seq'  # sequence of the book messages, it must increase
+ORDERBOOK_RESYNC = 100000  # level changes between exact recomputations of the ladder sums
+
+# logging
+LOG_DIR = 'logs'
+LOG_NAME = 'bots'  # file name of the main process ({LOG_NAME}.log)
+LOG_FORMAT = '%(asctime)s %(levelname)s %(message)s'
+LOG_DATE_FORMAT = '%d-%m-%Y %H:%M'
+LOG_JSON = False  # one json object per line instead of LOG_FORMAT
+LOG_PER_PROCESS = True  # child processes write {LOG_NAME}.{name= given at spawn}.log, rotation is safe with one writer per file
+LOG_QUEUE_SIZE = 10000  # records buffered per process, new ones are dropped (and counted) when it is full
+LOG_MAX_BYTES = 50 * 1024 * 1024  # size of a log file before it is rotated
+LOG_BACKUP_COUNT = 5  # rotated files kept
+LOGGER_LEVELS = {'bots_debug': 'DEBUG', 'bots_info': 'INFO', 'bots_error': 'ERROR'}
+
+# parameter sweep
+SWEEP_WORKERS = None  # backtest processes (os.cpu_count() if None)
+SWEEP_LEVELS_SPACE = {  # values tried for the levels strategy, a {"low": x, "high": y} range is sampled
+    'TAKE_PROFIT': [30, 50, 80, 120],
+    'STOP_LOSS': [50, 100, 200],
+    'MAX_COUNT_LIMIT_ORDERS': [2, 3, 4],
+    'DANGEROUS_AREA': [5, 10, 20],
+    'SUPERIORITY': [1.5, 2, 3]
+}
+SWEEP_FLAT_SPACE = {  # values tried for FlatBotTrader
+    'limits_threshold': [[[2, 100], [4, 300]], [[2, 50], [4, 150]], [[1, 100], [2, 300]], [[3, 200], [6, 500]]]
+}
+SWEEP_RANK = ['-net_pnl', 'max_drawdown', '-closing_fills']  # sort keys of the ranking, '-' for descending
+SWEEP_RESULTS_FILE = 'results.jsonl'  # one line per finished run, read back to resume a sweep
+
+# market archive
+ARCHIVE_DIR = 'archive'  # local klines / trades, {symbol}/klines_{interval} and {symbol}/trades
+ARCHIVE_KLINE_LIMIT = 200  # candles per REST request
+ARCHIVE_FILL_LIMIT = 2000  # missing candles requested to close a gap, an older archive gets a gap instead
+
+# order management
+OMS_LINK_PREFIX = 'oms'  # order_link_id prefix of the orders created by the bots
+OMS_RECONCILE_INTERVAL = 30  # seconds between reconciles with order/search while the private stream is connected
+OMS_POLL_INTERVAL = 1  # seconds between reconciles without the stream
+OMS_PENDING_TIMEOUT = 60  # seconds an unanswered create is kept while order/search does not show it
+OMS_DONE_TTL = 300  # seconds finished orders stay queryable
@@ -0,0 +1,211 @@
+import hashlib
+import hmac
+import logging
+import threading
+import time
+from json import loads, dumps
+import websocket
+from bots.settings import STREAM_PING_INTERVAL, STREAM_RECONNECT_MAX_DELAY
+
+log_info = logging.getLogger('bots_info')
+log_error = logging.getLogger('bots_error')
+
+
+class UpdateNotifier:
+
+    def __init__(self):
+        """
+        Wake-up point of the strategy loops, every stream update bumps the sequence
+        :return: None
+        """
+        self.seq = 0
+        self._condition = threading.Condition()
+        self._local = threading.local()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_condition'] = None
+        state['_local'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._condition = threading.Condition()
+        self._local = threading.local()
+
+    def notify(self):
+        """
+        Function waking every waiting loop
+        :return: None
+        """
+        with self._condition:
+            self.seq += 1
+            self._condition.notify_all()
+
+    def wait(self, timeout: float):
+        """
+        Function waiting for an update the calling thread has not seen yet
+        :param timeout: max seconds to wait
+        :type timeout: float
+        :return: True if woken by an update
+        :rtype: bool
+        """
+        with self._condition:
+            seen = getattr(self._local, 'seq', self.seq)
+            updated = self._condition.wait_for(lambda: self.seq != seen, timeout)
+            self._local.seq = self.seq
+            return updated
+
+
+class BybitStream:
+
+    def __init__(self, url: str, topics: list, on_message, on_connect=None, api_key: str = None,
+                 api_secret: str = None, ping_interval: float = STREAM_PING_INTERVAL):
+        """
+        Websocket subscriber, authenticated when api keys are given (private topics)
+        :param url: websocket url
+        :type url: str
+        :param topics: topics to subscribe
+        :type topics: list
+        :param on_message: function called with (topic, message) of every update
+        :type on_message: callable
+        :param on_connect: function called after every (re)subscription, used to recover the gap
+        :type on_connect: callable
+        :param api_key: api account key
+        :type api_key: str
+        :param api_secret: api account secret key
+        :type api_secret: str
+        :param ping_interval: seconds between heartbeats
+        :type ping_interval: float
+        :return: None
+        """
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.url = url
+        self.on_message = on_message
+        self.on_connect = on_connect
+        self.topics = topics
+        self.ping_interval = ping_interval
+        self.connected = False
+        self.reconnects = 0
+        self._ws = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _auth_args(self):
+        """
+        Function signing the auth request
+        :return: [api_key, expires, signature]
+        :rtype: list
+        """
+        expires = int((time.time() + 10) * 1000)
+        signature = hmac.new(bytes(self.api_secret, "utf-8"), f"GET/realtime{expires}".encode("utf-8"),
+                             hashlib.sha256).hexdigest()
+        return [self.api_key, expires, signature]
+
+    def _request(self, ws, op: str, args: list):
+        """
+        Function sending an operation and waiting for its confirmation
+        :param ws: websocket
+        :param op: auth or subscribe
+        :type op: str
+        :param args: operation args
+        :type args: list
+        :return: None
+        """
+        ws.send(dumps({"op": op, "args": args}))
+        deadline = time.monotonic() + self.ping_interval
+        while time.monotonic() < deadline:
+            message = loads(ws.recv())
+            if message.get('request', {}).get('op') == op:
+                if not message.get('success'):
+                    raise ConnectionError(f"{op} rejected: {message.get('ret_msg')}")
+                return
+            self._dispatch(message)
+        raise ConnectionError(f"{op} not confirmed")
+
+    def _dispatch(self, message: dict):
+        topic = message.get('topic')
+        if topic is not None and 'data' in message:
+            self.on_message(topic, message)
+
+    def _connect(self):
+        ws = websocket.create_connection(self.url, timeout=self.ping_interval)
+        try:
+            if self.api_key is not None:
+                self._request(ws, 'auth', self._auth_args())
+            self._request(ws, 'subscribe', self.topics)
+        except Exception:
+            ws.close()
+            raise
+        return ws
+
+    def _listen(self, ws):
+        """
+        Function reading updates and keeping the connection alive
+        :param ws: websocket
+        :return: None
+        """
+        # reads wake up often enough to ping and detect a lost heartbeat on time
+        ws.settimeout(min(self.ping_interval, 1))
+        last_ping = last_message = time.monotonic()
+        while not self._stop.is_set():
+            now = time.monotonic()
+            if now - last_message > self.ping_interval * 2:
+                raise ConnectionError("heartbeat lost")
+            if now - last_ping >= self.ping_interval:
+                ws.send(dumps({"op": "ping"}))
+                last_ping = now
+            try:
+                raw = ws.recv()
+            except websocket.WebSocketTimeoutException:
+                continue
+            last_message = time.monotonic()
+            if not raw:
+                raise ConnectionError("connection closed")
+            self._dispatch(loads(raw))
+
+    def _run(self):
+        delay = 1
+        while not self._stop.is_set():
+            try:
+                self._ws = self._connect()
+                self.connected = True
+                delay = 1
+                log_info.info(f"stream {self.url} connected")
+                if self.on_connect is not None:
+                    self.on_connect()
+                self._listen(self._ws)
+            except Exception as exc:
+                if not self._stop.is_set():
+                    log_error.error(exc)
+            finally:
+                self.connected = False
+                if self._ws is not None:
+                    try:
+                        self._ws.close()
+                    except Exception:
+                        pass
+                    self._ws = None
+            if not self._stop.is_set():
+                self.reconnects += 1
+                self._stop.wait(delay)
+                delay = min(delay * 2, STREAM_RECONNECT_MAX_DELAY)
+
+    def start(self):
+        """
+        Function starting the stream thread
+        :return: None
+        """
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='bybit-stream', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Function stopping the stream
+        :return: None
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.ping_interval)
@@ -1,44 +1,163 @@
-from sqlalchemy import create_engine
+import logging
+from functools import wraps
+from sqlalchemy import create_engine, MetaData, Table, Column, Index, String, CHAR, Integer, select
+from sqlalchemy.engine import URL
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.dialects.postgresql import insert
 from datetime import datetime
+from bots.settings import DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING, \
+    DB_BATCH_SIZE, DB_FETCH_SIZE
 from configs.config import username, password, host, port_db, dbName, tableNameUsers
 
-engine = create_engine("postgresql://" + username + ":" + password + "@" + host + ":" + port_db + "/" + dbName)
+log_error = logging.getLogger('bots_error')
+
+# one pool per process, multi-values inserts for executemany
+engine = create_engine(URL.create('postgresql+psycopg2', username=username, password=password, host=host,
+                                  port=int(port_db), database=dbName),
+                       pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT,
+                       pool_recycle=DB_POOL_RECYCLE, pool_pre_ping=DB_POOL_PRE_PING,
+                       executemany_mode='values_plus_batch', executemany_values_page_size=DB_BATCH_SIZE,
+                       future=True)
+Session = sessionmaker(engine, future=True)
+
+metadata = MetaData()
+users = Table(tableNameUsers, metadata,
+              Column('username', String),
+              Column('api_key', CHAR(18)),
+              Column('api_secret', CHAR(36)),
+              Column('proxy', String),
+              Column('timecreated', Integer),
+              Index(f'{tableNameUsers}_username_key', 'username', unique=True))
+
 
 def decorateSessions(function_dataBase):
-    def openCloseConnection(*args):
-        Session = sessionmaker(engine)
-        session = Session()  
-        result = function_dataBase(*args, session)
-        session.commit()
-        session.close()
-        return result
+    @wraps(function_dataBase)
+    def openCloseConnection(*args, **kwargs):
+        session = Session()
+        try:
+            result = function_dataBase(*args, session=session, **kwargs)
+            session.commit()
+            return result
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
     return openCloseConnection
 
 
 @decorateSessions
-def addUser(username, api_key, api_secret, proxy, session):
-    date = datetime.now()
-    timestampe = int(date.timestamp())
-    session.execute(f"INSERT INTO {tableNameUsers}(username, api_key, api_secret, proxy, timeCreated)"
-    + f"VALUES ('{username}', '{api_key}', '{api_secret}', '{proxy}', {timestampe});")
+def bulkInsert(table: Table, rows: list, session=None):
+    """
+    Function inserting rows with multi-values statements of DB_BATCH_SIZE rows
+    :param table: table
+    :type table: Table
+    :param rows: list of dicts column -> value
+    :type rows: list
+    :return: number of rows
+    :rtype: int
+    """
+    if len(rows) > 0:
+        session.execute(table.insert(), rows)
+    return len(rows)
+
 
 @decorateSessions
-def getUsersInfo(session):
-    info = session.execute(f"select * from {tableNameUsers};").fetchall()
-    return info
+def bulkUpsert(table: Table, rows: list, conflict_columns: list, update_columns: list = None, session=None):
+    """
+    Function inserting rows and updating the existing ones (INSERT ... ON CONFLICT DO UPDATE)
+    :param table: table
+    :type table: Table
+    :param rows: list of dicts column -> value
+    :type rows: list
+    :param conflict_columns: columns of a unique index identifying a row
+    :type conflict_columns: list
+    :param update_columns: columns updated on conflict (every other column of the rows if None)
+    :type update_columns: list
+    :return: number of rows written
+    :rtype: int
+    """
+    if len(rows) == 0:
+        return 0
+    statement = insert(table)
+    if update_columns is None:
+        update_columns = [name for name in rows[0] if name not in conflict_columns]
+    statement = statement.on_conflict_do_update(index_elements=conflict_columns,
+                                                set_={name: statement.excluded[name] for name in update_columns})
+    # a row may be updated once per statement, the last version of a key wins
+    unique_rows = {tuple(row[name] for name in conflict_columns): row for row in rows}
+    session.execute(statement, list(unique_rows.values()))
+    return len(unique_rows)
+
+
+def streamRows(statement, params: dict = None, fetch_size: int = DB_FETCH_SIZE):
+    """
+    Function reading a large result with a server-side cursor, fetch_size rows per round trip
+    :param statement: select statement
+    :param params: bound parameters
+    :type params: dict
+    :param fetch_size: rows per round trip
+    :type fetch_size: int
+    :return: generator of rows (the connection is held until it is exhausted or closed)
+    """
+    with engine.connect() as connection:
+        result = connection.execution_options(yield_per=fetch_size).execute(statement, params or {})
+        for row in result:
+            yield row
+
+
+def addUser(username, api_key, api_secret, proxy):
+    addUsers([(username, api_key, api_secret, proxy)])
+
+
+def addUsers(users_info: list):
+    """
+    Function adding users, the keys and proxy of an existing username are replaced
+    :param users_info: list of (username, api_key, api_secret, proxy)
+    :type users_info: list
+    :return: number of users
+    :rtype: int
+    """
+    timestampe = int(datetime.now().timestamp())
+    rows = [dict(username=username, api_key=api_key, api_secret=api_secret, proxy=proxy, timecreated=timestampe)
+            for username, api_key, api_secret, proxy in users_info]
+    return bulkUpsert(users, rows, ['username'], update_columns=['api_key', 'api_secret', 'proxy'])
+
 
 @decorateSessions
-def createTableInfoUser(session):
-    try:
-        tables = list(session.execute("SELECT * FROM pg_catalog.pg_tables WHERE schemaname != 'pg_catalog' AND schemaname != 'information_schema';").fetchall()[0])
-        if tableNameUsers not in tables:
-            session.execute(f"create table {tableNameUsers}(username character varying," 
-                        "api_key character (18), api_secret character (36), proxy character varying," 
-                        "timeCreated integer);")
-        else:
-            print("Table exist")
-    except Exception as exc:
-        print(exc)
+def getUsersInfo(after: str = None, limit: int = None, session=None):
+    """
+    Function getting users ordered by username, a page of them when limit is given
+    :param after: last username of the previous page
+    :type after: str
+    :param limit: page size
+    :type limit: int
+    :return: rows (username, api_key, api_secret, proxy, timeCreated)
+    :rtype: list
+    """
+    statement = select(users).order_by(users.c.username)
+    if after is not None:
+        statement = statement.where(users.c.username > after)
+    if limit is not None:
+        statement = statement.limit(limit)
+    return session.execute(statement).fetchall()
 
 
+def iterUsersInfo(fetch_size: int = DB_FETCH_SIZE):
+    """
+    Function streaming every user through a server-side cursor
+    :param fetch_size: rows per round trip
+    :type fetch_size: int
+    :return: generator of rows (username, api_key, api_secret, proxy, timeCreated)
+    """
+    return streamRows(select(users).order_by(users.c.username), fetch_size=fetch_size)
+
+
+def createTableInfoUser():
+    try:
+        metadata.create_all(engine, tables=[users], checkfirst=True)
+        # a table created before the index gets it too, upserts rely on it
+        for index in users.indexes:
+            index.create(engine, checkfirst=True)
+    except Exception as exc:
+        log_error.error(exc)
@@ -0,0 +1,261 @@
+import csv
+import io
+import logging
+import multiprocessing.util
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from json import dumps
+from sqlalchemy import Table, Column, Index, BigInteger, String, Float, Boolean, DateTime, select
+from sqlalchemy.dialects.postgresql import JSONB
+from bots.metrics import REGISTRY
+from bots.settings import JOURNAL_TABLE, JOURNAL_QUEUE_SIZE, JOURNAL_BATCH_SIZE, JOURNAL_FLUSH_INTERVAL, \
+    JOURNAL_RETRY_DELAY, JOURNAL_MAX_RETRIES
+from db.dbFunctions import engine, metadata, decorateSessions
+
+log_info = logging.getLogger('bots_info')
+log_error = logging.getLogger('bots_error')
+
+journal = Table(JOURNAL_TABLE, metadata,
+                Column('id', BigInteger, primary_key=True, autoincrement=True),
+                Column('event_time', DateTime(timezone=True), nullable=False),
+                Column('account', String, nullable=False),
+                Column('symbol', String, nullable=False),
+                Column('event', String, nullable=False),  # order, cancel, execution, stop_loss
+                Column('order_id', String),
+                Column('side', String),
+                Column('order_type', String),
+                Column('price', Float),
+                Column('qty', Float),
+                Column('reduce_only', Boolean),
+                Column('details', JSONB),
+                Index(f'{JOURNAL_TABLE}_account_time', 'account', 'event_time'),
+                Index(f'{JOURNAL_TABLE}_symbol_time', 'symbol', 'event_time'),
+                # rows are appended in time order, a brin index covers time ranges at a tiny size
+                Index(f'{JOURNAL_TABLE}_time', 'event_time', postgresql_using='brin'),
+                Index(f'{JOURNAL_TABLE}_order_id', 'order_id'))
+
+# the columns COPY fills, in the order of the recorded tuples
+JOURNAL_COLUMNS = ['event_time', 'account', 'symbol', 'event', 'order_id', 'side', 'order_type', 'price', 'qty',
+                   'reduce_only', 'details']
+
+JOURNAL_EVENTS = REGISTRY.counter('trade_journal_events_total', 'trade journal events by outcome', ('outcome',))
+
+
+def createTableTradeJournal():
+    try:
+        metadata.create_all(engine, tables=[journal], checkfirst=True)
+    except Exception as exc:
+        log_error.error(exc)
+
+
+@decorateSessions
+def getJournal(account: str = None, symbol: str = None, start: datetime = None, end: datetime = None,
+               limit: int = None, session=None):
+    """
+    Function getting journal events ordered by time
+    :param account: account name (username of the users table)
+    :type account: str
+    :param symbol: symbol instrument
+    :type symbol: str
+    :param start: first time (included)
+    :type start: datetime
+    :param end: last time (excluded)
+    :type end: datetime
+    :param limit: max events
+    :type limit: int
+    :return: rows of the journal
+    :rtype: list
+    """
+    statement = select(journal).order_by(journal.c.event_time, journal.c.id)
+    if account is not None:
+        statement = statement.where(journal.c.account == account)
+    if symbol is not None:
+        statement = statement.where(journal.c.symbol == symbol)
+    if start is not None:
+        statement = statement.where(journal.c.event_time >= start)
+    if end is not None:
+        statement = statement.where(journal.c.event_time < end)
+    if limit is not None:
+        statement = statement.limit(limit)
+    return session.execute(statement).fetchall()
+
+
+class TradeJournal:
+
+    def __init__(self, maxsize: int = JOURNAL_QUEUE_SIZE, batch_size: int = JOURNAL_BATCH_SIZE,
+                 flush_interval: float = JOURNAL_FLUSH_INTERVAL, retry_delay: float = JOURNAL_RETRY_DELAY,
+                 max_retries: int = JOURNAL_MAX_RETRIES, write_batch=None):
+        """
+        Order and execution events queued in memory and written to postgres in batches by a background thread,
+        recording never waits for the database
+        :param maxsize: max queued events, new ones are dropped when the queue is full
+        :type maxsize: int
+        :param batch_size: events per write
+        :type batch_size: int
+        :param flush_interval: seconds an event waits for its batch to fill
+        :type flush_interval: float
+        :param retry_delay: seconds between attempts of a failed batch
+        :type retry_delay: float
+        :param max_retries: attempts after the first one before a batch is dropped
+        :type max_retries: int
+        :param write_batch: function writing a list of events (COPY into the journal table if None)
+        :return: None
+        """
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_delay = retry_delay
+        self.max_retries = max_retries
+        self.write_batch = write_batch if write_batch is not None else copy_events
+        self.queue = queue.Queue(maxsize)
+        self.dropped = 0
+        self.written = 0
+        self._pid = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['queue'] = None
+        state['_pid'] = None
+        state['_thread'] = None
+        state['_lock'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.queue = queue.Queue(self.maxsize)
+        self._lock = threading.Lock()
+
+    def _start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # a forked copy, the events of the parent are written by the parent
+                self.queue = queue.Queue(self.maxsize)
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='trade-journal', daemon=True)
+            self._thread.start()
+            # the gateway is a multiprocessing child leaving through os._exit, atexit does not run there but
+            # the finalizers do (before the log handler, which writes the errors of the last flush)
+            multiprocessing.util.Finalize(self, self.close, args=(self.flush_interval + 5,), exitpriority=20)
+
+    def record(self, account: str, symbol: str, event: str, order_id: str = None, side: str = None,
+               order_type: str = None, price: float = None, qty: float = None, reduce_only: bool = None,
+               details: dict = None):
+        """
+        Function queueing an event
+        :param account: account name (username of the users table)
+        :type account: str
+        :param symbol: symbol instrument
+        :type symbol: str
+        :param event: order, cancel, execution or stop_loss
+        :type event: str
+        :param details: raw exchange data of the event
+        :type details: dict
+        :return: True if queued
+        :rtype: bool
+        """
+        if self._pid != os.getpid():
+            self._start()
+        try:
+            self.queue.put_nowait((time.time(), account, symbol, event, order_id, side, order_type, price, qty,
+                                   reduce_only, details))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            JOURNAL_EVENTS.labels('dropped').inc()
+            return False
+
+    def _run(self):
+        if self.write_batch is copy_events:
+            createTableTradeJournal()
+        while True:
+            event = self.queue.get()
+            if event is None:
+                return
+            batch = [event]
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    event = self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if event is None:
+                    stop = True
+                    break
+                batch.append(event)
+            self._flush(batch)
+            if stop:
+                return
+
+    def _flush(self, batch: list):
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.write_batch(batch)
+                self.written += len(batch)
+                JOURNAL_EVENTS.labels('written').inc(len(batch))
+                return
+            except Exception as exc:
+                log_error.error(f"trade journal batch of {len(batch)} events, attempt {attempt + 1}: {exc}")
+                if attempt < self.max_retries:
+                    time.sleep(self.retry_delay)
+        self.dropped += len(batch)
+        JOURNAL_EVENTS.labels('dropped').inc(len(batch))
+
+    def close(self, timeout: float = None):
+        """
+        Function writing the queued events and stopping the writer
+        :param timeout: max seconds to wait
+        :type timeout: float
+        :return: None
+        """
+        if self._thread is None or self._pid != os.getpid():
+            return
+        try:
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            log_error.error("trade journal is not drained, the queue stayed full")
+            return
+        self._thread.join(timeout)
+        self._pid = None
+        self._thread = None
+
+
+def _csv_value(value):
+    if isinstance(value, dict):
+        return dumps(value)
+    return value
+
+
+def copy_events(batch: list):
+    """
+    Function writing events with COPY (one round trip per batch)
+    :param batch: recorded event tuples
+    :type batch: list
+    :return: None
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for event in batch:
+        row = [datetime.fromtimestamp(event[0], timezone.utc).isoformat()]
+        row.extend(_csv_value(value) for value in event[1:])
+        writer.writerow(row)
+    buffer.seek(0)
+    table = engine.dialect.identifier_preparer.format_table(journal)
+    connection = engine.raw_connection()
+    try:
+        with connection.cursor() as cursor:
+            # empty unquoted fields are NULL in the csv format
+            cursor.copy_expert(f"COPY {table} ({', '.join(JOURNAL_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buffer)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
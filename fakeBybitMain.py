@@ -0,0 +1,38 @@
+import argparse
+from backtesting.events import MarketEvents
+from backtesting.exchange import SimExchange
+from backtesting.fakeBybit import FakeBybitServer
+from bots.settings import BACKTEST_BALANCE
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Local stand-in of the bybit linear REST api')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--api-key', default='test')
+    parser.add_argument('--api-secret', default='test')
+    parser.add_argument('--symbol', default='BTCUSDT')
+    parser.add_argument('--history', default=None,
+                        help='trades csv or market archive directory to replay (a flat market if not given)')
+    parser.add_argument('--klines', type=float, default=None, help='candle length (seconds) of a klines csv')
+    parser.add_argument('--interval', default=None, help='kline interval of a market archive (trades if omitted)')
+    parser.add_argument('--start', type=float, default=None, help='first time (seconds) of a market archive')
+    parser.add_argument('--end', type=float, default=None, help='last time (seconds, excluded) of a market archive')
+    parser.add_argument('--speed', type=float, default=1.0, help='replayed seconds of history per second')
+    parser.add_argument('--balance', type=float, default=BACKTEST_BALANCE)
+    parser.add_argument('--latency', type=float, nargs='+', default=[0.0], help='seconds, or min max')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--http-error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limits', action='store_true')
+    args = parser.parse_args()
+
+    exchange = None
+    if args.history is not None:
+        events = MarketEvents.load(args.history, args.klines, args.symbol, args.interval, args.start, args.end)
+        exchange = SimExchange(events, args.symbol, balance=args.balance)
+    server = FakeBybitServer(exchange, {args.api_key: args.api_secret}, args.host, args.port,
+                             latency=args.latency[0] if len(args.latency) == 1 else tuple(args.latency[:2]),
+                             error_rate=args.error_rate, http_error_rate=args.http_error_rate, speed=args.speed,
+                             rate_limits=args.rate_limits)
+    print(f"fake bybit serving on {server.url}", flush=True)
+    server.serve_forever()
@@ -0,0 +1,6 @@
+from bots.marketData import runMarketData
+from configs.config import currency, MODE, host_redis, port_redis
+
+
+if __name__ == "__main__":
+    runMarketData(currency, MODE, host_redis, port_redis)
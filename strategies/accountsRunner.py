@@ -0,0 +1,432 @@
+import logging
+import os
+import threading
+import time
+from multiprocessing import Process, Queue
+from bots.bots import BotTrader
+from bots.httpClient import HttpClient
+from bots.stream import UpdateNotifier
+from bots.levelIndex import ChangeListener
+from bots.orderGateway import GATEWAY_WRITE_METHODS
+from bots.metrics import run_with_metrics
+from bots.settings import ACCOUNTS_WORKERS, ACCOUNTS_REFRESH_INTERVAL, ACCOUNTS_HTTP_POOL_MAXSIZE, \
+    ACCOUNTS_STOP_TIMEOUT, ACCOUNTS_LEVELS_MAX_AGE, METRICS_PORT
+from configs.config import MODE
+from db.dbFunctions import iterUsersInfo
+from db.tradeJournal import TradeJournal
+import strategies.levelsSrategy as levels_strategy
+
+log_info = logging.getLogger('bots_info')
+log_error = logging.getLogger('bots_error')
+
+# loops every account runs, in its own thread of the worker owning the account
+ACCOUNT_LOOPS = [levels_strategy.trade_long, levels_strategy.trade_short,
+                 levels_strategy.watch_out_danger_long, levels_strategy.watch_out_danger_short]
+# loops woken by market data, through the listener of the worker
+ACCOUNT_WATCHERS = [levels_strategy.watch_out_danger_long, levels_strategy.watch_out_danger_short]
+
+
+def load_accounts():
+    """
+    Function getting the accounts of the users table
+    :return: username -> (api_key, api_secret, proxy)
+    :rtype: dict
+    """
+    accounts = {}
+    for row in iterUsersInfo():
+        username, api_key, api_secret, proxy = row[0], row[1], row[2], row[3]
+        # char columns are padded and addUser stores a missing proxy as 'None'
+        proxy = proxy.strip() if proxy is not None else ''
+        accounts[username.strip()] = (api_key.strip(), api_secret.strip(), None if proxy in ('', 'None') else proxy)
+    return accounts
+
+
+class AccountStopped(BaseException):
+    """
+    Raised in the loops of a removed account, a BaseException so the `except Exception` of the loops lets it out
+    """
+
+
+class AccountSession:
+
+    def __init__(self, bot_trader: BotTrader, market_updates: UpdateNotifier):
+        """
+        BotTrader stand-in of the account loops, order intents of the loops are executed one by one
+        :param bot_trader: bot of the account
+        :type bot_trader: BotTrader
+        :param market_updates: market data notifier of the worker
+        :type market_updates: UpdateNotifier
+        :return: None
+        """
+        self.bot_trader = bot_trader
+        self.bot_trader.serialized_writes = True  # order intents of the loops hold _write_lock
+        self.market_updates = market_updates
+        self.stopped = threading.Event()
+        self._write_lock = threading.Lock()
+
+    def check(self):
+        if self.stopped.is_set():
+            raise AccountStopped()
+
+    def stop(self):
+        """
+        Function stopping the loops, waiting ones are woken and leave on their next call
+        :return: None
+        """
+        self.stopped.set()
+        self.bot_trader.updates.notify()
+        self.market_updates.notify()
+
+    def __getattr__(self, name: str):
+        self.check()
+        attr = getattr(self.bot_trader, name)
+        if not callable(attr):
+            return attr
+        # the stream is started by the first loop only
+        lock = self._write_lock if name in GATEWAY_WRITE_METHODS or name == 'start_stream' else None
+
+        def call(*args, **kwargs):
+            if lock is None:
+                result = attr(*args, **kwargs)
+            else:
+                with lock:
+                    self.check()
+                    result = attr(*args, **kwargs)
+            self.check()
+            return result
+        return call
+
+
+class AccountListener:
+
+    def __init__(self, session: AccountSession):
+        """
+        ChangeListener stand-in of the watchers, woken by the market data listener of the worker
+        :param session: session of the account
+        :type session: AccountSession
+        :return: None
+        """
+        self.session = session
+
+    def wait(self, timeout: float):
+        updated = self.session.market_updates.wait(timeout)
+        self.session.check()
+        return updated
+
+
+class SharedLevelIndex:
+
+    def __init__(self, level_index, market_updates: UpdateNotifier, max_age: float = ACCOUNTS_LEVELS_MAX_AGE):
+        """
+        Levels fetched once for every account of the worker, again after a market data change or max_age
+        :param level_index: redis level index
+        :type level_index: LevelIndex
+        :param market_updates: market data notifier of the worker
+        :type market_updates: UpdateNotifier
+        :param max_age: seconds levels are reused without a change notification
+        :type max_age: float
+        :return: None
+        """
+        self.level_index = level_index
+        self.market_updates = market_updates
+        self.max_age = max_age
+        self._levels = None
+        self._seq = None
+        self._fetched = 0.0
+        self._lock = threading.Lock()
+
+    def get_levels(self):
+        """
+        Function getting levels split around last_value
+        :return: (last_value, support levels descending, resistance levels ascending)
+        :rtype: tuple
+        """
+        with self._lock:
+            # the sequence is read before the fetch, a change during it is fetched by the next caller
+            seq = self.market_updates.seq
+            now = time.monotonic()
+            if self._levels is None or seq != self._seq or now - self._fetched > self.max_age:
+                self._levels = self.level_index.get_levels()
+                self._seq = seq
+                self._fetched = now
+            return self._levels
+
+    def __getattr__(self, name: str):
+        return getattr(self.level_index, name)
+
+
+class Account:
+
+    def __init__(self, username: str, bot_trader: BotTrader, market_updates: UpdateNotifier):
+        """
+        Levels strategy of one account, its loops are threads of the worker
+        :param username: username
+        :type username: str
+        :param bot_trader: bot of the account
+        :type bot_trader: BotTrader
+        :param market_updates: market data notifier of the worker
+        :type market_updates: UpdateNotifier
+        :return: None
+        """
+        self.username = username
+        self.bot_trader = bot_trader
+        self.session = AccountSession(bot_trader, market_updates)
+        self.threads = []
+
+    def _run(self, loop):
+        while not self.session.stopped.is_set():
+            try:
+                if loop in ACCOUNT_WATCHERS:
+                    loop(self.session, AccountListener(self.session))
+                else:
+                    loop(self.session)
+            except AccountStopped:
+                return
+            except Exception as exc:
+                log_error.error(f"account {self.username} {loop.__name__}: {exc}")
+                self.session.stopped.wait(1)
+
+    def start(self):
+        for loop in ACCOUNT_LOOPS:
+            thread = threading.Thread(target=self._run, args=[loop], name=f'{self.username}-{loop.__name__}',
+                                      daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        log_info.info(f"account {self.username} started")
+
+    def stop(self, timeout: float = ACCOUNTS_STOP_TIMEOUT):
+        """
+        Function stopping the loops and the stream of the account, its orders and position stay on the exchange
+        :param timeout: seconds given to the loops
+        :type timeout: float
+        :return: None
+        """
+        self.session.stop()
+        deadline = time.monotonic() + timeout
+        for thread in self.threads:
+            thread.join(max(deadline - time.monotonic(), 0))
+        self.bot_trader.stop_stream()
+        alive = [thread.name for thread in self.threads if thread.is_alive()]
+        if len(alive) > 0:
+            log_error.error(f"account {self.username} loops still running after {timeout}s: {alive}")
+        log_info.info(f"account {self.username} stopped, its open orders and position are left on the exchange")
+
+
+class AccountsWorker:
+
+    def __init__(self, worker_id: int, commands, symbol: str, interval: int, mode: str = MODE,
+                 base_url: str = None):
+        """
+        Process running the accounts assigned by the supervisor, market data, levels, the http pool,
+        the server clock and the trade journal are shared by them
+        :param worker_id: worker id
+        :type worker_id: int
+        :param commands: queue of ('add', username, api_key, api_secret, proxy), ('remove', username), None to stop
+        :type commands: multiprocessing.Queue
+        :param symbol: symbol instrument
+        :type symbol: str
+        :param interval: interval trading (minutes)
+        :type interval: int
+        :param mode: mode work (testnet or Mainenet)
+        :type mode: str
+        :param base_url: REST url (https://{mode}.bybit.com if None)
+        :type base_url: str
+        :return: None
+        """
+        self.worker_id = worker_id
+        self.commands = commands
+        self.symbol = symbol
+        self.interval = interval
+        self.mode = mode
+        self.base_url = base_url
+        self.http = HttpClient(pool_maxsize=ACCOUNTS_HTTP_POOL_MAXSIZE)
+        self.clock = None
+        self.market_updates = UpdateNotifier()
+        self.journal = TradeJournal()
+        self.accounts = {}
+
+    def _listen_market(self):
+        listener = ChangeListener(levels_strategy.REDIS_CON)
+        while True:
+            if listener.wait(1):
+                self.market_updates.notify()
+
+    def add(self, username: str, api_key: str, api_secret: str, proxy: str):
+        """
+        Function starting an account
+        :return: None
+        """
+        if username in self.accounts:
+            self.remove(username)
+        bot_trader = BotTrader(api_key, api_secret, self.mode, self.symbol, proxy, self.interval, self.http,
+                               self.base_url, self.clock)
+        self.clock = bot_trader.clock
+        bot_trader.prices.price_source = levels_strategy.get_last_value
+        bot_trader.journal = self.journal
+        bot_trader.account = username
+        account = Account(username, bot_trader, self.market_updates)
+        self.accounts[username] = account
+        account.start()
+
+    def remove(self, username: str):
+        """
+        Function stopping an account, the others keep running
+        :return: None
+        """
+        account = self.accounts.pop(username, None)
+        if account is not None:
+            account.stop()
+
+    def serve(self):
+        """
+        Function executing the supervisor commands until None
+        :return: None
+        """
+        levels_strategy.LEVEL_INDEX = SharedLevelIndex(levels_strategy.LEVEL_INDEX, self.market_updates)
+        threading.Thread(target=self._listen_market, name='market-listener', daemon=True).start()
+        log_info.info(f"accounts worker {self.worker_id} started")
+        while True:
+            command = self.commands.get()
+            if command is None:
+                break
+            try:
+                if command[0] == 'add':
+                    self.add(*command[1:])
+                elif command[0] == 'remove':
+                    self.remove(command[1])
+            except Exception as exc:
+                log_error.error(exc)
+        for username in list(self.accounts):
+            self.remove(username)
+        self.journal.close()
+        log_info.info(f"accounts worker {self.worker_id} stopped")
+
+
+def run_worker(worker_id: int, commands, symbol: str, interval: int, mode: str = MODE, base_url: str = None):
+    AccountsWorker(worker_id, commands, symbol, interval, mode, base_url).serve()
+
+
+class AccountsSupervisor:
+
+    def __init__(self, symbol: str, interval: int, workers: int = ACCOUNTS_WORKERS,
+                 refresh_interval: float = ACCOUNTS_REFRESH_INTERVAL, loader=load_accounts, mode: str = MODE,
+                 base_url: str = None):
+        """
+        Runner of the levels strategy for every account of the users table
+        :param symbol: symbol instrument
+        :type symbol: str
+        :param interval: interval trading (minutes)
+        :type interval: int
+        :param workers: worker processes (os.cpu_count() if None)
+        :type workers: int
+        :param refresh_interval: seconds between reloads of the accounts
+        :type refresh_interval: float
+        :param loader: function getting username -> (api_key, api_secret, proxy)
+        :param mode: mode work (testnet or Mainenet)
+        :type mode: str
+        :param base_url: REST url (https://{mode}.bybit.com if None)
+        :type base_url: str
+        :return: None
+        """
+        self.symbol = symbol
+        self.interval = interval
+        self.workers = workers if workers is not None else os.cpu_count() or 1
+        self.refresh_interval = refresh_interval
+        self.loader = loader
+        self.mode = mode
+        self.base_url = base_url
+        self.processes = [None] * self.workers
+        self.queues = [None] * self.workers
+        self.assigned = {}  # username -> (worker_id, credentials)
+
+    def _start_worker(self, worker_id: int):
+        self.queues[worker_id] = Queue()
+        # every worker serves its own metrics
+        self.processes[worker_id] = Process(target=run_with_metrics, name=f'accounts-worker-{worker_id}',
+                                            args=[METRICS_PORT + worker_id, run_worker, worker_id,
+                                                  self.queues[worker_id], self.symbol, self.interval, self.mode,
+                                                  self.base_url])
+        self.processes[worker_id].start()
+
+    def _least_loaded(self):
+        load = [0] * self.workers
+        for worker_id, credentials in self.assigned.values():
+            load[worker_id] += 1
+        return load.index(min(load))
+
+    def _add(self, username: str, credentials: tuple):
+        worker_id = self._least_loaded()
+        self.assigned[username] = (worker_id, credentials)
+        self.queues[worker_id].put(('add', username) + tuple(credentials))
+        log_info.info(f"account {username} assigned to worker {worker_id}")
+
+    def _remove(self, username: str):
+        worker_id, credentials = self.assigned.pop(username)
+        self.queues[worker_id].put(('remove', username))
+        log_info.info(f"account {username} removed from worker {worker_id}")
+
+    def sync(self, accounts: dict):
+        """
+        Function starting new accounts and stopping removed ones, changed credentials restart the account
+        :param accounts: username -> (api_key, api_secret, proxy)
+        :type accounts: dict
+        :return: None
+        """
+        for username in list(self.assigned):
+            if accounts.get(username) != self.assigned[username][1]:
+                self._remove(username)
+        for username, credentials in accounts.items():
+            if username not in self.assigned:
+                self._add(username, credentials)
+
+    def check_workers(self):
+        """
+        Function restarting dead workers with their accounts
+        :return: None
+        """
+        for worker_id, process in enumerate(self.processes):
+            if process.is_alive():
+                continue
+            log_error.error(f"accounts worker {worker_id} exited with {process.exitcode}, restarting it")
+            self._start_worker(worker_id)
+            for username, (assigned_id, credentials) in self.assigned.items():
+                if assigned_id == worker_id:
+                    self.queues[worker_id].put(('add', username) + tuple(credentials))
+
+    def run(self):
+        """
+        Function running the accounts until interrupted
+        :return: None
+        """
+        for worker_id in range(self.workers):
+            self._start_worker(worker_id)
+        try:
+            while True:
+                try:
+                    self.sync(self.loader())
+                except Exception as exc:
+                    # running accounts are kept while the table is unreachable
+                    log_error.error(exc)
+                deadline = time.monotonic() + self.refresh_interval
+                while time.monotonic() < deadline:
+                    time.sleep(min(1, max(deadline - time.monotonic(), 0)))
+                    self.check_workers()
+        finally:
+            self.stop()
+
+    def stop(self, timeout: float = ACCOUNTS_STOP_TIMEOUT):
+        """
+        Function stopping every worker, open orders and positions are left on the exchange
+        :param timeout: seconds given to every worker
+        :type timeout: float
+        :return: None
+        """
+        for queue in self.queues:
+            if queue is not None:
+                queue.put(None)
+        for process in self.processes:
+            if process is None:
+                continue
+            process.join(timeout + 1)
+            if process.is_alive():
+                process.terminate()
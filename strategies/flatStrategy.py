@@ -1,12 +1,18 @@
 from bots.bots import *
-from configs.config import key_coinMarket
+from bots.metrics import run_with_metrics
+from db.tradeJournal import TradeJournal
+from configs.config import key_coinMarket, MODE
 import multiprocessing
 
 
-def runFlatStrategy(api_key, api_secret, proxy, symbol, interval):
+def runFlatStrategy(api_key, api_secret, proxy, symbol, interval, account=JOURNAL_ACCOUNT):
     limits_info = [(2, 100), (4, 300)]
-    botTrader = FlatBotTrader(api_key, api_secret, symbol, proxy, 60, limits_info) # create trader bot
-    procLong = multiprocessing.Process(target=botTrader.work_long)
-    procShort = multiprocessing.Process(target=botTrader.work_short)
+    botTrader = FlatBotTrader(api_key, api_secret, MODE, symbol, proxy, 60, limits_info) # create trader bot
+    botTrader.journal = TradeJournal()
+    botTrader.account = account
+    procLong = multiprocessing.Process(target=run_with_metrics, name='work_long',
+                                       args=[METRICS_PORT, botTrader.work_long])
+    procShort = multiprocessing.Process(target=run_with_metrics, name='work_short',
+                                        args=[METRICS_PORT + 1, botTrader.work_short])
     procLong.start()
     procShort.start()
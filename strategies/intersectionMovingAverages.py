@@ -56,10 +56,10 @@ def stopTrading():
 
 
 def runIntersectionStrategy(api_key, api_secret, proxy, symbol, interval):
-    botTrader = FlatBotTrader(api_key, api_secret, symbol, proxy, 60, LIMITS_INFO) # create trader bot=
-    procLong = multiprocessing.Process(target=FlatBotTrader.work_long)
-    procShort = multiprocessing.Process(target=FlatBotTrader.work_short)
-    bot_analyst = botAnalyst(api_key, api_secret, symbol, interval, proxy) # create market analyst bot 
+    botTrader = FlatBotTrader(api_key, api_secret, MODE, symbol, proxy, 60, LIMITS_INFO) # create trader bot=
+    procLong = multiprocessing.Process(target=FlatBotTrader.work_long, name='work_long')
+    procShort = multiprocessing.Process(target=FlatBotTrader.work_short, name='work_short')
+    bot_analyst = BotAnalyst(api_key, api_secret, MODE, symbol, interval, proxy) # create market analyst bot 
     ma, ema = bot_analyst.getCurrentMaEma() # take current values
     direction = None
     solution_trade = False
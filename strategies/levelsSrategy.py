@@ -1,111 +1,115 @@
 from bots.bots import *
+from bots.levelIndex import LevelIndex, ChangeListener
+from bots.levelBook import create_level_book
+from bots.orderGateway import OrderGateway
+from bots.metrics import LoopTimer, InstrumentedRedis, run_with_metrics
+from bots.settings import METRICS_PORT, PROCESS_CHECK_INTERVAL, JOURNAL_ACCOUNT
+from db.tradeJournal import TradeJournal
 from configs.config import host_redis, port_redis, TAKE_PROFIT, STOP_LOSS, MAX_COUNT_LIMIT_ORDERS, DANGEROUS_AREA, SUPERIORITY, MODE
 import redis
-from json import loads
 from math import floor
 from multiprocessing import Process
 import logging
 
-REDIS_CON = redis.Redis(host=host_redis, port=port_redis, db=0)
+REDIS_CON = InstrumentedRedis(redis.Redis(host=host_redis, port=port_redis, db=0))
+LEVEL_INDEX = LevelIndex(REDIS_CON)
+LEVEL_BOOKS = {}
 
 log_debug = logging.getLogger('bots_debug')
 log_info = logging.getLogger('bots_info')
 log_error = logging.getLogger('bots_error')
 
-file_handler_debug = logging.FileHandler(filename='logs/strategy_levels.log')
-file_handler_debug.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s', datefmt='%d-%m-%Y %H:%M'))
-file_handler_debug.setLevel(logging.DEBUG)
-log_debug.addHandler(file_handler_debug)
-log_debug.setLevel(logging.DEBUG)
-
-file_handler_info = logging.FileHandler(filename='logs/strategy_levels.log')
-file_handler_info.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s', datefmt='%d-%m-%Y %H:%M'))
-file_handler_info.setLevel(logging.INFO)
-log_info.addHandler(file_handler_info)
-log_info.setLevel(logging.INFO)
-
-file_handler_error = logging.FileHandler(filename='logs/strategy_levels.log')
-file_handler_error.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s', datefmt='%d-%m-%Y %H:%M'))
-file_handler_error.setLevel(logging.ERROR)
-log_error.addHandler(file_handler_error)
-log_error.setLevel(logging.ERROR)
+def get_last_value():
+    try:
+        last_value, last_value_ts = REDIS_CON.mget("last_value", "last_value_ts")
+        if last_value is None:
+            return None
+        return float(last_value), float(last_value_ts) if last_value_ts is not None else None
+    except Exception as exc:
+        log_error.error(exc)
+        return None
 
 def get_support_level():
-    levels = loads(REDIS_CON.get("levels"))
-    last_value = REDIS_CON.get("last_value")
-    support_level = [value for index, value in levels if value < float(last_value)]
-    support_level.sort(reverse=True)
-    return support_level
+    return LEVEL_INDEX.get_support()
 
 def get_resistance_level():
-    levels = loads(REDIS_CON.get("levels"))
-    last_value = REDIS_CON.get("last_value")
-    resistance_level = [value for index, value in levels if value > float(last_value)]
-    resistance_level.sort(reverse=False)
-    return resistance_level
+    return LEVEL_INDEX.get_resistance()
+
+def get_level_book(symbol):
+    book = LEVEL_BOOKS.get(symbol)
+    if book is None:
+        book = create_level_book(symbol)
+        LEVEL_BOOKS[symbol] = book
+    return book
 
 def define_level(bot_trader, direction):
-    new_limit_orders_price = []
-    del_limit_orders_id = []
+    book = get_level_book(bot_trader.symbol)
+    try:
+        last_value, support_level, resistance_level = LEVEL_INDEX.get_levels()
+    except ValueError as exc:
+        # no price in redis, nothing is placed or deleted until the market data daemon writes one
+        log_error.error(exc)
+        return [], []
+    book.update(support_level + resistance_level)
     if direction == "Buy":
-        levels = get_support_level()
+        levels = book.below(last_value)
     else:
-        levels = get_resistance_level()
+        levels = book.above(last_value)
     open_limit_orders = bot_trader.get_info_open_limit_orders(direction, False)
-    prices_current_limit_orders = [info[1] for info in open_limit_orders]
     count_open_limit_orders = len(open_limit_orders)
-    for level in levels:
-        if level not in prices_current_limit_orders:
-            new_limit_orders_price.append(level)
-    for iD, price, qty in open_limit_orders:
-        if price not in levels:
-            del_limit_orders_id.append(iD)
+    new_limit_orders_ticks, del_limit_orders_id = book.diff(levels, open_limit_orders)
     if count_open_limit_orders >= 3:
-        new_limit_orders_price = []
-    elif count_open_limit_orders == 0 and len(new_limit_orders_price) < 2:
-        new_limit_orders_price = []
-    if direction == "Buy":
-        new_limit_orders_price.sort(reverse=True)
-    else:
-        new_limit_orders_price.sort(reverse=False)
+        new_limit_orders_ticks = []
+    elif count_open_limit_orders == 0 and len(new_limit_orders_ticks) < 2:
+        new_limit_orders_ticks = []
     needed_count_orders = MAX_COUNT_LIMIT_ORDERS - count_open_limit_orders
-    if len(new_limit_orders_price) >= needed_count_orders:
-        new_limit_orders_price = new_limit_orders_price[0:needed_count_orders]
-    return new_limit_orders_price, del_limit_orders_id 
+    if len(new_limit_orders_ticks) >= needed_count_orders:
+        new_limit_orders_ticks = new_limit_orders_ticks[0:needed_count_orders]
+    new_limit_orders_price = [book.to_price(ticks) for ticks in new_limit_orders_ticks]
+    return new_limit_orders_price, del_limit_orders_id
 
-def watch_out_danger_long(bot_trader):
+def watch_out_danger_long(bot_trader, listener=None):
+    if listener is None:
+        listener = ChangeListener(REDIS_CON)
+    loop_timer = LoopTimer('watch_out_danger_long')
     while True:
-        open_limit_orders = bot_trader.get_info_open_limit_orders('Buy', False)
-        if len(open_limit_orders) > 0:
-            open_limit_orders = sorted(open_limit_orders, key=lambda x:x[1])
-            first_limit_order = open_limit_orders[-1][1]
-            last_value = float(REDIS_CON.get("last_value"))
-            superiority_sell = float(REDIS_CON.get("superiority_sell"))
-            dif_price = last_value - first_limit_order
-            if dif_price <= DANGEROUS_AREA and superiority_sell > SUPERIORITY:
-                bot_trader.del_limit_order("Buy", False, [open_limit_orders[-1][0]])
-                log_info.info("bot deleted long open limit order with id = " + open_limit_orders[-1][0])
-        time.sleep(0.5)
-
-
-def watch_out_danger_short(bot_trader):
+        last_value, superiority_sell = REDIS_CON.mget("last_value", "superiority_sell")
+        # the keys expire with a dead daemon and are deleted while its book is out of sync
+        if last_value is not None and superiority_sell is not None and float(superiority_sell) > SUPERIORITY:
+            open_limit_orders = bot_trader.get_info_open_limit_orders('Buy', False)
+            if len(open_limit_orders) > 0:
+                open_limit_orders = sorted(open_limit_orders, key=lambda x:x[1])
+                first_limit_order = open_limit_orders[-1][1]
+                dif_price = float(last_value) - first_limit_order
+                if dif_price <= DANGEROUS_AREA:
+                    bot_trader.del_limit_order("Buy", False, [open_limit_orders[-1][0]])
+                    log_info.info("bot deleted long open limit order with id = " + open_limit_orders[-1][0])
+        loop_timer.wait(listener.wait, 0.5)
+
+
+def watch_out_danger_short(bot_trader, listener=None):
+    if listener is None:
+        listener = ChangeListener(REDIS_CON)
+    loop_timer = LoopTimer('watch_out_danger_short')
     while True:
-        open_limit_orders = bot_trader.get_info_open_limit_orders('Sell', False)
-        if len(open_limit_orders) > 0:
-            open_limit_orders = sorted(open_limit_orders, key=lambda x:x[1])
-            first_limit_order = open_limit_orders[0][1]
-            last_value = float(REDIS_CON.get("last_value"))
-            superiority_buy = float(REDIS_CON.get("superiority_buy"))
-            dif_price = first_limit_order - last_value
-            if dif_price <= DANGEROUS_AREA and superiority_buy > SUPERIORITY:
-                bot_trader.del_limit_order("Sell", False, [open_limit_orders[0][0]])
-                log_info.info("bot deleted short open limit order with id = " + open_limit_orders[0][0])
-        time.sleep(0.5)
+        last_value, superiority_buy = REDIS_CON.mget("last_value", "superiority_buy")
+        if last_value is not None and superiority_buy is not None and float(superiority_buy) > SUPERIORITY:
+            open_limit_orders = bot_trader.get_info_open_limit_orders('Sell', False)
+            if len(open_limit_orders) > 0:
+                open_limit_orders = sorted(open_limit_orders, key=lambda x:x[1])
+                first_limit_order = open_limit_orders[0][1]
+                dif_price = first_limit_order - float(last_value)
+                if dif_price <= DANGEROUS_AREA:
+                    bot_trader.del_limit_order("Sell", False, [open_limit_orders[0][0]])
+                    log_info.info("bot deleted short open limit order with id = " + open_limit_orders[0][0])
+        loop_timer.wait(listener.wait, 0.5)
 
 
 
 def trade_long(bot_trader):
     log_info.info("bot started working in long!!!")
+    bot_trader.start_stream()
+    waiting_timer = LoopTimer('trade_long_waiting')
     while True:
         market_qty = bot_trader.get_market_qty(direction = 'long', reduce_only = False)
         while market_qty == 0:
@@ -118,7 +122,7 @@ def trade_long(bot_trader):
             if len(del_limit_orders_id) > 0:
                 bot_trader.del_limit_order("Buy", False, del_limit_orders_id)
             market_qty = bot_trader.get_market_qty(direction = 'long', reduce_only = False)
-            time.sleep(0.5)
+            waiting_timer.wait(bot_trader.wait_for_update, 0.5)
         else:
             log_info.info("bot entered the trade in long!!!")
             entry_price = floor(bot_trader.get_market_entry_price('long'))
@@ -126,15 +130,17 @@ def trade_long(bot_trader):
             bot_trader.post_limit_order(percent_limit = 100, limit_price = take_profit_value,
                                     direction = 'short',
                                     reduce_only = True)
+            waiting_timer.reacted('trade_long', 'entry')
             last_limit_order = bot_trader.get_price_last_draw_limit_order("Buy", False)
             bot_trader.stop_price_long = last_limit_order - STOP_LOSS
             bot_trader.put_stop_loss(stop_loss = bot_trader.stop_price_long, side = 'Buy')
             market_qty = bot_trader.get_market_qty(direction='long', reduce_only = False)
             qty_limit_orders_start = bot_trader.get_qty_limits_order('Buy')
             log_info.info("bot arranged extras and stop losses in long!!!")
+            position_timer = LoopTimer('trade_long_position')
             while market_qty != 0:
                 try:
-                    time.sleep(0.5)
+                    position_timer.wait(bot_trader.wait_for_update, 1.5)
                     qty_limit_orders = bot_trader.get_qty_limits_order('Buy')
                     if qty_limit_orders is not None:
                         if qty_limit_orders_start > qty_limit_orders:
@@ -146,8 +152,8 @@ def trade_long(bot_trader):
                                                     limit_price = take_profit_value,
                                                     direction = 'short',
                                                     reduce_only = True)
+                            position_timer.reacted('trade_long', 'extra')
                             log_info.info("bot collected an additional long!!!")
-                    time.sleep(1)
                     market_qty = bot_trader.get_market_qty(direction='long', reduce_only = False)
                     try:
                         take_qty = bot_trader.get_info_open_limit_orders(direction='Sell', reduce_only = True)[0][2]
@@ -161,6 +167,7 @@ def trade_long(bot_trader):
                                                 limit_price = take_profit_value,
                                                 direction = 'short',
                                                 reduce_only = True)
+                        position_timer.reacted('trade_long', 'resize')
                 except Exception as exc:
                     log_error.error(exc)
                     time.sleep(1)
@@ -171,6 +178,8 @@ def trade_long(bot_trader):
 
 def trade_short(bot_trader):
     log_info.info("bot started working in short!!!")
+    bot_trader.start_stream()
+    waiting_timer = LoopTimer('trade_short_waiting')
     while True:
         market_qty = bot_trader.get_market_qty(direction='short', reduce_only = False)
         while market_qty == 0:
@@ -183,7 +192,7 @@ def trade_short(bot_trader):
             if len(del_limit_orders_id) > 0:
                 bot_trader.del_limit_order("Sell", False, del_limit_orders_id)
             market_qty = bot_trader.get_market_qty(direction = 'short', reduce_only = False)
-            time.sleep(0.5)
+            waiting_timer.wait(bot_trader.wait_for_update, 0.5)
         else:
             log_info.info("bot entered the trade in short!!!")
             entry_price = floor(bot_trader.get_market_entry_price('short'))
@@ -191,15 +200,17 @@ def trade_short(bot_trader):
             bot_trader.post_limit_order(percent_limit = 100, limit_price = take_profit_value,
                                     direction = 'long',
                                     reduce_only = True)
+            waiting_timer.reacted('trade_short', 'entry')
             last_limit_order = bot_trader.get_price_last_draw_limit_order("Sell", False)
             bot_trader.stop_price_long = last_limit_order + STOP_LOSS
             bot_trader.put_stop_loss(stop_loss = bot_trader.stop_price_long, side = 'Sell')
             market_qty = bot_trader.get_market_qty(direction='short', reduce_only = False)
             qty_limit_orders_start = bot_trader.get_qty_limits_order('Sell')
             log_info.info("bot arranged extras and stop losses in short!!!")
+            position_timer = LoopTimer('trade_short_position')
             while market_qty != 0:
                 try:
-                    time.sleep(0.5)
+                    position_timer.wait(bot_trader.wait_for_update, 1.5)
                     qty_limit_orders = bot_trader.get_qty_limits_order('Sell')
                     if qty_limit_orders is not None:
                         if qty_limit_orders_start > qty_limit_orders:
@@ -211,8 +222,8 @@ def trade_short(bot_trader):
                                                     limit_price = take_profit_value,
                                                     direction = 'long',
                                                     reduce_only = True)
+                            position_timer.reacted('trade_short', 'extra')
                             log_info.info("bot collected an additional short!!!")
-                    time.sleep(1)
                     market_qty = bot_trader.get_market_qty(direction='short', reduce_only = False)
                     try:
                         list_take = bot_trader.get_info_open_limit_orders(direction='Buy', reduce_only = True)[0][2]
@@ -226,6 +237,7 @@ def trade_short(bot_trader):
                                                 limit_price = take_profit_value,
                                                 direction = 'long',
                                                 reduce_only = True)
+                        position_timer.reacted('trade_short', 'resize')
                 except Exception as exc:
                     log_error.error(exc)
                     time.sleep(1)
@@ -234,20 +246,43 @@ def trade_short(bot_trader):
             log_info.info("bot came out of short!!!")
   
 
-def runStretagy(api_key, api_secret, symbol, proxy, interval):
-    bot_trader = BotTrader(api_key, api_secret, MODE, symbol, proxy, interval)
-
-    process_long = Process(target=trade_long, args=[bot_trader])
-    process_short = Process(target=trade_short, args=[bot_trader])
-
-    process_watcher_danger_long = Process(target=watch_out_danger_long, args=[bot_trader])
-    process_watcher_danger_short = Process(target=watch_out_danger_short, args=[bot_trader])
+def start_process(name, port, target, *args):
+    process = Process(target=run_with_metrics, name=name, args=[port, target, *args])
+    process.start()
+    return process
 
-    process_long.start()
-    process_short.start()
-    process_watcher_danger_long.start()
-    process_watcher_danger_short.start()
 
-    
+def start_processes(bot_trader):
+    gateway = OrderGateway(bot_trader)
+    # every process serves its own metrics, the gateway (requests) on METRICS_PORT, the workers on the next ports.
+    # The clients are connected before any process starts
+    specs = {'gateway': (METRICS_PORT, gateway.serve),
+             'trade_long': (METRICS_PORT + 1, trade_long, gateway.connect()),
+             'trade_short': (METRICS_PORT + 2, trade_short, gateway.connect()),
+             'watch_out_danger_long': (METRICS_PORT + 3, watch_out_danger_long, gateway.connect()),
+             'watch_out_danger_short': (METRICS_PORT + 4, watch_out_danger_short, gateway.connect())}
+    return specs, {name: start_process(name, *spec) for name, spec in specs.items()}
 
 
+def runStretagy(api_key, api_secret, symbol, proxy, interval, account=JOURNAL_ACCOUNT):
+    bot_trader = BotTrader(api_key, api_secret, MODE, symbol, proxy, interval)
+    bot_trader.account = account
+    bot_trader.prices.price_source = get_last_value
+    bot_trader.journal = TradeJournal()  # written by the gateway process, where the orders are sent
+    specs, processes = start_processes(bot_trader)
+    while True:
+        time.sleep(PROCESS_CHECK_INTERVAL)
+        exited = {name: process.exitcode for name, process in processes.items() if not process.is_alive()}
+        if len(exited) == 0:
+            continue
+        log_error.error(f"processes exited {exited}, restarting them")
+        if 'gateway' in exited or any(exitcode < 0 for exitcode in exited.values()):
+            # a killed process may hold the lock of a gateway queue, the group is started again with new queues
+            for process in processes.values():
+                process.terminate()
+            for process in processes.values():
+                process.join()
+            specs, processes = start_processes(bot_trader)
+        else:
+            for name in exited:
+                processes[name] = start_process(name, *specs[name])
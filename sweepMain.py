@@ -0,0 +1,43 @@
+import argparse
+import json
+from backtesting.events import MarketEvents
+from backtesting.sweep import grid, random_samples, run_sweep
+from bots.settings import BACKTEST_BALANCE, BACKTEST_QUEUE_VOLUME, SWEEP_WORKERS, SWEEP_LEVELS_SPACE, SWEEP_FLAT_SPACE
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Backtest a grid or random samples of strategy params on all cores')
+    parser.add_argument('path', help='trades csv (bybit public trading archive), klines csv or market archive '
+                                         'directory')
+    parser.add_argument('--out', required=True, help='directory of results.jsonl, a rerun resumes the sweep')
+    parser.add_argument('--fresh', action='store_true', help='drop the results in --out instead of resuming')
+    parser.add_argument('--strategy', choices=['levels', 'flat'], default='levels')
+    parser.add_argument('--symbol', default='BTCUSDT')
+    parser.add_argument('--klines', type=float, default=None, help='candle length (seconds) of a klines csv')
+    parser.add_argument('--interval', default=None, help='kline interval of a market archive (trades if omitted)')
+    parser.add_argument('--start', type=float, default=None, help='first time (seconds) of a market archive')
+    parser.add_argument('--end', type=float, default=None, help='last time (seconds, excluded) of a market archive')
+    parser.add_argument('--levels', default='', help='comma separated level prices (levels strategy)')
+    parser.add_argument('--space', default=None,
+                        help='json param -> values (or {"low": x, "high": y} with --samples), settings if omitted')
+    parser.add_argument('--samples', type=int, default=None, help='random samples instead of the full grid')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=SWEEP_WORKERS)
+    parser.add_argument('--balance', type=float, default=BACKTEST_BALANCE)
+    parser.add_argument('--queue', type=float, default=BACKTEST_QUEUE_VOLUME, help='contracts ahead of a new order')
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+
+    if args.space is not None:
+        space = json.loads(args.space)
+    else:
+        space = SWEEP_LEVELS_SPACE if args.strategy == 'levels' else SWEEP_FLAT_SPACE
+    params_list = grid(space) if args.samples is None else random_samples(space, args.samples, args.seed)
+    events = MarketEvents.load(args.path, args.klines, args.symbol, args.interval, args.start, args.end)
+    levels = [float(price) for price in args.levels.split(',') if price]
+    try:
+        ranked = run_sweep(events, params_list, args.out, args.strategy, args.symbol, levels, args.balance,
+                           args.queue, args.workers, args.fresh)
+    except ValueError as exc:
+        parser.error(str(exc))
+    print(json.dumps(ranked[:args.top], indent=2))
@@ -0,0 +1,14 @@
+import pytest
+from bots.logQueue import setup_logging
+
+
+@pytest.fixture(autouse=True, scope='session')
+def log_dir(tmp_path_factory):
+    # bots.bots sets logging up on import, the records of the tests go to a temporary directory, not LOG_DIR
+    handler = setup_logging()
+    handler.stop()
+    directory = handler.directory
+    handler.directory = str(tmp_path_factory.mktemp('logs'))
+    yield handler.directory
+    handler.stop()
+    handler.directory = directory
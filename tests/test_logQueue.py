@@ -0,0 +1,59 @@
+import logging
+import multiprocessing
+import pytest
+from bots.logQueue import ProcessQueueHandler, setup_logging
+
+
+def _log_in_child(handler: ProcessQueueHandler, message: str, count: int):
+    logger = logging.getLogger('test_log_queue_child')
+    logger.addHandler(handler)
+    for _ in range(count):
+        logger.error(message)
+    # no stop, the records still queued are written when the process exits
+
+
+def _log_and_crash(handler: ProcessQueueHandler, count: int):
+    _log_in_child(handler, 'before crash', count)
+    raise RuntimeError('worker crashed')
+
+
+@pytest.fixture
+def fork():
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        pytest.skip('fork start method is not available')
+    return multiprocessing.get_context('fork')
+
+
+def test_child_files_are_named_by_process_name(tmp_path, fork):
+    handler = ProcessQueueHandler('strategy', directory=str(tmp_path))
+    for attempt in range(2):
+        # a restarted process gets the name of its spec again and appends to the same file
+        process = fork.Process(target=_log_in_child, name='trade_long',
+                               args=[handler, f'attempt {attempt}', 2000])
+        process.start()
+        process.join(10)
+        assert process.exitcode == 0
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['strategy.trade_long.log']
+    lines = (tmp_path / 'strategy.trade_long.log').read_text().splitlines()
+    assert [line.split(' ', 3)[-1] for line in lines] == ['attempt 0'] * 2000 + ['attempt 1'] * 2000
+
+
+def test_crashed_child_writes_its_queued_records(tmp_path, fork):
+    handler = ProcessQueueHandler('strategy', directory=str(tmp_path))
+    process = fork.Process(target=_log_and_crash, name='trade_short', args=[handler, 2000])
+    process.start()
+    process.join(10)
+    assert process.exitcode == 1
+    assert len((tmp_path / 'strategy.trade_short.log').read_text().splitlines()) == 2000
+
+
+def test_main_process_writes_the_file_of_the_name(tmp_path):
+    handler = ProcessQueueHandler('strategy', directory=str(tmp_path))
+    assert handler.get_path() == str(tmp_path / 'strategy.log')
+
+
+def test_setup_logging_keeps_one_file_name():
+    handler = setup_logging()
+    assert setup_logging() is handler
+    with pytest.raises(ValueError):
+        setup_logging('other')
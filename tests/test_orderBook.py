@@ -0,0 +1,166 @@
+import random
+import pytest
+from bots.marketData import MarketDataDaemon
+from bots.orderBook import OrderBook, PriceLadder
+
+
+def level(price: float, side: str, size: float = None):
+    info = {'price': str(price), 'side': side}
+    if size is not None:
+        info['size'] = size
+    return info
+
+
+class BruteBook:
+    """
+    Reference book summing the levels one by one
+    """
+
+    def __init__(self, tick_size: float):
+        self.tick_size = tick_size
+        self.levels = {}  # (side, ticks) -> size
+
+    def set(self, price: float, side: str, size: float):
+        key = (side, int(round(price / self.tick_size)))
+        if size == 0:
+            self.levels.pop(key, None)
+        else:
+            self.levels[key] = size
+
+    def best(self, side: str):
+        ticks = [tick for level_side, tick in self.levels if level_side == side]
+        if len(ticks) == 0:
+            return None
+        return max(ticks) if side == 'Buy' else min(ticks)
+
+    def band_volumes(self, ticks: int = None):
+        volumes = []
+        for side in ('Buy', 'Sell'):
+            best = self.best(side)
+            volume = 0.0
+            for (level_side, tick), size in self.levels.items():
+                if level_side != side:
+                    continue
+                if ticks is None or (best - ticks < tick <= best if side == 'Buy' else best <= tick < best + ticks):
+                    volume += size
+            volumes.append(volume)
+        return tuple(volumes)
+
+
+def test_ladder_range_sums_match_brute_force():
+    rng = random.Random(7)
+    ladder = PriceLadder(64)
+    sizes = [0.0] * 64
+    for _ in range(2000):
+        index = rng.randrange(64)
+        size = rng.choice([0.0, round(rng.uniform(0.1, 10), 3)])
+        ladder.set(index, size)
+        sizes[index] = size
+        start, stop = sorted(rng.sample(range(65), 2))
+        assert ladder.range_sum(start, stop) == pytest.approx(sum(sizes[start:stop]))
+    assert ladder.total == pytest.approx(sum(sizes))
+    assert ladder.levels == sum(1 for size in sizes if size != 0)
+    tree = list(ladder.tree)
+    ladder.rebuild()
+    assert ladder.tree == pytest.approx(tree)
+
+
+def test_band_volumes_match_brute_force_with_recenters():
+    rng = random.Random(11)
+    book = OrderBook(tick_size=0.5, capacity=16, resync=50)
+    brute = BruteBook(0.5)
+    mid = 20000.0
+    snapshot = [level(mid - 0.5 * tick, 'Buy', 1.0) for tick in range(1, 4)] + \
+               [level(mid + 0.5 * tick, 'Sell', 2.0) for tick in range(1, 4)]
+    book.apply_snapshot(snapshot, 1)
+    for info in snapshot:
+        brute.set(float(info['price']), info['side'], info['size'])
+    seq = 1
+    for _ in range(500):
+        # the mid drifts far beyond the 16 ticks of the ladders, they are recentered and grown
+        mid += 0.5 * rng.randint(-3, 3)
+        side = rng.choice(['Buy', 'Sell'])
+        price = mid - 0.5 * rng.randint(1, 40) if side == 'Buy' else mid + 0.5 * rng.randint(1, 40)
+        key = (side, int(round(price / 0.5)))
+        seq += 1
+        if key in brute.levels and rng.random() < 0.4:
+            assert book.apply_delta([level(price, side)], [], [], seq)
+            brute.set(price, side, 0)
+        elif key in brute.levels:
+            size = round(rng.uniform(0.1, 5), 3)
+            assert book.apply_delta([], [level(price, side, size)], [], seq)
+            brute.set(price, side, size)
+        else:
+            size = round(rng.uniform(0.1, 5), 3)
+            assert book.apply_delta([], [], [level(price, side, size)], seq)
+            brute.set(price, side, size)
+        best_bid, best_ask = brute.best('Buy'), brute.best('Sell')
+        assert book.get_best() == (None if best_bid is None else best_bid * 0.5,
+                                   None if best_ask is None else best_ask * 0.5)
+        for ticks in (None, 1, 5, 25):
+            assert book.band_volumes(ticks) == pytest.approx(brute.band_volumes(ticks))
+    assert book.capacity > 16
+
+
+def test_recenter_keeps_levels_and_grows_for_wide_book():
+    book = OrderBook(tick_size=1, capacity=8)
+    book.apply_snapshot([level(100, 'Buy', 1.0), level(101, 'Sell', 2.0)], 1)
+    assert book.capacity == 8
+    # far outside of the ladder, the levels are moved and the ladder doubled until both ends fit
+    assert book.apply_delta([], [], [level(130, 'Sell', 3.0)], 2)
+    assert book.capacity >= 64
+    assert book.get_best() == (100, 101)
+    assert book.band_volumes() == (1.0, 5.0)
+    assert book.band_volumes(30) == (1.0, 5.0)
+    assert book.band_volumes(29) == (1.0, 2.0)
+    assert book.apply_delta([level(101, 'Sell')], [], [], 3)
+    assert book.get_best() == (100, 130)
+
+
+def test_wide_snapshot_grows_the_ladder():
+    book = OrderBook(tick_size=1, capacity=8)
+    book.apply_snapshot([level(10, 'Buy', 1.0), level(1000, 'Sell', 1.0)], 1)
+    assert book.capacity >= 2 * 990
+    assert book.get_best() == (10, 1000)
+    assert book.imbalance() == 0
+
+
+def test_sequence_gap_invalidates_until_snapshot():
+    book = OrderBook(tick_size=1, capacity=64)
+    book.apply_snapshot([level(100, 'Buy', 1.0), level(101, 'Sell', 1.0)], 10)
+    assert book.apply_delta([], [level(100, 'Buy', 2.0)], [], 11)
+    assert book.apply_delta([], [level(100, 'Buy', 3.0)], [], 11) is False
+    assert not book.ready
+    assert book.gaps == 1
+    assert 'sequence 11 after 11' in book.gap_reason
+    # nothing is applied until a snapshot
+    assert book.apply_delta([], [], [level(99, 'Buy', 1.0)], 12) is False
+    book.apply_snapshot([level(100, 'Buy', 4.0), level(101, 'Sell', 1.0)], 20)
+    assert book.ready
+    assert book.gap_reason is None
+    assert book.band_volumes() == (4.0, 1.0)
+
+
+@pytest.mark.parametrize('delete, update', [([level(50, 'Buy')], []), ([], [level(50, 'Sell', 1.0)])])
+def test_missing_level_is_a_gap(delete, update):
+    book = OrderBook(tick_size=1, capacity=64)
+    book.apply_snapshot([level(100, 'Buy', 1.0), level(101, 'Sell', 1.0)], 1)
+    assert book.apply_delta(delete, update, [], 2) is False
+    assert not book.ready
+    assert 'is not in the book' in book.gap_reason
+
+
+def test_daemon_drops_book_values_on_gap():
+    daemon = MarketDataDaemon('BTCUSDT', 'api-testnet', None, url='ws://127.0.0.1:1/realtime_public')
+    topic = daemon.book_topic
+    snapshot = [level(16500, 'Buy', 1.0), level(16500.5, 'Sell', 3.0)]
+    daemon._on_message(topic, {'type': 'snapshot', 'cross_seq': 1, 'data': {'order_book': snapshot}})
+    daemon._on_message(daemon.trade_topic, {'data': [{'price': '16500.5'}]})
+    values = daemon.get_values()
+    assert values['imbalance_5'] == -0.5
+    assert values['superiority_sell'] == 3.0
+    with pytest.raises(ConnectionError):
+        daemon._on_message(topic, {'type': 'delta', 'cross_seq': 1,
+                                   'data': {'delete': [], 'update': [level(16500, 'Buy', 2.0)], 'insert': []}})
+    # the price stays, the keys of the out of sync book are not published
+    assert set(daemon.get_values()) == {'last_value', 'last_value_ts'}
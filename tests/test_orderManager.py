@@ -0,0 +1,207 @@
+import pytest
+from bots.orderManager import OrderManager, ORDER_PENDING_NEW, ORDER_OPEN, ORDER_PENDING_CANCEL, ORDER_DONE
+
+
+class ManualClock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return ManualClock()
+
+
+@pytest.fixture
+def orders(clock):
+    return OrderManager('BTCUSDT', clock=clock, pending_timeout=60, done_ttl=300)
+
+
+def exchange_order(order_id: str, link_id: str, status: str = 'New', price: float = 16500, qty: float = 0.01,
+                   side: str = 'Buy'):
+    return {'order_id': order_id, 'order_link_id': link_id, 'symbol': 'BTCUSDT', 'side': side, 'price': price,
+            'qty': qty, 'order_type': 'Limit', 'order_status': status, 'reduce_only': False}
+
+
+def create_answer(order_id: str, link_id: str, status: str = 'Created', price: float = 16500, qty: float = 0.01):
+    return {'ret_code': 0, 'ret_msg': 'OK', 'result': exchange_order(order_id, link_id, status, price, qty)}
+
+
+def submit(orders: OrderManager, price: float = 16500, qty: float = 0.01):
+    link_id = orders.new_link_id()
+    orders.submitted(link_id, 'Buy', price, qty, False)
+    return link_id
+
+
+def test_create_answer_opens_the_order(orders):
+    link_id = submit(orders)
+    assert orders.get(link_id=link_id).state == ORDER_PENDING_NEW
+    assert orders.open_orders('Buy', False) == []
+    order = orders.created(link_id, create_answer('1', link_id))
+    assert order.state == ORDER_OPEN
+    assert orders.get(order_id='1') is order
+    assert orders.at_price('Buy', 16500, False) == [order]
+
+
+def test_stream_update_before_create_answer_is_kept(orders):
+    link_id = submit(orders)
+    # the order is filled and the stream says so before the create request returns
+    orders.apply_updates([exchange_order('1', link_id, 'Filled')])
+    order = orders.created(link_id, create_answer('1', link_id))
+    assert order.state == ORDER_DONE
+    assert orders.open_orders('Buy', False) == []
+    # a late stream update does not bring a finished order back
+    orders.apply_updates([exchange_order('1', link_id, 'New')])
+    assert orders.get(order_id='1').state == ORDER_DONE
+
+
+def test_stream_partial_fill_before_create_answer_keeps_the_stream_state(orders):
+    link_id = submit(orders)
+    orders.apply_updates([dict(exchange_order('1', link_id, 'PartiallyFilled'), cum_exec_qty=0.004)])
+    order = orders.created(link_id, create_answer('1', link_id))
+    assert order.state == 'partially_filled'
+    assert order.filled == 0.004
+    assert orders.open_orders('Buy', False) == [order]
+
+
+def test_rejected_create_is_done(orders):
+    link_id = submit(orders)
+    assert orders.created(link_id, {'ret_code': 130021, 'ret_msg': 'insufficient balance', 'result': None}) is None
+    assert orders.get(link_id=link_id).state == ORDER_DONE
+
+
+def test_lost_create_answer_found_by_reconcile(orders, clock):
+    link_id = submit(orders)
+    orders.created(link_id, None)
+    assert orders.get(link_id=link_id).state == ORDER_PENDING_NEW
+    clock.advance(1)
+    orders.reconcile([exchange_order('1', link_id)], clock())
+    order = orders.get(order_id='1')
+    assert order is orders.get(link_id=link_id)
+    assert order.state == ORDER_OPEN
+
+
+def test_lost_create_answer_kept_until_pending_timeout(orders, clock):
+    link_id = submit(orders)
+    orders.created(link_id, None)
+    # order/search does not show it yet, the create may still be on its way
+    clock.advance(10)
+    orders.reconcile([], clock())
+    assert orders.get(link_id=link_id).state == ORDER_PENDING_NEW
+    clock.advance(orders.pending_timeout)
+    orders.reconcile([], clock())
+    assert orders.get(link_id=link_id).state == ORDER_DONE
+
+
+def test_failed_cancel_reverts_to_open(orders):
+    link_id = submit(orders)
+    orders.created(link_id, create_answer('1', link_id))
+    orders.cancel_requested(['1'])
+    order = orders.get(order_id='1')
+    assert order.state == ORDER_PENDING_CANCEL
+    assert orders.open_orders('Buy', False) == []
+    orders.cancelled({'1': False})
+    assert order.state == ORDER_OPEN
+    assert orders.open_orders('Buy', False) == [order]
+
+
+def test_cancel_keeps_pending_state_against_stale_stream_update(orders):
+    link_id = submit(orders)
+    orders.created(link_id, create_answer('1', link_id))
+    orders.cancel_requested(['1'])
+    # an update sent before the cancel arrived, the cancel answer decides
+    orders.apply_updates([exchange_order('1', link_id, 'New')])
+    assert orders.get(order_id='1').state == ORDER_PENDING_CANCEL
+    orders.cancelled({'1': True})
+    assert orders.get(order_id='1').state == ORDER_DONE
+
+
+def test_reconcile_skips_orders_changed_after_the_request(orders, clock):
+    first = submit(orders)
+    orders.created(first, create_answer('1', first))
+    clock.advance(1)
+    started = clock()
+    clock.advance(1)
+    # created while the order/search request was on its way, its answer does not show it
+    second = submit(orders, price=16400)
+    orders.created(second, create_answer('2', second, price=16400))
+    orders.reconcile([exchange_order('1', first)], started)
+    assert orders.get(order_id='2').state == ORDER_OPEN
+    assert orders.count('Buy', False) == 2
+
+
+def test_reconcile_keeps_pending_cancel_sent_after_the_request(orders, clock):
+    link_id = submit(orders)
+    orders.created(link_id, create_answer('1', link_id))
+    clock.advance(1)
+    started = clock()
+    clock.advance(1)
+    orders.cancel_requested(['1'])
+    orders.reconcile([exchange_order('1', link_id)], started)
+    assert orders.get(order_id='1').state == ORDER_PENDING_CANCEL
+
+
+def test_reconcile_finishes_orders_missing_from_the_exchange(orders, clock):
+    link_id = submit(orders)
+    orders.created(link_id, create_answer('1', link_id))
+    clock.advance(1)
+    # filled while the stream was down
+    orders.reconcile([exchange_order('7', '', price=16000)], clock())
+    assert orders.get(order_id='1').state == ORDER_DONE
+    outside = orders.get(order_id='7')
+    assert outside.state == ORDER_OPEN
+    assert orders.open_orders('Buy', False) == [outside]
+
+
+def test_finished_orders_are_dropped_after_done_ttl(orders, clock):
+    link_id = submit(orders)
+    orders.created(link_id, create_answer('1', link_id))
+    orders.apply_updates([exchange_order('1', link_id, 'Cancelled')])
+    clock.advance(orders.done_ttl + 1)
+    orders.reconcile([], clock())
+    assert orders.get(order_id='1') is None
+    assert orders.get(link_id=link_id) is None
+
+
+def test_sync_reconciles_only_when_older_than_max_age(orders, clock):
+    fetched = []
+
+    def fetch():
+        fetched.append(clock())
+        return []
+
+    assert orders.sync(fetch, 30) is True
+    clock.advance(10)
+    assert orders.sync(fetch, 30) is False
+    clock.advance(30)
+    assert orders.sync(fetch, 30) is True
+    assert len(fetched) == 2
+    orders.expire()
+    assert orders.sync(fetch, 30) is True
+    assert orders.sync(lambda: None, 0) is False
+
+
+def test_reconcile_reports_fills_missed_by_the_stream(orders, clock):
+    missed = []
+    orders.on_missed = lambda: missed.append(clock())
+    first, second = submit(orders), submit(orders, price=16400)
+    orders.created(first, create_answer('1', first))
+    orders.created(second, create_answer('2', second, price=16400))
+    clock.advance(1)
+    assert orders.reconcile([exchange_order('1', first), exchange_order('2', second, price=16400)], clock()) == 0
+    assert missed == []
+    clock.advance(1)
+    # the first one was partly filled, the second one filled while the stream was down
+    partly = dict(exchange_order('1', first, 'PartiallyFilled'), cum_exec_qty=0.004)
+    assert orders.reconcile([partly], clock()) == 2
+    assert len(missed) == 1
+    clock.advance(1)
+    assert orders.reconcile([partly], clock()) == 0
+    assert len(missed) == 1
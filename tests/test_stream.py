@@ -0,0 +1,155 @@
+import threading
+import time
+import pytest
+from backtesting.fakeBybit import FakeBybitServer
+from backtesting.fakeStream import FakeBybitStream
+from bots.bots import BotTrader
+from bots.settings import FAKE_EXCHANGE_PRICE
+from bots.stream import BybitStream, UpdateNotifier
+
+
+def wait_until(condition, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return condition()
+
+
+@pytest.fixture
+def fake_stream():
+    with FakeBybitStream() as server:
+        yield server
+
+
+@pytest.fixture
+def fake_rest():
+    with FakeBybitServer() as server:
+        yield server
+
+
+def test_notifier_wakes_waiting_thread():
+    notifier = UpdateNotifier()
+    woken = []
+    waiter = threading.Thread(target=lambda: woken.append(notifier.wait(5)))
+    waiter.start()
+    time.sleep(0.05)
+    notifier.notify()
+    waiter.join(1)
+    assert woken == [True]
+
+
+def test_notifier_keeps_an_update_for_a_thread_that_was_not_waiting():
+    notifier = UpdateNotifier()
+    assert notifier.wait(0.01) is False
+    notifier.notify()
+    # the update came while the thread was busy, its next wait returns at once
+    started = time.monotonic()
+    assert notifier.wait(5) is True
+    assert time.monotonic() - started < 1
+    assert notifier.wait(0.01) is False
+
+
+def test_stream_authenticates_subscribes_and_dispatches(fake_stream):
+    messages = []
+    stream = BybitStream(fake_stream.url, ['order', 'position'], lambda topic, message: messages.append(topic),
+                         api_key='test', api_secret='test')
+    stream.start()
+    try:
+        assert fake_stream.wait_for_subscribers(topic='position')
+        assert fake_stream.ops['auth'] == 1
+        assert fake_stream.publish('order', [{'order_id': '1'}]) == 1
+        fake_stream.publish('wallet', [{'available_balance': 1}])
+        assert wait_until(lambda: messages == ['order'])
+    finally:
+        stream.stop()
+
+
+def test_stream_rejected_auth_does_not_subscribe(fake_stream):
+    stream = BybitStream(fake_stream.url, ['order'], lambda topic, message: None, api_key='test',
+                         api_secret='wrong')
+    stream.start()
+    try:
+        assert wait_until(lambda: stream.reconnects >= 1)
+        assert fake_stream.ops['subscribe'] == 0
+        assert not stream.connected
+    finally:
+        stream.stop()
+
+
+def test_stream_pings_and_reconnects_after_lost_heartbeat(fake_stream):
+    connects = []
+    stream = BybitStream(fake_stream.url, ['order'], lambda topic, message: None, lambda: connects.append(1),
+                         api_key='test', api_secret='test', ping_interval=0.2)
+    stream.start()
+    try:
+        assert wait_until(lambda: len(connects) == 1)
+        assert wait_until(lambda: fake_stream.ops['ping'] >= 3)
+        assert stream.reconnects == 0
+        fake_stream.muted = True
+        assert wait_until(lambda: stream.reconnects >= 1)
+        fake_stream.muted = False
+        assert wait_until(lambda: stream.connected and len(connects) >= 2, timeout=10)
+    finally:
+        stream.stop()
+
+
+def test_stream_resubscribes_after_dropped_connection(fake_stream):
+    connects = []
+    stream = BybitStream(fake_stream.url, ['order'], lambda topic, message: None, lambda: connects.append(1),
+                         api_key='test', api_secret='test')
+    stream.start()
+    try:
+        # the subscribe answer is read before on_connect, a drop before it would fail the first connect
+        assert wait_until(lambda: len(connects) == 1)
+        assert fake_stream.drop() == 1
+        assert wait_until(lambda: fake_stream.connections == 2 and fake_stream.subscribers() == 1)
+        assert fake_stream.ops['auth'] == 2
+        assert wait_until(lambda: len(connects) == 2)
+    finally:
+        stream.stop()
+
+
+@pytest.fixture
+def bot_trader(fake_rest, fake_stream):
+    bot_trader = BotTrader('test', 'test', 'api-testnet', 'BTCUSDT', None, 1, base_url=fake_rest.url)
+    bot_trader.start_stream(fake_stream.url)
+    # connected, and the snapshots recovered after it
+    assert wait_until(lambda: bot_trader.orders.reconciles == 1)
+    yield bot_trader
+    bot_trader.stop_stream()
+
+
+def test_bot_recovers_updates_missed_while_disconnected(bot_trader, fake_rest, fake_stream):
+    below = FAKE_EXCHANGE_PRICE - 500
+    bot_trader.post_limit_order(1, below, 'long', False)
+    bot_trader.post_limit_order(1, below - 100, 'long', False)
+    orders = bot_trader.orders.open_orders('Buy', False)
+    assert len(orders) == 2
+    reconciles = bot_trader.orders.reconciles
+
+    fake_stream.drop()
+    # cancelled while the bot does not listen, the stream update of it is lost
+    response = fake_rest.exchange.handle('POST', '/private/linear/order/cancel', {'order_id': orders[0].order_id})
+    assert response['ret_code'] == 0
+
+    assert wait_until(lambda: bot_trader.orders.reconciles > reconciles)
+    assert [order.order_id for order in bot_trader.orders.open_orders('Buy', False)] == [orders[1].order_id]
+    assert bot_trader.snapshots.get('positions', lambda: None, 60) is not None
+
+
+def test_bot_stream_update_wakes_loops(bot_trader, fake_stream):
+    bot_trader.post_limit_order(1, FAKE_EXCHANGE_PRICE - 500, 'long', False)
+    order = bot_trader.orders.open_orders('Buy', False)[0]
+    bot_trader.wait_for_update(0)
+    woken = []
+    waiter = threading.Thread(target=lambda: woken.append(bot_trader.wait_for_update(5)))
+    waiter.start()
+    fake_stream.publish('order', [{'order_id': order.order_id, 'order_link_id': order.link_id,
+                                   'symbol': 'BTCUSDT', 'side': 'Buy', 'price': order.price, 'qty': order.qty,
+                                   'order_type': 'Limit', 'order_status': 'Filled', 'reduce_only': False,
+                                   'cum_exec_qty': order.qty}])
+    waiter.join(5)
+    assert woken == [True]
+    assert bot_trader.orders.open_orders('Buy', False) == []